@@ -1,5 +1,6 @@
 import { createResource } from "frappe-ui"
 import { computed, ref, toRaw } from "vue"
+import { waitForInvoiceSubmission } from "@/utils/invoiceSubmission"
 import { isOffline } from "@/utils/offline"
 
 export function useInvoice() {
@@ -13,6 +14,7 @@ export function useInvoice() {
 	const couponCode = ref(null)
 	const taxRules = ref([]) // Tax rules from POS Profile
 	const taxInclusive = ref(false) // Tax inclusive setting from POS Settings
+	const pendingDraftName = ref(null) // Draft kept by a failed background submission
 
 	// Performance: Incrementally maintained aggregates (updated on add/remove/change)
 	// This avoids O(n) array reductions on every reactive change
@@ -30,8 +32,9 @@ export function useInvoice() {
 		auto: false,
 	})
 
+	// Submits in a background job when enabled in POS Settings, otherwise inline
 	const submitInvoiceResource = createResource({
-		url: "pos_next.api.invoices.submit_invoice",
+		url: "pos_next.api.invoices.submit_invoice_async",
 		makeParams(params) {
 			return {
 				invoice: JSON.stringify(params.invoice),
@@ -629,6 +632,8 @@ export function useInvoice() {
 
 			const invoiceData = {
 				doctype: "Sales Invoice",
+				// Reuse the draft of a failed background submission instead of creating another
+				...(pendingDraftName.value ? { name: pendingDraftName.value } : {}),
 				pos_profile: posProfile.value,
 				posa_pos_opening_shift: posOpeningShift.value,
 				customer: customer.value?.name || customer.value,
@@ -690,7 +695,7 @@ export function useInvoice() {
 			}
 
 			try {
-				const result = await submitInvoiceResource.submit({
+				let result = await submitInvoiceResource.submit({
 					invoice: invoiceDoc,
 					data: submitData,
 				})
@@ -712,6 +717,12 @@ export function useInvoice() {
 					throw detailedError
 				}
 
+				if (result?.status === "queued") {
+					// The draft stays on the server if the job fails, so a retry reuses it
+					pendingDraftName.value = result.name
+					result = await waitForInvoiceSubmission(result)
+				}
+
 				resetInvoice()
 				return result
 			} catch (error) {
@@ -797,6 +808,7 @@ export function useInvoice() {
 	 * If a POS Profile is active and has a default customer, it will be pre-selected.
 	 */
 	function resetInvoice() {
+		pendingDraftName.value = null
 		invoiceItems.value = []
 		payments.value = []
 		additionalDiscount.value = 0
@@ -817,6 +829,7 @@ export function useInvoice() {
 	 * If a POS Profile is active and has a default customer, it will be pre-selected.
 	 */
 	async function clearCart() {
+		pendingDraftName.value = null
 		invoiceItems.value = []
 		payments.value = []
 		additionalDiscount.value = 0
@@ -616,12 +616,22 @@ export const usePOSCartStore = defineStore("posCart", () => {
 				return sum + (item.quantity || 0)
 			}, 0)
 
+			// Per line stock qty and amount, which offer tiers are resolved against
+			const lines = invoiceItems.value.map((item) => ({
+				item_code: item.item_code,
+				item_group: item.item_group,
+				brand: item.brand,
+				qty: (item.quantity || 0) * (item.conversion_factor || 1),
+				amount: (item.quantity || 0) * (item.price_list_rate || item.rate || 0),
+			}))
+
 			offersStore.updateCartSnapshot({
 				subtotal: subtotal.value,
 				itemCount: totalQty, // Total quantity, not number of line items
 				itemCodes: cachedItemCodes,
 				itemGroups: cachedItemGroups,
 				brands: cachedBrands,
+				lines,
 			})
 		}
 	}
@@ -7,6 +7,7 @@ const defaultSnapshot = () => ({
 	itemCodes: [],
 	itemGroups: [],
 	brands: [],
+	lines: [],
 })
 
 function getDiscountSortValue(offer) {
@@ -18,10 +19,65 @@ function getDiscountSortValue(offer) {
 	return Number.parseFloat(offer?.discount_amount) || 0
 }
 
+function slabCovers(slab, qty, amount) {
+	if (qty < (slab.min_qty || 0) || amount < (slab.min_amt || 0)) {
+		return false
+	}
+	if (slab.max_qty && qty > slab.max_qty) {
+		return false
+	}
+	if (slab.max_amt && amount > slab.max_amt) {
+		return false
+	}
+	return true
+}
+
+/**
+ * Finds the highest slab (tier) of an offer covering qty and amount.
+ * Slabs are sorted by the server on min_qty, or on min_amt when no slab sets
+ * a quantity, so the candidate tier is located by binary search.
+ * @param {Object} offer - Offer with a `slabs` list
+ * @param {number} qty - Quantity to price
+ * @param {number} amount - Amount to price
+ * @returns {Object|null} Matching slab or null
+ */
+export function findOfferSlab(offer, qty = 0, amount = 0) {
+	const slabs = offer?.slabs || []
+	if (!slabs.length) {
+		return null
+	}
+
+	const key = slabs.some((slab) => slab.min_qty) ? "min_qty" : "min_amt"
+	const value = key === "min_qty" ? qty : amount
+
+	// First slab whose lower bound exceeds value
+	let low = 0
+	let high = slabs.length
+	while (low < high) {
+		const mid = (low + high) >> 1
+		if ((slabs[mid][key] || 0) <= value) {
+			low = mid + 1
+		} else {
+			high = mid
+		}
+	}
+
+	for (let index = low - 1; index >= 0; index--) {
+		if (slabCovers(slabs[index], qty, amount)) {
+			return slabs[index]
+		}
+	}
+	return null
+}
+
 export const usePOSOffersStore = defineStore("posOffers", () => {
 	const availableOffers = ref([])
 	const cartSnapshot = ref(defaultSnapshot())
 	const hasFetched = ref(false)
+	// Offers ETag from the server; sent back so unchanged offers are not re-sent
+	const offersVersion = ref("")
+	// Inverted eligibility index from the server: item_code / item_group / brand -> offer names
+	const offersIndex = ref(null)
 
 	function updateCartSnapshot(snapshot = {}) {
 		const subtotal = Number.parseFloat(snapshot.subtotal) || 0
@@ -35,6 +91,7 @@ export const usePOSOffersStore = defineStore("posOffers", () => {
 			? snapshot.itemGroups
 			: []
 		const brands = Array.isArray(snapshot.brands) ? snapshot.brands : []
+		const lines = Array.isArray(snapshot.lines) ? snapshot.lines : []
 
 		cartSnapshot.value = {
 			subtotal,
@@ -42,6 +99,7 @@ export const usePOSOffersStore = defineStore("posOffers", () => {
 			itemCodes,
 			itemGroups,
 			brands,
+			lines,
 		}
 	}
 
@@ -49,27 +107,63 @@ export const usePOSOffersStore = defineStore("posOffers", () => {
 		cartSnapshot.value = defaultSnapshot()
 	}
 
-	function setAvailableOffers(offers = []) {
+	function setAvailableOffers(offers = [], version = "", index = null) {
 		if (!Array.isArray(offers)) {
 			availableOffers.value = []
 		} else {
 			availableOffers.value = offers
 		}
+		offersVersion.value = version || ""
+		offersIndex.value = index || null
 		hasFetched.value = true
 	}
 
 	function clearOffers() {
 		availableOffers.value = []
+		offersVersion.value = ""
+		offersIndex.value = null
 		hasFetched.value = false
 	}
 
+	// Offers whose eligibility matches the cart, found by hash lookups in the index
+	const cartMatchedOffers = computed(() => {
+		const index = offersIndex.value
+		if (!index) {
+			return null
+		}
+
+		const matched = new Set(index.unrestricted || [])
+		const lookups = [
+			[index.item_code, cartSnapshot.value.itemCodes],
+			[index.item_group, cartSnapshot.value.itemGroups],
+			[index.brand, cartSnapshot.value.brands],
+		]
+		for (const [entries, values] of lookups) {
+			for (const value of values || []) {
+				for (const name of entries?.[value] || []) {
+					matched.add(name)
+				}
+			}
+		}
+		return matched
+	})
+
+	function getIneligibleItemsReason(offer) {
+		if (offer?.apply_on === "Item Group") {
+			return "Cart does not contain items from eligible groups"
+		}
+		if (offer?.apply_on === "Brand") {
+			return "Cart does not contain items from eligible brands"
+		}
+		return "Cart does not contain eligible items for this offer"
+	}
+
 	/**
 	 * Checks if an offer is eligible based on current cart state
 	 * @param {Object} offer - The offer to check
 	 * @returns {Object} {eligible: boolean, reason: string|null}
 	 */
 	function checkOfferEligibility(offer) {
-		const subtotal = cartSnapshot.value.subtotal || 0
 		const itemCount = cartSnapshot.value.itemCount || 0
 		const cartItemCodes = cartSnapshot.value.itemCodes || []
 		const cartItemGroups = cartSnapshot.value.itemGroups || []
@@ -83,32 +177,15 @@ export const usePOSOffersStore = defineStore("posOffers", () => {
 			}
 		}
 
-		// Check minimum quantity (e.g., "Buy 2 Get 1 Free" requires at least 2 items)
-		if (offer?.min_qty && itemCount < offer.min_qty) {
-			return {
-				eligible: false,
-				reason: `At least ${offer.min_qty} items required`,
-			}
-		}
-
-		// Check minimum amount
-		if (offer?.min_amt && subtotal < offer.min_amt) {
-			return {
-				eligible: false,
-				reason: `Minimum cart value of ${offer.min_amt} required`,
-			}
-		}
-
-		// Check maximum amount
-		if (offer?.max_amt && subtotal > offer.max_amt) {
-			return {
-				eligible: false,
-				reason: `Maximum cart value exceeded (${offer.max_amt})`,
+		// Check item eligibility with the index when the server sent one
+		if (cartMatchedOffers.value) {
+			if (!cartMatchedOffers.value.has(offer?.name)) {
+				return {
+					eligible: false,
+					reason: getIneligibleItemsReason(offer),
+				}
 			}
-		}
-
-		// Check item eligibility based on apply_on
-		if (offer?.apply_on === "Item Code") {
+		} else if (offer?.apply_on === "Item Code") {
 			// Check if cart contains any of the eligible items
 			const eligibleItems = offer.eligible_items || []
 			if (eligibleItems.length > 0) {
@@ -153,6 +230,52 @@ export const usePOSOffersStore = defineStore("posOffers", () => {
 		}
 		// If apply_on is 'Transaction', it applies to entire cart (no item-specific check needed)
 
+		// Check the qty and amount ranges: the offer applies only when its own
+		// slab is the tier reached (e.g., "Buy 2 Get 1 Free" requires at least 2 items)
+		const lines = getOfferLines(offer)
+		if (!lines.length) {
+			return {
+				eligible: false,
+				reason: getIneligibleItemsReason(offer),
+			}
+		}
+
+		const tier = getOfferTier(offer, lines)
+		const ownSlab = getOwnSlab(offer)
+		if (!tier || (ownSlab && tier.name !== ownSlab.name)) {
+			const qty = Math.max(0, ...lines.map((line) => line.qty))
+			const amount = Math.max(0, ...lines.map((line) => line.amount))
+
+			if (offer?.min_qty && qty < offer.min_qty) {
+				return {
+					eligible: false,
+					reason: `At least ${offer.min_qty} items required`,
+				}
+			}
+			if (offer?.min_amt && amount < offer.min_amt) {
+				return {
+					eligible: false,
+					reason: `Minimum cart value of ${offer.min_amt} required`,
+				}
+			}
+			if (tier) {
+				return {
+					eligible: false,
+					reason: "A higher tier of this offer applies",
+				}
+			}
+			if (offer?.max_qty && qty > offer.max_qty) {
+				return {
+					eligible: false,
+					reason: `Maximum quantity exceeded (${offer.max_qty})`,
+				}
+			}
+			return {
+				eligible: false,
+				reason: `Maximum cart value exceeded (${offer.max_amt})`,
+			}
+		}
+
 		return { eligible: true, reason: null }
 	}
 
@@ -186,17 +309,87 @@ export const usePOSOffersStore = defineStore("posOffers", () => {
 
 	const autoEligibleCount = computed(() => autoEligibleOffers.value.length)
 
+	/**
+	 * Qty and amount the offer's ranges are compared with, like ERPNext does:
+	 * the transaction totals for Transaction offers, the summed eligible lines
+	 * for cumulative or mixed-condition offers, and each eligible line otherwise
+	 * @param {Object} offer - The offer
+	 * @returns {Array<{qty: number, amount: number}>}
+	 */
+	function getOfferLines(offer) {
+		if (offer?.apply_on === "Transaction") {
+			return [
+				{
+					qty: cartSnapshot.value.itemCount || 0,
+					amount: cartSnapshot.value.subtotal || 0,
+				},
+			]
+		}
+
+		const field = {
+			"Item Code": ["item_code", offer?.eligible_items],
+			"Item Group": ["item_group", offer?.eligible_item_groups],
+			Brand: ["brand", offer?.eligible_brands],
+		}[offer?.apply_on]
+		const lines = (cartSnapshot.value.lines || []).filter(
+			(line) => !field || !field[1]?.length || field[1].includes(line[field[0]]),
+		)
+
+		if (offer?.is_cumulative || offer?.mixed_conditions) {
+			return [
+				lines.reduce(
+					(total, line) => ({
+						qty: total.qty + (line.qty || 0),
+						amount: total.amount + (line.amount || 0),
+					}),
+					{ qty: 0, amount: 0 },
+				),
+			]
+		}
+		return lines.map((line) => ({ qty: line.qty || 0, amount: line.amount || 0 }))
+	}
+
+	// Slab a promotional scheme offer was generated from
+	function getOwnSlab(offer) {
+		if (!offer?.slabs?.length || !offer.promotional_scheme_id) {
+			return null
+		}
+		return offer.slabs.find((slab) => slab.name === offer.promotional_scheme_id) || null
+	}
+
+	/**
+	 * Highest tier of the offer reached by the cart. Offers without slabs are a
+	 * single tier bounded by their own min/max qty and amount.
+	 * @param {Object} offer - The offer
+	 * @param {Array} lines - Result of getOfferLines, when already computed
+	 * @returns {Object|null} Reached slab (the offer itself when it has no slabs) or null
+	 */
+	function getOfferTier(offer, lines = getOfferLines(offer)) {
+		const tiers = offer?.slabs?.length ? offer : { slabs: [offer] }
+
+		let best = null
+		for (const line of lines) {
+			const slab = findOfferSlab(tiers, line.qty, line.amount)
+			if (slab && (!best || tiers.slabs.indexOf(slab) > tiers.slabs.indexOf(best))) {
+				best = slab
+			}
+		}
+		return best
+	}
+
 	function getUnlockAmount(offer) {
-		const subtotal = cartSnapshot.value.subtotal || 0
-		if (offer?.min_amt && subtotal < offer.min_amt) {
-			return offer.min_amt - subtotal
+		if (!offer?.min_amt) {
+			return 0
 		}
-		return 0
+		const amount = Math.max(0, ...getOfferLines(offer).map((line) => line.amount))
+		return amount < offer.min_amt ? offer.min_amt - amount : 0
 	}
 
 	return {
 		// State
 		availableOffers,
+		offersVersion,
+		offersIndex,
 		cartSnapshot,
 		hasFetched,
 
@@ -212,6 +405,7 @@ export const usePOSOffersStore = defineStore("posOffers", () => {
 		setAvailableOffers,
 		clearOffers,
 		checkOfferEligibility,
+		getOfferTier,
 		getUnlockAmount,
 	}
 })
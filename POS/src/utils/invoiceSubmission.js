@@ -0,0 +1,79 @@
+/**
+ * Background invoice submission for POS Next
+ * Waits for the result of an invoice queued by submit_invoice_async
+ */
+
+import { call } from "@/utils/apiWrapper"
+
+const SUBMISSION_EVENT = "pos_invoice_submission"
+const POLL_INTERVAL = 3000 // Status fallback when the realtime event is missed
+const SUBMISSION_TIMEOUT = 120000
+
+// Receipt statuses that end a background submission
+const DONE_STATUSES = ["submitted", "already_submitted", "failed"]
+
+/**
+ * Wait until a queued invoice is submitted or fails
+ *
+ * Resolves on the pos_invoice_submission realtime event for the receipt, and
+ * polls get_invoice_submission_status in case Socket.IO is down or the event
+ * was missed.
+ * @param {Object} receipt - Receipt returned by submit_invoice_async (status "queued")
+ * @returns {Promise<Object>} Final receipt; rejects with an Error carrying the
+ *   receipt when the submission failed or timed out
+ */
+export function waitForInvoiceSubmission(receipt) {
+	return new Promise((resolve, reject) => {
+		let pollTimer = null
+		let timeoutTimer = null
+		let finished = false
+
+		const realtime = typeof window !== "undefined" ? window.frappe?.realtime : null
+
+		function finish(result) {
+			if (finished || !result || !DONE_STATUSES.includes(result.status)) {
+				return
+			}
+			finished = true
+			clearInterval(pollTimer)
+			clearTimeout(timeoutTimer)
+			realtime?.off(SUBMISSION_EVENT, handleEvent)
+
+			if (result.status === "failed") {
+				const error = new Error(result.error || "Invoice submission failed")
+				error.receipt = result
+				reject(error)
+			} else {
+				resolve({ ...receipt, ...result })
+			}
+		}
+
+		function handleEvent(message) {
+			if (message?.receipt_token === receipt.receipt_token) {
+				finish(message)
+			}
+		}
+
+		async function poll() {
+			try {
+				finish(
+					await call("pos_next.api.invoices.get_invoice_submission_status", {
+						receipt_token: receipt.receipt_token,
+					}),
+				)
+			} catch (error) {
+				console.warn("Invoice submission status check failed:", error)
+			}
+		}
+
+		realtime?.on(SUBMISSION_EVENT, handleEvent)
+		pollTimer = setInterval(poll, POLL_INTERVAL)
+		timeoutTimer = setTimeout(() => {
+			finish({
+				...receipt,
+				status: "failed",
+				error: "Invoice submission is taking longer than expected. Check the invoice list before retrying.",
+			})
+		}, SUBMISSION_TIMEOUT)
+	})
+}
@@ -1,5 +1,9 @@
 import { call } from "@/utils/apiWrapper"
 import { db, getSetting, setSetting } from "./db"
+import { generateUUID } from "@/utils/uuid"
+
+// Offline invoices are sent to the server in batches of this size
+const SYNC_BATCH_SIZE = 50
 
 // Server connectivity state
 if (typeof window !== "undefined") {
@@ -76,6 +80,8 @@ export const saveOfflineInvoice = async (invoiceData) => {
 		// Add to queue
 		await db.invoice_queue.add({
 			data: cleanData,
+			// Lets the server skip invoices it already posted when a sync is retried
+			idempotency_key: generateUUID(),
 			timestamp: Date.now(),
 			synced: false,
 			retry_count: 0,
@@ -136,33 +142,64 @@ export const syncOfflineInvoices = async () => {
 	let failedCount = 0
 	const errors = []
 
+	// Invoices queued before idempotency keys were introduced get one now,
+	// stored before sending so a retry reuses it
 	for (const invoice of pendingInvoices) {
+		if (!invoice.idempotency_key) {
+			invoice.idempotency_key = generateUUID()
+			await db.invoice_queue.update(invoice.id, {
+				idempotency_key: invoice.idempotency_key,
+			})
+		}
+	}
+
+	for (let start = 0; start < pendingInvoices.length; start += SYNC_BATCH_SIZE) {
+		const batch = pendingInvoices.slice(start, start + SYNC_BATCH_SIZE)
+
+		let results
 		try {
-			// Submit invoice to server
-			// The API expects 'data' parameter with nested 'invoice' and 'data' keys
-			const response = await call("pos_next.api.invoices.submit_invoice", {
-				data: JSON.stringify({
-					invoice: invoice.data,
-					data: {},
-				}),
+			const response = await call("pos_next.api.invoices.submit_invoices_batch", {
+				invoices: JSON.stringify(
+					batch.map((invoice) => ({
+						idempotency_key: invoice.idempotency_key,
+						invoice: invoice.data,
+						data: {},
+					})),
+				),
 			})
+			results = response.message || response
+		} catch (error) {
+			// The whole request failed (e.g. timeout); keys make the retry safe
+			console.error("Error syncing offline invoice batch:", error)
+			failedCount += batch.length
+			break
+		}
+
+		for (const [index, invoice] of batch.entries()) {
+			const result = results[index] || {}
 
-			if (response.message || response.name) {
+			if (result.status === "cancelled") {
+				// Posted earlier and voided in the back office: never post it again
+				await db.invoice_queue.update(invoice.id, { synced: true })
+				console.warn(`Invoice ${invoice.id} was already posted as ${result.name} and cancelled`)
+				continue
+			}
+
+			if (result.status === "submitted" || result.status === "duplicate") {
 				// Mark as synced
 				await db.invoice_queue.update(invoice.id, { synced: true })
 				successCount++
-				console.log(
-					`Invoice ${invoice.id} synced successfully as ${response.name || response.message}`,
-				)
+				console.log(`Invoice ${invoice.id} synced successfully as ${result.name}`)
+				continue
 			}
-		} catch (error) {
-			console.error(`Error syncing invoice ${invoice.id}:`, error)
+
+			console.error(`Error syncing invoice ${invoice.id}:`, result.error)
 
 			// Store error details
 			errors.push({
 				invoiceId: invoice.id,
 				customer: invoice.data.customer || "Walk-in Customer",
-				error: error,
+				error: result.error,
 			})
 
 			// Increment retry count
@@ -176,7 +213,7 @@ export const syncOfflineInvoices = async () => {
 			if ((invoice.retry_count || 0) >= 3) {
 				await db.invoice_queue.update(invoice.id, {
 					sync_failed: true,
-					error: error.message,
+					error: result.error,
 				})
 			}
 		}
@@ -0,0 +1,40 @@
+/**
+ * UUID generation for POS Next
+ * Works in insecure contexts (plain-HTTP LAN deployments) and in web workers
+ */
+
+/**
+ * Generate a random RFC 4122 version 4 UUID
+ *
+ * crypto.randomUUID() only exists in secure contexts, so fall back to
+ * crypto.getRandomValues(), which is available everywhere, and to
+ * Math.random() as a last resort.
+ * @returns {string} UUID such as "3b241101-e2bb-4255-8caf-4136c566a962"
+ */
+export function generateUUID() {
+	const cryptoApi = typeof crypto !== "undefined" ? crypto : null
+
+	if (cryptoApi && typeof cryptoApi.randomUUID === "function") {
+		try {
+			return cryptoApi.randomUUID()
+		} catch (error) {
+			// Not allowed in this context, use the fallback below
+		}
+	}
+
+	const bytes = new Uint8Array(16)
+	if (cryptoApi && typeof cryptoApi.getRandomValues === "function") {
+		cryptoApi.getRandomValues(bytes)
+	} else {
+		for (let i = 0; i < bytes.length; i++) {
+			bytes[i] = Math.floor(Math.random() * 256)
+		}
+	}
+
+	// Set the version (4) and variant (10xx) bits
+	bytes[6] = (bytes[6] & 0x0f) | 0x40
+	bytes[8] = (bytes[8] & 0x3f) | 0x80
+
+	const hex = Array.from(bytes, (byte) => byte.toString(16).padStart(2, "0")).join("")
+	return `${hex.slice(0, 8)}-${hex.slice(8, 12)}-${hex.slice(12, 16)}-${hex.slice(16, 20)}-${hex.slice(20)}`
+}
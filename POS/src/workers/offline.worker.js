@@ -18,6 +18,7 @@
  */
 
 import { logger } from '../utils/logger'
+import { generateUUID } from '../utils/uuid'
 const log = logger.create('OfflineWorker')
 
 // ============================================================================
@@ -408,6 +409,8 @@ async function saveOfflineInvoice(invoiceData) {
 
 		const id = await db.table("invoice_queue").add({
 			data: invoiceData,
+			// Lets the server skip invoices it already posted when a sync is retried
+			idempotency_key: generateUUID(),
 			timestamp: Date.now(),
 			synced: false,
 			retry_count: 0,
@@ -7,19 +7,141 @@ import json
 import frappe
 from frappe import _
 from frappe.utils import flt, cint, nowdate, nowtime, get_datetime, cstr
+from frappe.utils.background_jobs import is_job_enqueued
+from frappe.utils.caching import request_cache
 from erpnext.stock.doctype.batch.batch import get_batch_qty, get_batch_no
 from erpnext.accounts.doctype.sales_invoice.sales_invoice import get_bank_cash_account
+from pos_next.api import offer_engine
+from pos_next.api.returned_qty import get_returned_qty
+from pos_next.tasks.draft_cleanup import enqueue_draft_cleanup
 
 try:
     from erpnext.accounts.doctype.pricing_rule.pricing_rule import (
         apply_pricing_rule as erpnext_apply_pricing_rule,
     )
-    from erpnext.accounts.doctype.pricing_rule.utils import (
-        get_applied_pricing_rules as erpnext_get_applied_pricing_rules,
-    )
 except Exception:  # pragma: no cover - ERPNext not installed in some environments
     erpnext_apply_pricing_rule = None
-    erpnext_get_applied_pricing_rules = None
+
+
+# Offline queues are replayed in chunks of at most this many invoices
+SUBMIT_BATCH_MAX_SIZE = 50
+
+# Columns the invoice history API may return
+INVOICE_HISTORY_FIELDS = (
+    "name",
+    "customer",
+    "customer_name",
+    "posting_date",
+    "posting_time",
+    "currency",
+    "total_qty",
+    "net_total",
+    "total_taxes_and_charges",
+    "grand_total",
+    "rounded_total",
+    "paid_amount",
+    "change_amount",
+    "outstanding_amount",
+    "status",
+    "docstatus",
+    "is_return",
+    "return_against",
+    "owner",
+    "pos_profile",
+    "posa_pos_opening_shift",
+    "posa_is_printed",
+)
+INVOICE_HISTORY_DEFAULT_FIELDS = (
+    "name",
+    "customer",
+    "customer_name",
+    "posting_date",
+    "posting_time",
+    "grand_total",
+    "paid_amount",
+    "outstanding_amount",
+    "status",
+    "docstatus",
+    "is_return",
+    "return_against",
+)
+INVOICE_HISTORY_ITEM_FIELDS = (
+    "name",
+    "idx",
+    "item_code",
+    "item_name",
+    "qty",
+    "uom",
+    "stock_qty",
+    "conversion_factor",
+    "price_list_rate",
+    "discount_percentage",
+    "discount_amount",
+    "rate",
+    "amount",
+    "warehouse",
+    "batch_no",
+    "serial_no",
+)
+INVOICE_HISTORY_ITEM_DEFAULT_FIELDS = ("item_code", "item_name", "qty", "uom", "rate", "amount")
+INVOICE_HISTORY_INDEX = "pos_next_invoice_history"
+
+# Customer columns indexed for the return search prefix lookups
+CUSTOMER_SEARCH_INDEXES = {
+    "pos_next_customer_name": "customer_name",
+    "pos_next_customer_mobile_no": "mobile_no",
+}
+
+# Columns returned by the return search
+RETURN_SEARCH_HEADER_FIELDS = [
+    "name",
+    "customer",
+    "customer_name",
+    "company",
+    "posting_date",
+    "posting_time",
+    "currency",
+    "pos_profile",
+    "net_total",
+    "total_taxes_and_charges",
+    "discount_amount",
+    "grand_total",
+    "rounded_total",
+    "paid_amount",
+    "outstanding_amount",
+    "status",
+]
+RETURN_SEARCH_ITEM_FIELDS = [
+    "name",
+    "idx",
+    "item_code",
+    "item_name",
+    "description",
+    "qty",
+    "uom",
+    "stock_uom",
+    "conversion_factor",
+    "stock_qty",
+    "price_list_rate",
+    "discount_percentage",
+    "discount_amount",
+    "rate",
+    "amount",
+    "net_rate",
+    "net_amount",
+    "warehouse",
+    "batch_no",
+    "serial_no",
+    "item_tax_template",
+]
+
+# Resolved payment accounts per (company, mode of payment)
+PAYMENT_ACCOUNT_CACHE_KEY = "pos_next:payment_accounts"
+
+# Background submissions: stock held by queued invoices and their receipts
+QUEUED_STOCK_CACHE_KEY = "pos_next:queued_invoice_stock"
+QUEUED_STOCK_TTL = 60 * 60
+RECEIPT_TTL = 24 * 60 * 60
 
 
 # ==========================================
@@ -27,10 +149,10 @@ except Exception:  # pragma: no cover - ERPNext not installed in some environmen
 # ==========================================
 
 
-def get_payment_account(mode_of_payment, company):
+def _resolve_payment_account(mode_of_payment, company):
     """
-    Get account for mode of payment.
-    Tries multiple fallback methods to find a suitable account.
+    Find the account for a mode of payment, trying several fallbacks.
+    Returns None when no suitable account exists.
     """
     # Try 1: Mode of Payment Account table
     account = frappe.db.get_value(
@@ -39,7 +161,7 @@ def get_payment_account(mode_of_payment, company):
         "default_account",
     )
     if account:
-        return {"account": account}
+        return account
 
     # Try 2: POS Payment Method from POS Profile
     account = frappe.db.sql(
@@ -57,18 +179,18 @@ def get_payment_account(mode_of_payment, company):
     )
 
     if account and account[0].default_account:
-        return {"account": account[0].default_account}
+        return account[0].default_account
 
     # Try 3: Company default cash account (for cash payments)
     if "cash" in mode_of_payment.lower():
         account = frappe.get_value("Company", company, "default_cash_account")
         if account:
-            return {"account": account}
+            return account
 
     # Try 4: Company default bank account
     account = frappe.get_value("Company", company, "default_bank_account")
     if account:
-        return {"account": account}
+        return account
 
     # Try 5: Any Cash/Bank account for the company
     account = frappe.db.get_value(
@@ -76,6 +198,52 @@ def get_payment_account(mode_of_payment, company):
         {"company": company, "account_type": ["in", ["Cash", "Bank"]], "is_group": 0},
         "name",
     )
+    if account:
+        return account
+
+    return None
+
+
+def get_payment_accounts(modes_of_payment, company):
+    """
+    Return {mode_of_payment: account} for several modes of payment at once.
+
+    Resolved accounts are cached per (company, mode of payment) in Redis and
+    dropped when a Mode of Payment, POS Profile or Company is saved.
+    """
+    accounts = {}
+    missing = []
+    for mode_of_payment in dict.fromkeys(m for m in modes_of_payment if m):
+        account = frappe.cache().hget(PAYMENT_ACCOUNT_CACHE_KEY, f"{company}::{mode_of_payment}")
+        if account:
+            accounts[mode_of_payment] = account
+        else:
+            missing.append(mode_of_payment)
+
+    if missing:
+        # Try 1 for all misses in one query
+        rows = frappe.get_all(
+            "Mode of Payment Account",
+            filters={"parent": ["in", missing], "company": company},
+            fields=["parent", "default_account"],
+        )
+        direct = {row.parent: row.default_account for row in rows if row.default_account}
+
+        for mode_of_payment in missing:
+            account = direct.get(mode_of_payment) or _resolve_payment_account(mode_of_payment, company)
+            if account:
+                accounts[mode_of_payment] = account
+                frappe.cache().hset(PAYMENT_ACCOUNT_CACHE_KEY, f"{company}::{mode_of_payment}", account)
+
+    return accounts
+
+
+def get_payment_account(mode_of_payment, company):
+    """
+    Get account for mode of payment.
+    Tries multiple fallback methods to find a suitable account.
+    """
+    account = get_payment_accounts([mode_of_payment], company).get(mode_of_payment)
     if account:
         return {"account": account}
 
@@ -88,91 +256,213 @@ def get_payment_account(mode_of_payment, company):
     )
 
 
+def _set_payment_accounts(invoice_doc, company, overwrite=False):
+    """
+    Set the account on all payment rows of an invoice with one bulk lookup.
+    With ``overwrite`` existing accounts are replaced and a missing account raises.
+    """
+    rows = [
+        payment
+        for payment in invoice_doc.get("payments") or []
+        if payment.mode_of_payment and (overwrite or not payment.get("account"))
+    ]
+    if not rows or not company:
+        return
+
+    accounts = get_payment_accounts([payment.mode_of_payment for payment in rows], company)
+    for payment in rows:
+        if payment.mode_of_payment in accounts:
+            payment.account = accounts[payment.mode_of_payment]
+        elif overwrite:
+            # Raises the missing account error
+            get_payment_account(payment.mode_of_payment, company)
+
+
+def clear_payment_account_cache(doc=None, method=None):
+    """Drop cached payment accounts (doc_events on Mode of Payment, POS Profile and Company)."""
+    frappe.cache().delete_value(PAYMENT_ACCOUNT_CACHE_KEY)
+
+
 # ==========================================
 # Stock Validation Functions
 # ==========================================
 
 
-def _get_available_stock(item):
-    """Return available stock qty for an item row."""
-    warehouse = item.get("warehouse")
-    batch_no = item.get("batch_no")
-    item_code = item.get("item_code")
-
-    if not item_code or not warehouse:
-        return 0
+@request_cache
+def _get_stock_settings(pos_profile=None):
+    """Per-request snapshot of the settings that decide whether short stock blocks a sale."""
+    # Global ERPNext Stock Settings
+    allow_negative_stock = cint(
+        frappe.db.get_single_value("Stock Settings", "allow_negative_stock") or 0
+    )
 
-    if batch_no:
-        return get_batch_qty(batch_no, warehouse) or 0
+    pos_allow_negative_stock = 0
+    block_sale = 1
+    if pos_profile:
+        # POS Settings for the specific profile
+        pos_allow_negative_stock = cint(
+            frappe.db.get_value(
+                "POS Settings",
+                {"pos_profile": pos_profile},
+                "allow_negative_stock"
+            ) or 0
+        )
+        # Try to get custom field (may not exist in vanilla ERPNext)
+        block_sale = cint(
+            frappe.db.get_value(
+                "POS Profile", pos_profile, "posa_block_sale_beyond_available_qty"
+            )
+            or 1
+        )
 
-    # Get stock from Bin
-    bin_qty = frappe.db.get_value(
-        "Bin", {"item_code": item_code, "warehouse": warehouse}, "actual_qty"
+    return frappe._dict(
+        allow_negative_stock=allow_negative_stock,
+        pos_allow_negative_stock=pos_allow_negative_stock,
+        block_sale=block_sale,
     )
-    return flt(bin_qty) or 0
 
 
-def _collect_stock_errors(items):
-    """Return list of items exceeding available stock."""
-    errors = []
+def _get_batch_qty_map(item_warehouses):
+    """
+    Return {(batch_no, warehouse): qty} of every batch of the given
+    (item_code, warehouse) pairs.
+
+    Balances come from ERPNext's get_batch_qty, so bundle, legacy ledger,
+    expiry and POS reservation handling stay identical to ERPNext. This is a
+    deliberate exception to batching stock reads in one grouped query: it costs
+    one call per (warehouse, item) pair, not per row or batch, because
+    get_batch_qty's reservation lookups only accept a single item code.
+    Invoice stock validation and bulk item details both read batches here.
+    """
+    batch_qty = {}
+    for item_code, warehouse in set(item_warehouses):
+        for row in get_batch_qty(item_code=item_code, warehouse=warehouse) or []:
+            key = (row.get("batch_no"), row.get("warehouse") or warehouse)
+            batch_qty[key] = batch_qty.get(key, 0) + flt(row.get("qty"))
+
+    return batch_qty
+
+
+def _get_available_stock_map(items):
+    """
+    Return {(item_code, warehouse, batch_no): available qty} for item rows,
+    with one grouped Bin query, one batch query and one queued-stock read.
+    """
+    keys = {
+        (d.get("item_code"), d.get("warehouse"), d.get("batch_no") or "")
+        for d in items
+        if d.get("item_code") and d.get("warehouse")
+    }
+    if not keys:
+        return {}
+
+    bin_keys = [key for key in keys if not key[2]]
+    batch_keys = [key for key in keys if key[2]]
+
+    bin_qty = {}
+    if bin_keys:
+        rows = frappe.db.sql(
+            """
+            SELECT item_code, warehouse, actual_qty
+            FROM `tabBin`
+            WHERE item_code IN %s AND warehouse IN %s
+            """,
+            [list({key[0] for key in bin_keys}), list({key[1] for key in bin_keys})],
+            as_dict=1,
+        )
+        bin_qty = {(row.item_code, row.warehouse): flt(row.actual_qty) for row in rows}
+
+    batch_qty = _get_batch_qty_map((key[0], key[1]) for key in batch_keys)
+
+    # Stock held by invoices waiting for background submission is not available
+    queued_qty = _get_queued_stock(keys)
+
+    available = {}
+    for key in keys:
+        item_code, warehouse, batch_no = key
+        if batch_no:
+            qty = batch_qty.get((batch_no, warehouse), 0)
+        else:
+            qty = bin_qty.get((item_code, warehouse), 0)
+        available[key] = qty - queued_qty.get(key, 0)
+
+    return available
+
+
+def _collect_stock_errors(items, default_warehouse=None):
+    """
+    Return list of (item, warehouse, batch) combinations exceeding available stock.
+
+    Requested stock qty is summed over all rows for the same item, warehouse and
+    batch first, so an item split across several lines is checked as a whole.
+    Rows without a warehouse are checked against ``default_warehouse`` (the POS
+    Profile warehouse); with neither, nothing is available and they are reported.
+    """
+    requested_map = {}
     for d in items:
-        if flt(d.get("qty")) < 0:
+        if flt(d.get("qty")) < 0 or not d.get("item_code"):
             continue
 
-        available = _get_available_stock(d)
-        requested = flt(
+        warehouse = d.get("warehouse") or default_warehouse
+        key = (d.get("item_code"), warehouse, d.get("batch_no") or "")
+        requested_map[key] = requested_map.get(key, 0) + flt(
             d.get("stock_qty")
             or (flt(d.get("qty")) * flt(d.get("conversion_factor") or 1))
         )
 
+    if not requested_map:
+        return []
+
+    available_map = _get_available_stock_map(
+        [{"item_code": key[0], "warehouse": key[1], "batch_no": key[2]} for key in requested_map]
+    )
+
+    errors = []
+    for key, requested in requested_map.items():
+        available = available_map.get(key, 0)
         if requested > available:
-            errors.append(
-                {
-                    "item_code": d.get("item_code"),
-                    "warehouse": d.get("warehouse"),
-                    "requested_qty": requested,
-                    "available_qty": available,
-                }
-            )
+            item_code, warehouse, batch_no = key
+            error = {
+                "item_code": item_code,
+                "warehouse": warehouse,
+                "requested_qty": requested,
+                "available_qty": available,
+            }
+            if batch_no:
+                error["batch_no"] = batch_no
+            errors.append(error)
 
     return errors
 
 
 def _should_block(pos_profile):
     """Check if sale should be blocked for insufficient stock."""
-    # First check global ERPNext Stock Settings
-    allow_negative = cint(
-        frappe.db.get_single_value("Stock Settings", "allow_negative_stock") or 0
-    )
-    if allow_negative:
+    settings = _get_stock_settings(pos_profile)
+
+    if settings.allow_negative_stock:
         return False
 
-    # Check POS Settings for the specific profile
     if pos_profile:
-        # Check if POS Settings allows negative stock
-        pos_settings_allow_negative = cint(
-            frappe.db.get_value(
-                "POS Settings",
-                {"pos_profile": pos_profile},
-                "allow_negative_stock"
-            ) or 0
-        )
-        if pos_settings_allow_negative:
+        if settings.pos_allow_negative_stock:
             return False
-
-        # Try to get custom field (may not exist in vanilla ERPNext)
-        block_sale = cint(
-            frappe.db.get_value(
-                "POS Profile", pos_profile, "posa_block_sale_beyond_available_qty"
-            )
-            or 1
-        )
-        return bool(block_sale)
+        return bool(settings.block_sale)
 
     # Default to blocking if no profile specified
     return True
 
 
+def _get_default_warehouse(invoice_doc=None, pos_profile=None):
+    """Warehouse for rows that do not name one: the invoice's, else the POS Profile's."""
+    if invoice_doc and invoice_doc.get("set_warehouse"):
+        return invoice_doc.set_warehouse
+
+    pos_profile = pos_profile or (invoice_doc.get("pos_profile") if invoice_doc else None)
+    if pos_profile:
+        return frappe.get_cached_value("POS Profile", pos_profile, "warehouse")
+
+    return None
+
+
 def _validate_stock_on_invoice(invoice_doc):
     """Validate stock availability before submission."""
     if invoice_doc.doctype == "Sales Invoice" and not cint(
@@ -188,7 +478,7 @@ def _validate_stock_on_invoice(invoice_doc):
         items_to_check.extend([d.as_dict() for d in invoice_doc.packed_items])
 
     # Check for stock errors
-    errors = _collect_stock_errors(items_to_check)
+    errors = _collect_stock_errors(items_to_check, _get_default_warehouse(invoice_doc))
 
     # Throw error if stock insufficient and blocking is enabled
     if errors and _should_block(invoice_doc.pos_profile):
@@ -248,7 +538,7 @@ def validate_cart_items(items, pos_profile=None):
     if not _should_block(pos_profile):
         return []
 
-    errors = _collect_stock_errors(items)
+    errors = _collect_stock_errors(items, _get_default_warehouse(pos_profile=pos_profile))
     if not errors:
         return []
 
@@ -257,43 +547,61 @@ def validate_cart_items(items, pos_profile=None):
 
 @frappe.whitelist()
 def validate_return_items(original_invoice_name, return_items, doctype="Sales Invoice"):
-    """Ensure that return items do not exceed the quantity from the original invoice."""
-    original_invoice = frappe.get_doc(doctype, original_invoice_name)
-    original_item_qty = {}
-
-    for item in original_invoice.items:
-        original_item_qty[item.item_code] = (
-            original_item_qty.get(item.item_code, 0) + item.qty
-        )
+    """
+    Ensure that return items do not exceed the quantity left on the original invoice.
 
-    # Get all returned items from this invoice
-    returned_items = frappe.get_all(
-        doctype,
-        filters={
-            "return_against": original_invoice_name,
-            "docstatus": 1,
-            "is_return": 1,
-        },
-        fields=["name"],
-    )
+    Quantities already returned come from the POS Returned Qty ledger, checked per
+    original row when ``sales_invoice_item`` is given and per item code otherwise.
+    The ledger only tracks Sales Invoices, so other doctypes are rejected.
+    """
+    if doctype != "Sales Invoice":
+        frappe.throw(_("Returns can only be validated against a Sales Invoice, not {0}").format(doctype))
 
-    for returned_invoice in returned_items:
-        ret_doc = frappe.get_doc(doctype, returned_invoice.name)
-        for item in ret_doc.items:
-            if item.item_code in original_item_qty:
-                original_item_qty[item.item_code] -= abs(item.qty)
+    return_items = json.loads(return_items) if isinstance(return_items, str) else return_items
 
-    # Validate new return items
-    for item in return_items:
+    original_rows = frappe.get_all(
+        "Sales Invoice Item",
+        filters={"parent": original_invoice_name, "parenttype": "Sales Invoice"},
+        fields=["name", "item_code", "qty"],
+        order_by="idx",
+    )
+    returned = get_returned_qty([original_invoice_name]).get(original_invoice_name, {})
+
+    row_remaining = {}
+    row_item_code = {}
+    item_remaining = {}
+    for row in original_rows:
+        remaining = flt(row.qty) - returned.get(row.name, 0)
+        row_remaining[row.name] = remaining
+        row_item_code[row.name] = row.item_code
+        item_remaining[row.item_code] = item_remaining.get(row.item_code, 0) + remaining
+
+    # Requested quantities per original row and per item code
+    row_requested = {}
+    item_requested = {}
+    for item in return_items or []:
         item_code = item.get("item_code")
-        return_qty = abs(item.get("qty", 0))
-        if item_code in original_item_qty and return_qty > original_item_qty[item_code]:
-            return {
-                "valid": False,
-                "message": _(
-                    "You are trying to return more quantity for item {0} than was sold."
-                ).format(item_code),
-            }
+        return_qty = abs(flt(item.get("qty", 0)))
+        row_name = item.get("sales_invoice_item")
+        if row_name in row_remaining:
+            row_requested[row_name] = row_requested.get(row_name, 0) + return_qty
+            item_code = row_item_code[row_name]
+        if item_code in item_remaining:
+            item_requested[item_code] = item_requested.get(item_code, 0) + return_qty
+
+    exceeded = [
+        row_item_code[row_name]
+        for row_name, qty in row_requested.items()
+        if qty > row_remaining[row_name]
+    ] + [item_code for item_code, qty in item_requested.items() if qty > item_remaining[item_code]]
+
+    if exceeded:
+        return {
+            "valid": False,
+            "message": _(
+                "You are trying to return more quantity for item {0} than was sold."
+            ).format(exceeded[0]),
+        }
 
     return {"valid": True}
 
@@ -303,205 +611,201 @@ def validate_return_items(original_invoice_name, return_items, doctype="Sales In
 # ==========================================
 
 
-@frappe.whitelist()
-def update_invoice(data):
-    """Create or update invoice draft (Step 1)."""
-    try:
-        data = json.loads(data) if isinstance(data, str) else data
-
-        pos_profile = data.get("pos_profile")
-        doctype = "Sales Invoice"
+def _build_invoice_doc(data, dry_run=False):
+    """
+    Build the Sales Invoice for ``data`` with POS defaults, payment accounts,
+    discounts, rounding and totals applied, without saving it.
 
-        # Ensure the document type is set
-        data.setdefault("doctype", doctype)
+    With ``dry_run`` nothing is written, e.g. unknown customers are not created.
+    """
+    data = json.loads(data) if isinstance(data, str) else data
 
-        # Create or update invoice
-        if data.get("name"):
-            invoice_doc = frappe.get_doc(doctype, data.get("name"))
-            invoice_doc.update(data)
-        else:
-            invoice_doc = frappe.get_doc(data)
+    pos_profile = data.get("pos_profile")
+    doctype = "Sales Invoice"
 
-        pos_profile_doc = None
-        if pos_profile:
-            try:
-                pos_profile_doc = frappe.get_cached_doc("POS Profile", pos_profile)
-            except Exception as profile_err:
-                frappe.throw(_("Unable to load POS Profile {0}").format(pos_profile))
+    # Ensure the document type is set
+    data.setdefault("doctype", doctype)
 
-            invoice_doc.pos_profile = pos_profile
+    # Create or update invoice
+    if data.get("name"):
+        invoice_doc = frappe.get_doc(doctype, data.get("name"))
+        invoice_doc.update(data)
+    else:
+        invoice_doc = frappe.get_doc(data)
 
-            if pos_profile_doc.company and not invoice_doc.get("company"):
-                invoice_doc.company = pos_profile_doc.company
-            if pos_profile_doc.currency and not invoice_doc.get("currency"):
-                invoice_doc.currency = pos_profile_doc.currency
+    pos_profile_doc = None
+    if pos_profile:
+        try:
+            pos_profile_doc = frappe.get_cached_doc("POS Profile", pos_profile)
+        except Exception as profile_err:
+            frappe.throw(_("Unable to load POS Profile {0}").format(pos_profile))
+
+        invoice_doc.pos_profile = pos_profile
+
+        if pos_profile_doc.company and not invoice_doc.get("company"):
+            invoice_doc.company = pos_profile_doc.company
+        if pos_profile_doc.currency and not invoice_doc.get("currency"):
+            invoice_doc.currency = pos_profile_doc.currency
+
+        # Copy accounting dimensions from POS Profile
+        if hasattr(pos_profile_doc, "branch") and pos_profile_doc.branch:
+            invoice_doc.branch = pos_profile_doc.branch
+            # Also set branch on all items for GL entries
+            for item in invoice_doc.get("items", []):
+                item.branch = pos_profile_doc.branch
+
+    company = invoice_doc.get("company") or (
+        pos_profile_doc.company if pos_profile_doc else None
+    )
 
-            # Copy accounting dimensions from POS Profile
-            if hasattr(pos_profile_doc, "branch") and pos_profile_doc.branch:
-                invoice_doc.branch = pos_profile_doc.branch
-                # Also set branch on all items for GL entries
-                for item in invoice_doc.get("items", []):
-                    item.branch = pos_profile_doc.branch
+    # Missing accounts are reported during save
+    _set_payment_accounts(invoice_doc, company)
 
-        company = invoice_doc.get("company") or (
-            pos_profile_doc.company if pos_profile_doc else None
+    # Validate return items if this is a return invoice
+    if (data.get("is_return") or invoice_doc.is_return) and invoice_doc.get(
+        "return_against"
+    ):
+        validation = validate_return_items(
+            invoice_doc.return_against,
+            [d.as_dict() for d in invoice_doc.items],
+            doctype=invoice_doc.doctype,
         )
+        if not validation.get("valid"):
+            frappe.throw(validation.get("message"))
 
-        if company and invoice_doc.get("payments"):
-            for payment in invoice_doc.payments:
-                if payment.mode_of_payment and not payment.get("account"):
-                    try:
-                        account_info = get_payment_account(
-                            payment.mode_of_payment, company
-                        )
-                        payment.account = account_info.get("account")
-                    except Exception:
-                        pass  # Will be handled during save
-
-        # Validate return items if this is a return invoice
-        if (data.get("is_return") or invoice_doc.is_return) and invoice_doc.get(
-            "return_against"
-        ):
-            validation = validate_return_items(
-                invoice_doc.return_against,
-                [d.as_dict() for d in invoice_doc.items],
-                doctype=invoice_doc.doctype,
+    # Ensure customer exists
+    customer_name = invoice_doc.get("customer")
+    if not dry_run and customer_name and not frappe.db.exists("Customer", customer_name):
+        try:
+            cust = frappe.get_doc(
+                {
+                    "doctype": "Customer",
+                    "customer_name": customer_name,
+                    "customer_group": "All Customer Groups",
+                    "territory": "All Territories",
+                    "customer_type": "Individual",
+                }
             )
-            if not validation.get("valid"):
-                frappe.throw(validation.get("message"))
-
-        # Ensure customer exists
-        customer_name = invoice_doc.get("customer")
-        if customer_name and not frappe.db.exists("Customer", customer_name):
-            try:
-                cust = frappe.get_doc(
-                    {
-                        "doctype": "Customer",
-                        "customer_name": customer_name,
-                        "customer_group": "All Customer Groups",
-                        "territory": "All Territories",
-                        "customer_type": "Individual",
-                    }
-                )
-                cust.flags.ignore_permissions = True
-                cust.insert()
-                invoice_doc.customer = cust.name
-                invoice_doc.customer_name = cust.customer_name
-            except Exception as e:
-                frappe.log_error(f"Failed to create customer {customer_name}: {e}")
-
-        # Disable automatic pricing rules (we handle discounts manually from POS)
-        invoice_doc.ignore_pricing_rule = 1
-        invoice_doc.flags.ignore_pricing_rule = True
-
-        # ========================================================================
-        # DISCOUNT CALCULATION - CRITICAL LOGIC
-        # ========================================================================
-        # Problem: Frontend sends rate (discounted) and discount_percentage
-        # Solution: Reverse-calculate price_list_rate (original price) to avoid double discount
-        #
-        # Formula: rate = price_list_rate * (1 - discount_percentage/100)
-        # Reverse: price_list_rate = rate / (1 - discount_percentage/100)
-        # ========================================================================
-        for item in invoice_doc.get("items", []):
-            item_rate = flt(item.rate or 0)
-            discount_pct = flt(item.discount_percentage or 0)
-
-            # If item has a discount, reverse-calculate the original price_list_rate
-            if discount_pct > 0 and discount_pct < 100:
-                if item_rate > 0:
-                    # Reverse calculation to get original price
-                    item.price_list_rate = item_rate / (1 - discount_pct / 100)
-                elif not item.get("price_list_rate"):
-                    # Fallback: if rate is 0 but discount exists (edge case)
-                    item.price_list_rate = item_rate
+            cust.flags.ignore_permissions = True
+            cust.insert()
+            invoice_doc.customer = cust.name
+            invoice_doc.customer_name = cust.customer_name
+        except Exception as e:
+            frappe.log_error(f"Failed to create customer {customer_name}: {e}")
+
+    # Disable automatic pricing rules (we handle discounts manually from POS)
+    invoice_doc.ignore_pricing_rule = 1
+    invoice_doc.flags.ignore_pricing_rule = True
+
+    # ========================================================================
+    # DISCOUNT CALCULATION - CRITICAL LOGIC
+    # ========================================================================
+    # Problem: Frontend sends rate (discounted) and discount_percentage
+    # Solution: Reverse-calculate price_list_rate (original price) to avoid double discount
+    #
+    # Formula: rate = price_list_rate * (1 - discount_percentage/100)
+    # Reverse: price_list_rate = rate / (1 - discount_percentage/100)
+    # ========================================================================
+    for item in invoice_doc.get("items", []):
+        item_rate = flt(item.rate or 0)
+        discount_pct = flt(item.discount_percentage or 0)
+
+        # If item has a discount, reverse-calculate the original price_list_rate
+        if discount_pct > 0 and discount_pct < 100:
+            if item_rate > 0:
+                # Reverse calculation to get original price
+                item.price_list_rate = item_rate / (1 - discount_pct / 100)
             elif not item.get("price_list_rate"):
-                # No discount or price_list_rate not set - use rate as is
-                item.price_list_rate = item_rate
-
-            # Ensure price_list_rate is never less than rate (data integrity)
-            if flt(item.price_list_rate) < item_rate:
+                # Fallback: if rate is 0 but discount exists (edge case)
                 item.price_list_rate = item_rate
+        elif not item.get("price_list_rate"):
+            # No discount or price_list_rate not set - use rate as is
+            item.price_list_rate = item_rate
+
+        # Ensure price_list_rate is never less than rate (data integrity)
+        if flt(item.price_list_rate) < item_rate:
+            item.price_list_rate = item_rate
+
+        # IMPORTANT: Keep the rate from frontend (do NOT set to 0)
+        # ERPNext will recalculate if needed, but preserving frontend rate
+        # prevents rounding issues and ensures UI matches invoice
+
+    # Set invoice flags BEFORE calculations
+    invoice_doc.is_pos = 1
+    invoice_doc.update_stock = 1
+
+    # ========================================================================
+    # ROUNDING CONFIGURATION
+    # ========================================================================
+    # Load rounding preference from POS Settings
+    # When disabled (0): ERPNext rounds to nearest whole number
+    # When enabled (1): Shows exact amount without rounding
+    # ========================================================================
+    disable_rounded = 1  # Default: disable rounding for POS (show exact amounts)
 
-            # IMPORTANT: Keep the rate from frontend (do NOT set to 0)
-            # ERPNext will recalculate if needed, but preserving frontend rate
-            # prevents rounding issues and ensures UI matches invoice
+    if pos_profile:
+        try:
+            pos_settings_value = frappe.db.get_value(
+                "POS Settings",
+                {"pos_profile": pos_profile},
+                "disable_rounded_total"
+            )
+            if pos_settings_value is not None:
+                disable_rounded = cint(pos_settings_value)
+        except Exception as e:
+            # Log error but continue with default
+            frappe.log_error(f"Error loading rounding setting: {str(e)}", "POS Invoice Creation")
 
-        # Set invoice flags BEFORE calculations
-        invoice_doc.is_pos = 1
-        invoice_doc.update_stock = 1
+    invoice_doc.disable_rounded_total = disable_rounded
 
-        # ========================================================================
-        # ROUNDING CONFIGURATION
-        # ========================================================================
-        # Load rounding preference from POS Settings
-        # When disabled (0): ERPNext rounds to nearest whole number
-        # When enabled (1): Shows exact amount without rounding
-        # ========================================================================
-        disable_rounded = 1  # Default: disable rounding for POS (show exact amounts)
+    # Populate missing fields (company, currency, accounts, etc.)
+    invoice_doc.set_missing_values()
 
-        if pos_profile:
-            try:
-                pos_settings_value = frappe.db.get_value(
-                    "POS Settings",
-                    {"pos_profile": pos_profile},
-                    "disable_rounded_total"
-                )
-                if pos_settings_value is not None:
-                    disable_rounded = cint(pos_settings_value)
-            except Exception as e:
-                # Log error but continue with default
-                frappe.log_error(f"Error loading rounding setting: {str(e)}", "POS Invoice Creation")
+    # Calculate totals and apply discounts (with rounding disabled)
+    invoice_doc.calculate_taxes_and_totals()
 
-        invoice_doc.disable_rounded_total = disable_rounded
+    # Set accounts for payment rows added by set_missing_values before saving
+    _set_payment_accounts(invoice_doc, invoice_doc.company)
 
-        # Populate missing fields (company, currency, accounts, etc.)
-        invoice_doc.set_missing_values()
+    # For return invoices, ensure payments are negative
+    if invoice_doc.is_return:
+        for payment in invoice_doc.payments:
+            payment.amount = -abs(payment.amount)
+            if payment.base_amount:
+                payment.base_amount = -abs(payment.base_amount)
 
-        # Calculate totals and apply discounts (with rounding disabled)
-        invoice_doc.calculate_taxes_and_totals()
+        invoice_doc.paid_amount = flt(sum(p.amount for p in invoice_doc.payments))
+        invoice_doc.base_paid_amount = flt(
+            sum(p.base_amount or 0 for p in invoice_doc.payments)
+        )
 
-        # Set accounts for payment methods before saving
-        for payment in invoice_doc.payments:
-            if payment.mode_of_payment and not payment.get("account"):
-                try:
-                    account_info = get_payment_account(
-                        payment.mode_of_payment, invoice_doc.company
-                    )
-                    payment.account = account_info["account"]
-                except Exception:
-                    pass  # Will be handled during save
-
-        # For return invoices, ensure payments are negative
-        if invoice_doc.is_return:
-            for payment in invoice_doc.payments:
-                payment.amount = -abs(payment.amount)
-                if payment.base_amount:
-                    payment.base_amount = -abs(payment.base_amount)
-
-            invoice_doc.paid_amount = flt(sum(p.amount for p in invoice_doc.payments))
-            invoice_doc.base_paid_amount = flt(
-                sum(p.base_amount or 0 for p in invoice_doc.payments)
+    # Validate and track POS Coupon if coupon_code is provided
+    coupon_code = data.get("coupon_code")
+    if coupon_code:
+        # Validate POS Coupon exists and is valid
+        if frappe.db.table_exists("POS Coupon"):
+            from pos_next.pos_next.doctype.pos_coupon.pos_coupon import check_coupon_code
+
+            coupon_result = check_coupon_code(
+                coupon_code,
+                customer=invoice_doc.customer,
+                company=invoice_doc.company
             )
 
-        # Validate and track POS Coupon if coupon_code is provided
-        coupon_code = data.get("coupon_code")
-        if coupon_code:
-            # Validate POS Coupon exists and is valid
-            if frappe.db.table_exists("POS Coupon"):
-                from pos_next.pos_next.doctype.pos_coupon.pos_coupon import check_coupon_code
-
-                coupon_result = check_coupon_code(
-                    coupon_code,
-                    customer=invoice_doc.customer,
-                    company=invoice_doc.company
-                )
+            if not coupon_result.get("valid"):
+                frappe.throw(_(coupon_result.get("msg", "Invalid coupon code")))
+
+            # Store coupon code on invoice for tracking
+            invoice_doc.coupon_code = coupon_code
 
-                if not coupon_result.get("valid"):
-                    frappe.throw(_(coupon_result.get("msg", "Invalid coupon code")))
+    return invoice_doc
 
-                # Store coupon code on invoice for tracking
-                invoice_doc.coupon_code = coupon_code
+
+@frappe.whitelist()
+def update_invoice(data):
+    """Create or update invoice draft (Step 1)."""
+    try:
+        invoice_doc = _build_invoice_doc(data)
 
         # Save as draft
         invoice_doc.flags.ignore_permissions = True
@@ -515,185 +819,599 @@ def update_invoice(data):
         raise
 
 
-@frappe.whitelist()
-def submit_invoice(invoice=None, data=None):
-    """Submit the invoice (Step 2)."""
+def _prepare_invoice_doc(invoice):
+    """
+    Create or update the draft for ``invoice``, validate stock and save it.
+
+    Returns:
+        Sales Invoice: the saved draft, ready to submit
+    """
+    pos_profile = invoice.get("pos_profile")
+    doctype = "Sales Invoice"
+
+    invoice_name = invoice.get("name")
+
+    # Get or create invoice
+    if not invoice_name or not frappe.db.exists(doctype, invoice_name):
+        created = update_invoice(json.dumps(invoice))
+        invoice_name = created.get("name")
+        invoice_doc = frappe.get_doc(doctype, invoice_name)
+    else:
+        invoice_doc = frappe.get_doc(doctype, invoice_name)
+        invoice_doc.update(invoice)
+
+    # Ensure update_stock is set
+    invoice_doc.update_stock = 1
+
+    # Copy accounting dimensions from POS Profile if not already set
+    if pos_profile and not invoice_doc.get("branch"):
+        try:
+            pos_profile_doc = frappe.get_cached_doc("POS Profile", pos_profile)
+            if hasattr(pos_profile_doc, "branch") and pos_profile_doc.branch:
+                invoice_doc.branch = pos_profile_doc.branch
+                # Also set branch on all items for GL entries
+                for item in invoice_doc.get("items", []):
+                    if not item.get("branch"):
+                        item.branch = pos_profile_doc.branch
+        except Exception:
+            pass  # Branch is optional, continue without it
+
+    # Set accounts for all payment methods before saving
+    _set_payment_accounts(invoice_doc, invoice_doc.company, overwrite=True)
+
+    # Auto-set batch numbers for returns
+    _auto_set_return_batches(invoice_doc)
+
+    # Validate stock availability only if POS Settings does not allow negative stock
+    if not _get_stock_settings(pos_profile).pos_allow_negative_stock:
+        _validate_stock_on_invoice(invoice_doc)
+
+    # Save before submit
+    invoice_doc.flags.ignore_permissions = True
+    frappe.flags.ignore_account_permission = True
+    invoice_doc.save()
+
+    return invoice_doc
+
+
+def _complete_invoice_submission(invoice_doc, invoice, data):
+    """
+    Submit a saved draft: coupon usage, submit (GL and stock ledger) and credit redemption.
+
+    Callers run this inside a savepoint and roll back to it on failure.
+    """
+    # Handle POS Coupon if coupon_code is provided
+    coupon_code = invoice.get("coupon_code") or data.get("coupon_code")
+    if coupon_code:
+        # Increment usage counter for POS Coupon
+        if frappe.db.table_exists("POS Coupon"):
+            try:
+                from pos_next.pos_next.doctype.pos_coupon.pos_coupon import increment_coupon_usage
+                increment_coupon_usage(coupon_code)
+            except Exception as e:
+                frappe.log_error(
+                    title="Failed to increment coupon usage",
+                    message=f"Coupon: {coupon_code}, Error: {str(e)}"
+                )
+
+    # Submit invoice
+    # Note: Negative stock handling is now done through the CustomSalesInvoice override
+    # which checks POS Settings in the update_stock_ledger method
+    invoice_doc.submit()
+
+    # Handle credit redemption after successful submission
+    customer_credit_dict = data.get("customer_credit_dict") or invoice.get("customer_credit_dict")
+    redeemed_customer_credit = data.get("redeemed_customer_credit") or invoice.get("redeemed_customer_credit")
+
+    if redeemed_customer_credit and customer_credit_dict:
+        try:
+            from pos_next.api.credit_sales import redeem_customer_credit
+            redeem_customer_credit(invoice_doc.name, customer_credit_dict)
+        except Exception as credit_error:
+            frappe.log_error(
+                title="Credit Redemption Error",
+                message=f"Invoice: {invoice_doc.name}, Error: {str(credit_error)}\n{frappe.get_traceback()}"
+            )
+            # Don't fail the entire transaction, just log the error
+            frappe.msgprint(
+                _("Invoice submitted successfully but credit redemption failed. Please contact administrator."),
+                alert=True,
+                indicator="orange"
+            )
+
+    # Return complete invoice details
+    return {
+        "name": invoice_doc.name,
+        "status": invoice_doc.docstatus,
+        "grand_total": invoice_doc.grand_total,
+        "total": invoice_doc.total,
+        "net_total": invoice_doc.net_total,
+        "outstanding_amount": invoice_doc.outstanding_amount,
+        "paid_amount": invoice_doc.paid_amount,
+        "change_amount": getattr(invoice_doc, "change_amount", 0),
+    }
+
+
+def _submit_invoice_doc(invoice, data):
+    """
+    Create or update the draft for ``invoice``, then validate, save and submit it.
+
+    Everything runs in a savepoint: a failure at any step rolls back to the state
+    before the draft was saved, so no draft, ledger rows or coupon usage persist
+    and no cancel/delete cleanup is needed.
+    """
+    savepoint = "pos_next_submit_invoice"
+    frappe.db.savepoint(savepoint)
+    callbacks = _get_callback_marks()
     try:
+        invoice_doc = _prepare_invoice_doc(invoice)
+        return _complete_invoice_submission(invoice_doc, invoice, data)
+    except Exception:
+        frappe.db.rollback(save_point=savepoint)
+        _discard_callbacks_since(callbacks)
+        raise
 
-        # Handle different calling conventions
-        if invoice is None:
-            if data:
-                # Check if data is a JSON string containing both params
-                data_parsed = json.loads(data) if isinstance(data, str) else data
-
-                # frappe-ui might send all params nested in data
-                if isinstance(data_parsed, dict):
-                    if "invoice" in data_parsed:
-                        invoice = data_parsed.get("invoice")
-                        data = data_parsed.get("data", {})
-                    elif "name" in data_parsed or "doctype" in data_parsed:
-                        # Data itself might be the invoice
-                        invoice = data_parsed
-                        data = {}
-                    else:
-                        frappe.throw(
-                            _("Missing invoice parameter. Received data: {0}").format(
-                                json.dumps(data_parsed, default=str)
-                            )
-                        )
+
+def _get_callback_marks():
+    """Return the number of queued commit/rollback callbacks, to pair with a savepoint."""
+    realtime_log = getattr(frappe.local, "_realtime_log", None)
+    return {
+        "callbacks": [
+            (manager, len(manager._functions))
+            for manager in (frappe.db.before_commit, frappe.db.after_commit, frappe.db.after_rollback)
+        ],
+        "realtime_log": None if realtime_log is None else len(realtime_log),
+    }
+
+
+def _discard_callbacks_since(marks):
+    """
+    Drop the callbacks and realtime events queued after ``marks`` were taken.
+
+    Rolling back to a savepoint keeps them, so realtime events and cache
+    invalidations of the rolled back invoice would fire on the next commit.
+    """
+    for manager, count in marks["callbacks"]:
+        while len(manager._functions) > count:
+            manager._functions.pop()
+
+    # publish_realtime(after_commit=True) buffers events in frappe.local and
+    # registers the flush callback only when it creates the buffer
+    if marks["realtime_log"] is None:
+        if hasattr(frappe.local, "_realtime_log"):
+            del frappe.local._realtime_log
+    else:
+        del frappe.local._realtime_log[marks["realtime_log"]:]
+
+
+def _parse_submit_args(invoice=None, data=None):
+    """Normalize the calling conventions of the submit endpoints to (invoice, data) dicts."""
+    # Handle different calling conventions
+    if invoice is None:
+        if data:
+            # Check if data is a JSON string containing both params
+            data_parsed = json.loads(data) if isinstance(data, str) else data
+
+            # frappe-ui might send all params nested in data
+            if isinstance(data_parsed, dict):
+                if "invoice" in data_parsed:
+                    invoice = data_parsed.get("invoice")
+                    data = data_parsed.get("data", {})
+                elif "name" in data_parsed or "doctype" in data_parsed:
+                    # Data itself might be the invoice
+                    invoice = data_parsed
+                    data = {}
                 else:
-                    frappe.throw(_("Missing invoice parameter"))
+                    frappe.throw(
+                        _("Missing invoice parameter. Received data: {0}").format(
+                            json.dumps(data_parsed, default=str)
+                        )
+                    )
             else:
-                frappe.throw(_("Both invoice and data parameters are missing"))
+                frappe.throw(_("Missing invoice parameter"))
+        else:
+            frappe.throw(_("Both invoice and data parameters are missing"))
 
-        # Parse JSON strings if needed
-        if isinstance(data, str):
-            data = json.loads(data) if data and data != "{}" else {}
-        if isinstance(invoice, str):
-            invoice = json.loads(invoice)
+    # Parse JSON strings if needed
+    if isinstance(data, str):
+        data = json.loads(data) if data and data != "{}" else {}
+    if isinstance(invoice, str):
+        invoice = json.loads(invoice)
 
-        pos_profile = invoice.get("pos_profile")
-        doctype = "Sales Invoice"
+    return invoice, data or {}
 
-        invoice_name = invoice.get("name")
 
-        # Get or create invoice
-        if not invoice_name or not frappe.db.exists(doctype, invoice_name):
-            created = update_invoice(json.dumps(invoice))
-            invoice_name = created.get("name")
-            invoice_doc = frappe.get_doc(doctype, invoice_name)
-        else:
-            invoice_doc = frappe.get_doc(doctype, invoice_name)
-            invoice_doc.update(invoice)
+@frappe.whitelist()
+def submit_invoice(invoice=None, data=None):
+    """Submit the invoice (Step 2)."""
+    try:
+        invoice, data = _parse_submit_args(invoice, data)
+        return _submit_invoice_doc(invoice, data)
+    except Exception as e:
+        frappe.log_error(frappe.get_traceback(), "Submit Invoice Error")
+        raise
 
-        # Ensure update_stock is set
-        invoice_doc.update_stock = 1
 
-        # Copy accounting dimensions from POS Profile if not already set
-        if pos_profile and not invoice_doc.get("branch"):
-            try:
-                pos_profile_doc = frappe.get_cached_doc("POS Profile", pos_profile)
-                if hasattr(pos_profile_doc, "branch") and pos_profile_doc.branch:
-                    invoice_doc.branch = pos_profile_doc.branch
-                    # Also set branch on all items for GL entries
-                    for item in invoice_doc.get("items", []):
-                        if not item.get("branch"):
-                            item.branch = pos_profile_doc.branch
-            except Exception:
-                pass  # Branch is optional, continue without it
+@frappe.whitelist()
+def validate_invoice(invoice=None, data=None):
+    """
+    Dry run of submit_invoice: build and validate the invoice without saving it.
 
-        # Set accounts for all payment methods before saving
-        for payment in invoice_doc.payments:
-            if payment.mode_of_payment:
-                account_info = get_payment_account(
-                    payment.mode_of_payment, invoice_doc.company
-                )
-                payment.account = account_info["account"]
-
-        # Handle POS Coupon if coupon_code is provided
-        coupon_code = invoice.get("coupon_code") or data.get("coupon_code")
-        if coupon_code:
-            # Increment usage counter for POS Coupon
-            if frappe.db.table_exists("POS Coupon"):
-                try:
-                    from pos_next.pos_next.doctype.pos_coupon.pos_coupon import increment_coupon_usage
-                    increment_coupon_usage(coupon_code)
-                except Exception as e:
-                    frappe.log_error(
-                        title="Failed to increment coupon usage",
-                        message=f"Coupon: {coupon_code}, Error: {str(e)}"
-                    )
+    Runs the same preparation, return-quantity and stock checks and the Sales
+    Invoice validate methods, inside a savepoint that is always rolled back.
 
-        # Auto-set batch numbers for returns
-        _auto_set_return_batches(invoice_doc)
+    Returns:
+        dict: ``valid``, ``error`` (first validation message), ``stock_errors``
+        and the computed totals
+    """
+    invoice, data = _parse_submit_args(invoice, data)
 
-        # Check if POS Settings allows negative stock
-        pos_settings_allow_negative = False
-        if pos_profile:
-            pos_settings_allow_negative = cint(
-                frappe.db.get_value(
-                    "POS Settings",
-                    {"pos_profile": pos_profile},
-                    "allow_negative_stock"
-                ) or 0
-            )
+    result = {"valid": True, "error": None, "stock_errors": []}
+    savepoint = "pos_next_validate_invoice"
+    frappe.db.savepoint(savepoint)
+    try:
+        invoice_doc = _build_invoice_doc(dict(invoice), dry_run=True)
+        invoice_doc.update_stock = 1
+        _auto_set_return_batches(invoice_doc)
 
-        # Validate stock availability only if negative stock is not allowed
-        if not pos_settings_allow_negative:
-            _validate_stock_on_invoice(invoice_doc)
+        if not _get_stock_settings(invoice_doc.pos_profile).pos_allow_negative_stock:
+            items_to_check = [d.as_dict() for d in invoice_doc.items if d.get("is_stock_item")]
+            items_to_check.extend([d.as_dict() for d in invoice_doc.get("packed_items") or []])
+            if _should_block(invoice_doc.pos_profile):
+                result["stock_errors"] = _collect_stock_errors(
+                    items_to_check, _get_default_warehouse(invoice_doc)
+                )
 
-        # Save before submit
         invoice_doc.flags.ignore_permissions = True
-        frappe.flags.ignore_account_permission = True
-        invoice_doc.save()
+        invoice_doc.run_method("validate")
+
+        result.update(
+            {
+                "grand_total": invoice_doc.grand_total,
+                "rounded_total": invoice_doc.rounded_total,
+                "total": invoice_doc.total,
+                "net_total": invoice_doc.net_total,
+                "total_taxes_and_charges": invoice_doc.total_taxes_and_charges,
+                "paid_amount": invoice_doc.paid_amount,
+                "change_amount": getattr(invoice_doc, "change_amount", 0),
+            }
+        )
+    except Exception as e:
+        result.update(valid=False, error=str(e))
+    finally:
+        frappe.db.rollback(save_point=savepoint)
+        frappe.clear_messages()
+
+    if result["stock_errors"]:
+        result["valid"] = False
+
+    return result
+
+
+def _find_invoice_by_idempotency_key(idempotency_key):
+    return frappe.db.get_value(
+        "Sales Invoice",
+        {"posa_idempotency_key": idempotency_key},
+        ["name", "docstatus", "grand_total", "outstanding_amount"],
+        as_dict=True,
+    )
+
+
+@frappe.whitelist()
+def submit_invoices_batch(invoices):
+    """
+    Submit a batch of invoices queued offline, each carrying a client-generated
+    idempotency key.
+
+    Every invoice runs in its own savepoint, so a failure rolls back only that
+    invoice, and is committed once submitted. The key is stored on the Sales
+    Invoice in the same transaction, so a key that is already on a submitted or
+    cancelled invoice is skipped and a retry after a timeout cannot post the
+    same sale twice. A draft holding the key is resumed with the new payload.
+
+    Args:
+        invoices: JSON string or list of {"idempotency_key", "invoice", "data"}
+
+    Returns:
+        list: One entry per input invoice, in input order, with ``status``
+        ("submitted", "duplicate", "cancelled" or "failed") and the invoice
+        ``name`` or ``error``
+    """
+    invoices = json.loads(invoices) if isinstance(invoices, str) else invoices or []
+
+    if len(invoices) > SUBMIT_BATCH_MAX_SIZE:
+        frappe.throw(
+            _("A batch can contain at most {0} invoices").format(SUBMIT_BATCH_MAX_SIZE)
+        )
+
+    results = []
+    for entry in invoices:
+        idempotency_key = cstr(entry.get("idempotency_key")).strip()
+        result = {"idempotency_key": idempotency_key}
+        results.append(result)
+
+        if not idempotency_key:
+            result.update(status="failed", error=_("Idempotency key is required"))
+            continue
+
+        invoice = entry.get("invoice")
+        invoice = json.loads(invoice) if isinstance(invoice, str) else dict(invoice or {})
+        data = entry.get("data")
+        data = json.loads(data) if isinstance(data, str) else data or {}
+        invoice["posa_idempotency_key"] = idempotency_key
+
+        existing = _find_invoice_by_idempotency_key(idempotency_key)
+        if existing and existing.docstatus == 1:
+            result.update(status="duplicate", **existing)
+            continue
+        if existing and existing.docstatus == 2:
+            # Posted once and voided in the back office: never post the sale again
+            result.update(status="cancelled", **existing)
+            continue
 
-        # Submit invoice with error handling
-        # Note: Negative stock handling is now done through the CustomSalesInvoice override
-        # which checks POS Settings in the update_stock_ledger method
         try:
-            invoice_doc.submit()
-        except Exception as submit_error:
-            # If submission fails, cleanup the invoice to prevent stock reservation issues
-            try:
-                # Reload to get current state
-                current_doc = frappe.get_doc("Sales Invoice", invoice_doc.name)
-
-                # If already submitted, must cancel before deleting
-                if current_doc.docstatus == 1:
-                    current_doc.flags.ignore_permissions = True
-                    current_doc.cancel()
-
-                # Now delete the cancelled/draft invoice
-                frappe.delete_doc(
-                    "Sales Invoice",
-                    invoice_doc.name,
-                    force=True,
-                    ignore_permissions=True,
-                )
-                frappe.db.commit()
-            except Exception:
-                # Silent fail on cleanup - don't hide original error
-                pass
+            if existing:
+                # Draft left by an earlier failed attempt: resume it with this payload
+                invoice["name"] = existing.name
+
+            # Rolls back to its own savepoint on failure
+            result.update(status="submitted", **_submit_invoice_doc(invoice, data))
+            frappe.db.commit()
+        except Exception as e:
+            frappe.clear_messages()
 
-            # Re-raise the original submission error
-            raise submit_error
+            # Another request posted the same key concurrently (unique constraint)
+            existing = _find_invoice_by_idempotency_key(idempotency_key)
+            if existing and existing.docstatus in (1, 2):
+                result.update(status="duplicate" if existing.docstatus == 1 else "cancelled", **existing)
+                continue
 
-        # Handle credit redemption after successful submission
-        customer_credit_dict = data.get("customer_credit_dict") or invoice.get("customer_credit_dict")
-        redeemed_customer_credit = data.get("redeemed_customer_credit") or invoice.get("redeemed_customer_credit")
+            frappe.log_error(
+                title="Batch Invoice Submission Error",
+                message=f"Idempotency key: {idempotency_key}\n{frappe.get_traceback()}",
+            )
+            result.update(status="failed", error=str(e))
 
-        if redeemed_customer_credit and customer_credit_dict:
-            try:
-                from pos_next.api.credit_sales import redeem_customer_credit
-                redeem_customer_credit(invoice_doc.name, customer_credit_dict)
-            except Exception as credit_error:
-                frappe.log_error(
-                    title="Credit Redemption Error",
-                    message=f"Invoice: {invoice_doc.name}, Error: {str(credit_error)}\n{frappe.get_traceback()}"
-                )
-                # Don't fail the entire transaction, just log the error
-                frappe.msgprint(
-                    _("Invoice submitted successfully but credit redemption failed. Please contact administrator."),
-                    alert=True,
-                    indicator="orange"
-                )
+    return results
 
-        # Return complete invoice details
-        return {
+
+# ==========================================
+# Background Submission
+# ==========================================
+
+
+def _receipt_cache_key(receipt_token):
+    return f"pos_next:invoice_receipt:{receipt_token}"
+
+
+def _draft_receipt_cache_key(invoice_name):
+    return f"pos_next:invoice_draft_receipt:{invoice_name}"
+
+
+def _submission_job_id(invoice_name):
+    return f"pos_next_submit_invoice::{invoice_name}"
+
+
+def _get_pending_receipt(invoice_name):
+    """
+    Return the receipt of ``invoice_name``'s background submission while its job
+    is queued or running, or once it has posted the invoice.
+    """
+    if not invoice_name:
+        return None
+
+    receipt_token = frappe.cache().get_value(_draft_receipt_cache_key(invoice_name))
+    receipt = receipt_token and frappe.cache().get_value(_receipt_cache_key(receipt_token))
+    if not receipt:
+        return None
+
+    if receipt.get("status") in ("submitted", "already_submitted"):
+        return receipt
+
+    if receipt.get("status") == "queued" and is_job_enqueued(_submission_job_id(invoice_name)):
+        return receipt
+
+    return None
+
+
+def _queued_stock_fields(invoice_doc):
+    """Return {field: stock qty} held by an invoice, per item and per batch."""
+    fields = {}
+    rows = [d for d in invoice_doc.items if d.get("is_stock_item")]
+    rows.extend(invoice_doc.get("packed_items") or [])
+
+    for d in rows:
+        qty = flt(d.get("stock_qty") or (flt(d.get("qty")) * flt(d.get("conversion_factor") or 1)))
+        if qty <= 0 or not d.get("item_code") or not d.get("warehouse"):
+            continue
+
+        for field in {
+            f"{d.warehouse}::{d.item_code}::",
+            f"{d.warehouse}::{d.item_code}::{d.get('batch_no') or ''}",
+        }:
+            fields[field] = fields.get(field, 0) + qty
+
+    return fields
+
+
+def _update_queued_stock(fields, sign):
+    """Add (sign=1) or release (sign=-1) stock held by invoices waiting in the queue."""
+    if not fields:
+        return
+
+    try:
+        key = frappe.cache().make_key(QUEUED_STOCK_CACHE_KEY)
+        pipe = frappe.cache().pipeline()
+        for field, qty in fields.items():
+            pipe.hincrbyfloat(key, field, sign * qty)
+        # Safety net against reservations left behind by a lost worker
+        pipe.expire(key, QUEUED_STOCK_TTL)
+        pipe.execute()
+    except Exception:
+        frappe.log_error(frappe.get_traceback(), "POS Queued Stock Error")
+
+
+def _get_queued_stock(keys):
+    """
+    Return {(item_code, warehouse, batch_no): qty} held by queued invoices that
+    are not yet posted to the stock ledger.
+    """
+    keys = list(keys)
+    if not keys:
+        return {}
+
+    try:
+        # Counters are raw floats, so bypass RedisWrapper's pickling hmget
+        pipe = frappe.cache().pipeline()
+        pipe.hmget(
+            frappe.cache().make_key(QUEUED_STOCK_CACHE_KEY),
+            [f"{warehouse}::{item_code}::{batch_no or ''}" for item_code, warehouse, batch_no in keys],
+        )
+        values = pipe.execute()[0]
+    except Exception:
+        return {}
+
+    return {key: max(flt(value), 0) for key, value in zip(keys, values) if value is not None}
+
+
+def _publish_submission_result(receipt, user):
+    frappe.cache().set_value(
+        _receipt_cache_key(receipt["receipt_token"]), receipt, expires_in_sec=RECEIPT_TTL
+    )
+    frappe.publish_realtime(
+        event="pos_invoice_submission",
+        message=receipt,
+        user=user,
+    )
+
+
+@frappe.whitelist()
+def submit_invoice_async(invoice=None, data=None):
+    """
+    Validate and save the invoice, hold its stock, and submit it in a background job.
+
+    Posting (submit, GL and stock ledger, coupon usage, credit redemption) runs in
+    an RQ worker, whose result is pushed to the user over the
+    ``pos_invoice_submission`` realtime event and can also be polled with
+    get_invoice_submission_status. Resending a draft whose job is still queued
+    or running returns that job's receipt. Falls back to submit_invoice when
+    background submissions are disabled in POS Settings.
+
+    Returns:
+        dict: invoice summary with ``status`` "queued" and a ``receipt_token``
+    """
+    try:
+        invoice, data = _parse_submit_args(invoice, data)
+
+        pos_profile = invoice.get("pos_profile")
+        if not pos_profile or not cint(
+            frappe.db.get_value(
+                "POS Settings",
+                {"pos_profile": pos_profile, "enabled": 1},
+                "allow_submissions_in_background_job",
+            )
+        ):
+            return _submit_invoice_doc(invoice, data)
+
+        # A resend of a draft whose job is still live waits on the same receipt,
+        # instead of holding its stock a second time
+        receipt = _get_pending_receipt(invoice.get("name"))
+        if receipt:
+            return receipt
+
+        invoice_doc = _prepare_invoice_doc(invoice)
+
+        receipt_token = frappe.generate_hash(length=20)
+        queued_stock = _queued_stock_fields(invoice_doc)
+        receipt = {
+            "receipt_token": receipt_token,
             "name": invoice_doc.name,
-            "status": invoice_doc.docstatus,
+            "status": "queued",
             "grand_total": invoice_doc.grand_total,
             "total": invoice_doc.total,
             "net_total": invoice_doc.net_total,
-            "outstanding_amount": invoice_doc.outstanding_amount,
             "paid_amount": invoice_doc.paid_amount,
             "change_amount": getattr(invoice_doc, "change_amount", 0),
         }
+        frappe.cache().set_value(_receipt_cache_key(receipt_token), receipt, expires_in_sec=RECEIPT_TTL)
+        frappe.cache().set_value(
+            _draft_receipt_cache_key(invoice_doc.name), receipt_token, expires_in_sec=RECEIPT_TTL
+        )
+
+        # Hold the stock once the draft is committed, until the job posts it
+        frappe.db.after_commit.add(lambda: _update_queued_stock(queued_stock, 1))
+
+        frappe.enqueue(
+            "pos_next.api.invoices.process_queued_invoice",
+            queue="short",
+            job_id=_submission_job_id(invoice_doc.name),
+            deduplicate=True,
+            enqueue_after_commit=True,
+            invoice_name=invoice_doc.name,
+            invoice=invoice,
+            data=data,
+            receipt_token=receipt_token,
+            queued_stock=queued_stock,
+        )
+
+        return receipt
     except Exception as e:
-        frappe.log_error(frappe.get_traceback(), "Submit Invoice Error")
+        frappe.log_error(frappe.get_traceback(), "Submit Invoice Async Error")
         raise
 
 
+def process_queued_invoice(invoice_name, invoice, data, receipt_token, queued_stock=None):
+    """
+    Background job: submit a draft saved by submit_invoice_async and report the result.
+
+    The receipt is "submitted" only when this job submitted the invoice. A draft
+    that fails to submit is kept, so the cashier can fix and retry it.
+    """
+    receipt = frappe.cache().get_value(_receipt_cache_key(receipt_token)) or {
+        "receipt_token": receipt_token,
+        "name": invoice_name,
+    }
+
+    savepoint = "pos_next_queued_invoice"
+    frappe.db.savepoint(savepoint)
+    callbacks = _get_callback_marks()
+    try:
+        invoice_doc = frappe.get_doc("Sales Invoice", invoice_name)
+        if invoice_doc.docstatus == 0:
+            receipt.update(_complete_invoice_submission(invoice_doc, invoice, data))
+            frappe.db.commit()
+            receipt["status"] = "submitted"
+        elif invoice_doc.docstatus == 1:
+            # Submitted by another request or an earlier run of this job
+            receipt.update(status="already_submitted", grand_total=invoice_doc.grand_total)
+        else:
+            receipt.update(
+                status="failed", error=_("Invoice {0} has been cancelled").format(invoice_name)
+            )
+    except Exception as e:
+        frappe.db.rollback(save_point=savepoint)
+        _discard_callbacks_since(callbacks)
+        frappe.log_error(
+            title="Queued Invoice Submission Error",
+            message=f"Invoice: {invoice_name}\n{frappe.get_traceback()}",
+        )
+        receipt.update(status="failed", error=str(e))
+    finally:
+        _update_queued_stock(queued_stock, -1)
+
+    _publish_submission_result(receipt, frappe.session.user)
+
+
+@frappe.whitelist()
+def get_invoice_submission_status(receipt_token):
+    """Return the receipt of a background submission (fallback when the realtime event is missed)."""
+    receipt = frappe.cache().get_value(_receipt_cache_key(receipt_token))
+    if not receipt:
+        frappe.throw(_("Receipt {0} not found or expired").format(receipt_token))
+
+    return receipt
+
+
 # ==========================================
 # Invoice History Management
 # ==========================================
@@ -711,17 +1429,7 @@ def get_invoices(pos_profile, limit=100):
 	Returns:
 		List of invoices with details
 	"""
-	if not pos_profile:
-		frappe.throw(_("POS Profile is required"))
-
-	# Check if user has access to this POS Profile
-	has_access = frappe.db.exists(
-		"POS Profile User",
-		{"parent": pos_profile, "user": frappe.session.user}
-	)
-
-	if not has_access and not frappe.has_permission("Sales Invoice", "read"):
-		frappe.throw(_("You don't have access to this POS Profile"))
+	_check_pos_profile_access(pos_profile)
 
 	# Query for invoices
 	invoices = frappe.db.sql("""
@@ -753,29 +1461,194 @@ def get_invoices(pos_profile, limit=100):
 		"limit": limit
 	}, as_dict=True)
 
-	# Load items for each invoice for filtering purposes
+	# Load items for all invoices at once for filtering purposes
+	items_by_invoice = _get_items_by_invoice(
+		[invoice.name for invoice in invoices],
+		["item_code", "item_name", "qty", "rate", "amount"],
+	)
 	for invoice in invoices:
-		items = frappe.db.sql("""
-			SELECT
-				item_code,
-				item_name,
-				qty,
-				rate,
-				amount
-			FROM
-				`tabSales Invoice Item`
-			WHERE
-				parent = %(invoice_name)s
-			ORDER BY
-				idx
-		""", {
-			"invoice_name": invoice.name
-		}, as_dict=True)
-		invoice.items = items
+		invoice.items = items_by_invoice.get(invoice.name, [])
 
 	return invoices
 
 
+def _check_pos_profile_access(pos_profile):
+	"""Allow POS Profile users and anyone who can read Sales Invoices."""
+	if not pos_profile:
+		frappe.throw(_("POS Profile is required"))
+
+	# Check if user has access to this POS Profile
+	has_access = frappe.db.exists(
+		"POS Profile User",
+		{"parent": pos_profile, "user": frappe.session.user}
+	)
+
+	if not has_access and not frappe.has_permission("Sales Invoice", "read"):
+		frappe.throw(_("You don't have access to this POS Profile"))
+
+
+def _parse_fields(fields, allowed, default):
+	"""Validate a requested column projection against an allowlist."""
+	if isinstance(fields, str):
+		fields = json.loads(fields) if fields.startswith("[") else fields.split(",")
+	fields = [cstr(field).strip() for field in fields or [] if cstr(field).strip()]
+	if not fields:
+		return list(default)
+
+	invalid = [field for field in fields if field not in allowed]
+	if invalid:
+		frappe.throw(_("Fields not allowed: {0}").format(", ".join(invalid)))
+
+	return list(dict.fromkeys(fields))
+
+
+def _get_items_by_invoice(invoice_names, fields):
+	"""Return {invoice name: [item rows]} for many invoices in one query."""
+	if not invoice_names:
+		return {}
+
+	columns = ", ".join(f"`{field}`" for field in fields)
+	rows = frappe.db.sql(
+		f"""
+		SELECT parent, {columns}
+		FROM `tabSales Invoice Item`
+		WHERE parent IN %s AND parenttype = 'Sales Invoice'
+		ORDER BY parent, idx
+		""",
+		[list(invoice_names)],
+		as_dict=True,
+	)
+
+	items_by_invoice = {}
+	for row in rows:
+		items_by_invoice.setdefault(row.pop("parent"), []).append(row)
+
+	return items_by_invoice
+
+
+@frappe.whitelist()
+def get_invoice_history(
+	pos_profile,
+	fields=None,
+	after=None,
+	limit=50,
+	pos_opening_shift=None,
+	cashier=None,
+	include_drafts=0,
+):
+	"""
+	Page through the invoice history of a POS Profile without item rows.
+
+	Pages are keyset-paginated on (posting_date, posting_time, name), newest
+	first, so every page costs the same; items are loaded on expand through
+	get_invoice_items.
+
+	Args:
+		pos_profile: POS Profile name
+		fields: Columns to return (list or comma separated), from INVOICE_HISTORY_FIELDS
+		after: Page token from the previous page; empty for the first page
+		limit: Page size (max 500)
+		pos_opening_shift: Only invoices of this shift
+		cashier: Only invoices created by this user
+		include_drafts: Include draft invoices
+
+	Returns:
+		dict: ``invoices``, ``after`` (token for the next page or None) and ``has_more``
+	"""
+	from pos_next.api.items import _decode_page_token, _encode_page_token
+
+	_check_pos_profile_access(pos_profile)
+
+	fields = _parse_fields(fields, INVOICE_HISTORY_FIELDS, INVOICE_HISTORY_DEFAULT_FIELDS)
+	limit = min(max(cint(limit) or 50, 1), 500)
+
+	# The keyset columns are always selected
+	select_fields = list(dict.fromkeys([*fields, "posting_date", "posting_time", "name"]))
+	columns = ", ".join(f"`{field}`" for field in select_fields)
+
+	conditions = ["pos_profile = %(pos_profile)s", "is_pos = 1"]
+	params = {"pos_profile": pos_profile, "limit": limit + 1}
+
+	conditions.append("docstatus IN (0, 1)" if cint(include_drafts) else "docstatus = 1")
+
+	if pos_opening_shift:
+		conditions.append("posa_pos_opening_shift = %(pos_opening_shift)s")
+		params["pos_opening_shift"] = pos_opening_shift
+
+	if cashier:
+		conditions.append("owner = %(cashier)s")
+		params["cashier"] = cashier
+
+	boundary = _decode_page_token(after)
+	if boundary:
+		params["after_date"], params["after_time"], params["after_name"] = boundary
+		conditions.append(
+			"""(posting_date < %(after_date)s
+			OR (posting_date = %(after_date)s AND posting_time < %(after_time)s)
+			OR (posting_date = %(after_date)s AND posting_time = %(after_time)s AND name < %(after_name)s))"""
+		)
+
+	invoices = frappe.db.sql(
+		f"""
+		SELECT {columns}
+		FROM `tabSales Invoice`
+		WHERE {" AND ".join(conditions)}
+		ORDER BY posting_date DESC, posting_time DESC, name DESC
+		LIMIT %(limit)s
+		""",
+		params,
+		as_dict=True,
+	)
+
+	has_more = len(invoices) > limit
+	invoices = invoices[:limit]
+
+	next_token = None
+	if has_more:
+		last = invoices[-1]
+		next_token = _encode_page_token([last.posting_date, last.posting_time, last.name])
+
+	for invoice in invoices:
+		for field in ("posting_date", "posting_time", "name"):
+			if field not in fields:
+				invoice.pop(field)
+
+	return {"invoices": invoices, "after": next_token, "has_more": has_more}
+
+
+@frappe.whitelist()
+def get_invoice_items(invoices, fields=None):
+	"""
+	Load the item rows of one or more invoices from the history (expand on demand).
+
+	Args:
+		invoices: Invoice name, or JSON string / list of names
+		fields: Item columns to return, from INVOICE_HISTORY_ITEM_FIELDS
+
+	Returns:
+		dict: invoice name -> list of item rows
+	"""
+	if isinstance(invoices, str):
+		invoices = json.loads(invoices) if invoices.startswith("[") else [invoices]
+	invoices = list(dict.fromkeys(invoices or []))
+	if not invoices:
+		return {}
+
+	fields = _parse_fields(fields, INVOICE_HISTORY_ITEM_FIELDS, INVOICE_HISTORY_ITEM_DEFAULT_FIELDS)
+
+	profiles = frappe.get_all(
+		"Sales Invoice",
+		filters={"name": ["in", invoices]},
+		fields=["pos_profile"],
+		distinct=True,
+		pluck="pos_profile",
+	)
+	for pos_profile in profiles:
+		_check_pos_profile_access(pos_profile)
+
+	return _get_items_by_invoice(invoices, fields)
+
+
 # ==========================================
 # Draft Invoice Management
 # ==========================================
@@ -829,50 +1702,20 @@ def delete_invoice(invoice):
 @frappe.whitelist()
 def cleanup_old_drafts(pos_profile=None, max_age_hours=24):
     """
-    Clean up old draft invoices to prevent stock reservation issues.
-    Deletes drafts older than max_age_hours (default 24 hours).
+    Queue cleanup of old draft invoices to prevent stock reservation issues.
+    Drafts older than max_age_hours (default 24 hours) are deleted in batches
+    by a background job (see pos_next.tasks.draft_cleanup).
     """
-    from datetime import datetime, timedelta
-
-    doctype = "Sales Invoice"
-    cutoff_time = datetime.now() - timedelta(hours=int(max_age_hours))
-
-    filters = {
-        "docstatus": 0,  # Draft only
-        "modified": ["<", cutoff_time.strftime("%Y-%m-%d %H:%M:%S")],
-    }
-
-    # Optionally filter by POS profile
-    if pos_profile:
-        filters["pos_profile"] = pos_profile
-
-    # Get old drafts
-    old_drafts = frappe.get_all(
-        doctype,
-        filters=filters,
-        fields=["name", "modified"],
-        limit_page_length=100,  # Safety limit
+    job_id = enqueue_draft_cleanup(
+        "Sales Invoice",
+        pos_profile=pos_profile,
+        max_age_hours=cint(max_age_hours),
     )
 
-    deleted_count = 0
-    for draft in old_drafts:
-        try:
-            frappe.delete_doc(
-                doctype, draft["name"], force=True, ignore_permissions=True
-            )
-            deleted_count += 1
-        except Exception as e:
-            frappe.log_error(
-                f"Failed to delete draft {draft['name']}: {str(e)}",
-                "Draft Cleanup Error",
-            )
-
-    if deleted_count > 0:
-        frappe.db.commit()
-
     return {
-        "deleted": deleted_count,
-        "message": f"Cleaned up {deleted_count} old draft invoices",
+        "queued": True,
+        "job_id": job_id,
+        "message": _("Cleanup of old draft invoices has been queued"),
     }
 
 
@@ -884,9 +1727,7 @@ def cleanup_old_drafts(pos_profile=None, max_age_hours=24):
 @frappe.whitelist()
 def get_returnable_invoices(limit=50):
     """Get list of invoices that have items available for return."""
-    # Performance: Use SQL aggregation to calculate returned quantities in one query
-    # This eliminates N+1 queries by joining return invoices and aggregating in the database
-
+    # Returned quantities come from the POS Returned Qty ledger, one row per invoice line
     query = """
         SELECT
             si.name,
@@ -895,15 +1736,11 @@ def get_returnable_invoices(limit=50):
             si.posting_date,
             si.grand_total,
             si.status,
-            COALESCE(SUM(CASE WHEN ret_item.qty IS NOT NULL THEN ABS(ret_item.qty) ELSE 0 END), 0) as total_returned_qty,
-            COALESCE(SUM(CASE WHEN si_item.qty IS NOT NULL THEN si_item.qty ELSE 0 END), 0) as total_original_qty
+            COALESCE(SUM(rq.returned_qty), 0) as total_returned_qty,
+            COALESCE(SUM(si_item.qty), 0) as total_original_qty
         FROM `tabSales Invoice` si
         LEFT JOIN `tabSales Invoice Item` si_item ON si_item.parent = si.name
-        LEFT JOIN `tabSales Invoice` ret_si ON ret_si.return_against = si.name
-            AND ret_si.docstatus = 1
-            AND ret_si.is_return = 1
-        LEFT JOIN `tabSales Invoice Item` ret_item ON ret_item.parent = ret_si.name
-            AND (ret_item.sales_invoice_item = si_item.name OR ret_item.item_code = si_item.item_code)
+        LEFT JOIN `tabPOS Returned Qty` rq ON rq.name = si_item.name
         WHERE si.docstatus = 1
             AND si.is_return = 0
             AND si.is_pos = 1
@@ -927,22 +1764,8 @@ def get_invoice_for_return(invoice_name):
     # Get the original invoice
     invoice = frappe.get_doc("Sales Invoice", invoice_name)
 
-    # Performance: Use SQL aggregation to calculate returned quantities in one query
-    # This eliminates N+1 queries by aggregating all return items at once
-    returned_qty_query = """
-        SELECT
-            COALESCE(ret_item.sales_invoice_item, ret_item.item_code) as key_field,
-            SUM(ABS(ret_item.qty)) as returned_qty
-        FROM `tabSales Invoice` ret_si
-        INNER JOIN `tabSales Invoice Item` ret_item ON ret_item.parent = ret_si.name
-        WHERE ret_si.return_against = %s
-            AND ret_si.docstatus = 1
-            AND ret_si.is_return = 1
-        GROUP BY key_field
-    """
-
-    returned_qty_results = frappe.db.sql(returned_qty_query, [invoice_name], as_dict=1)
-    returned_qty = {row["key_field"]: row["returned_qty"] for row in returned_qty_results}
+    # Returned quantities per invoice line from the POS Returned Qty ledger
+    returned_qty = get_returned_qty([invoice_name]).get(invoice_name, {})
 
     # Calculate remaining quantities
     invoice_dict = invoice.as_dict()
@@ -978,7 +1801,23 @@ def search_invoices_for_return(
     page=1,
     doctype="Sales Invoice",
 ):
-    """Search for invoices that can be returned with pagination."""
+    """
+    Search for invoices that can be returned with pagination.
+
+    A page costs a fixed number of queries: one for invoice headers and one for
+    their item rows, with the remaining returnable qty read from the POS
+    Returned Qty ledger.
+    ``estimated_total`` comes from the query plan rather than a COUNT (None when
+    no estimate is available), ``has_more`` from fetching one extra row, and
+    customer criteria are prefix matches on indexed columns.
+
+    Invoices carry the header and item columns in RETURN_SEARCH_HEADER_FIELDS and
+    RETURN_SEARCH_ITEM_FIELDS, with items reduced to the quantities left to
+    return. The ledger only tracks Sales Invoices, so other doctypes are rejected.
+    """
+    if doctype != "Sales Invoice":
+        frappe.throw(_("Returns can only be searched on Sales Invoices, not {0}").format(doctype))
+
     # Start with base filters
     filters = {
         "docstatus": 1,
@@ -989,10 +1828,7 @@ def search_invoices_for_return(
         filters["company"] = company
 
     # Convert page to integer
-    if page and isinstance(page, str):
-        page = int(page)
-    else:
-        page = 1
+    page = max(cint(page), 1)
 
     # Items per page
     page_length = 100
@@ -1023,125 +1859,127 @@ def search_invoices_for_return(
             filters["grand_total"] = ["<=", float(max_amount)]
 
     # If any customer search criteria is provided, find matching customers
-    customer_ids = []
     if customer_name or customer_id or mobile_no:
-        conditions = []
-        params = {}
-
-        if customer_name:
-            conditions.append("customer_name LIKE %(customer_name)s")
-            params["customer_name"] = f"%{customer_name}%"
-
-        if customer_id:
-            conditions.append("name LIKE %(customer_id)s")
-            params["customer_id"] = f"%{customer_id}%"
-
-        if mobile_no:
-            conditions.append("mobile_no LIKE %(mobile_no)s")
-            params["mobile_no"] = f"%{mobile_no}%"
-
-        where_clause = " OR ".join(conditions)
-        customer_query = f"""
-			SELECT name
-			FROM `tabCustomer`
-			WHERE {where_clause}
-			LIMIT 100
-		"""
-
-        customers = frappe.db.sql(customer_query, params, as_dict=True)
-        customer_ids = [c.name for c in customers]
-
-        if customer_ids:
-            filters["customer"] = ["in", customer_ids]
-        elif any([customer_name, customer_id, mobile_no]):
-            return {"invoices": [], "has_more": False}
-
-    # Count total invoices
-    total_count_query = frappe.get_list(
-        doctype,
-        filters=filters,
-        fields=["count(name) as total_count"],
-        as_list=False,
-    )
-    total_count = total_count_query[0].total_count if total_count_query else 0
+        customer_ids = _search_return_customers(customer_name, customer_id, mobile_no)
+        if not customer_ids:
+            return {"invoices": [], "has_more": False, "estimated_total": 0}
+        filters["customer"] = ["in", customer_ids]
 
-    # Get invoices with pagination
-    invoices_list = frappe.get_list(
+    # Headers for the page (one extra row tells whether there are more)
+    invoices = frappe.get_list(
         doctype,
         filters=filters,
-        fields=["name"],
+        fields=RETURN_SEARCH_HEADER_FIELDS,
         limit_start=start,
-        limit_page_length=page_length,
+        limit_page_length=page_length + 1,
         order_by="posting_date desc, name desc",
     )
 
-    if not invoices_list:
-        return {"invoices": [], "has_more": False}
+    has_more = len(invoices) > page_length
+    invoices = invoices[:page_length]
 
-    # Performance: Batch query all returned quantities for all invoices at once
-    # This eliminates N+1 queries by aggregating return data in a single SQL call
-    invoice_names = [inv["name"] for inv in invoices_list]
+    if not invoices:
+        return {
+            "invoices": [],
+            "has_more": False,
+            "estimated_total": _estimate_invoice_count(doctype, filters),
+        }
 
-    returned_qty_query = """
+    # Item rows with the remaining returnable qty from the ledger
+    item_columns = ", ".join(f"sii.`{field}`" for field in RETURN_SEARCH_ITEM_FIELDS)
+    item_rows = frappe.db.sql(
+        f"""
         SELECT
-            ret_si.return_against as invoice_name,
-            ret_item.item_code,
-            SUM(ABS(ret_item.qty)) as returned_qty
-        FROM `tabSales Invoice` ret_si
-        INNER JOIN `tabSales Invoice Item` ret_item ON ret_item.parent = ret_si.name
-        WHERE ret_si.return_against IN %s
-            AND ret_si.docstatus = 1
-            AND ret_si.is_return = 1
-        GROUP BY ret_si.return_against, ret_item.item_code
-    """
-
-    returned_qty_results = frappe.db.sql(returned_qty_query, [invoice_names], as_dict=1)
+            sii.parent,
+            {item_columns},
+            sii.qty - IFNULL(rq.returned_qty, 0) AS remaining_qty
+        FROM `tabSales Invoice Item` sii
+        LEFT JOIN `tabPOS Returned Qty` rq ON rq.name = sii.name
+        WHERE sii.parent IN %(invoices)s
+            AND sii.parenttype = 'Sales Invoice'
+            AND sii.qty - IFNULL(rq.returned_qty, 0) > 0
+        ORDER BY sii.parent, sii.idx
+        """,
+        {"invoices": [invoice.name for invoice in invoices]},
+        as_dict=True,
+    )
 
-    # Build a map of invoice_name -> {item_code: returned_qty}
-    returned_qty_map = {}
-    for row in returned_qty_results:
-        inv_name = row["invoice_name"]
-        if inv_name not in returned_qty_map:
-            returned_qty_map[inv_name] = {}
-        returned_qty_map[inv_name][row["item_code"]] = row["returned_qty"]
+    items_by_invoice = {}
+    for item in item_rows:
+        remaining_qty = flt(item.pop("remaining_qty"))
+        if remaining_qty != flt(item.qty):
+            # Partially returned: offer only what is left
+            if item.get("stock_qty"):
+                item["stock_qty"] = (
+                    item.stock_qty / item.qty * remaining_qty if item.qty else remaining_qty
+                )
+            item["qty"] = remaining_qty
+            item["amount"] = remaining_qty * flt(item.rate)
+        items_by_invoice.setdefault(item.pop("parent"), []).append(item)
 
-    # Process and return results
+    # Invoices with nothing left to return are skipped
     data = []
+    for invoice in invoices:
+        items = items_by_invoice.get(invoice.name)
+        if not items:
+            continue
 
-    for invoice in invoices_list:
-        invoice_doc = frappe.get_doc(doctype, invoice.name)
-        returned_qty = returned_qty_map.get(invoice.name, {})
-
-        if returned_qty:
-            # Filter items with remaining qty
-            filtered_items = []
-            for item in invoice_doc.items:
-                already_returned = returned_qty.get(item.item_code, 0)
-                remaining_qty = item.qty - already_returned
-
-                if remaining_qty > 0:
-                    new_item = item.as_dict().copy()
-                    new_item["qty"] = remaining_qty
-                    new_item["amount"] = remaining_qty * item.rate
-                    if item.get("stock_qty"):
-                        new_item["stock_qty"] = (
-                            item.stock_qty / item.qty * remaining_qty
-                            if item.qty
-                            else remaining_qty
-                        )
-                    filtered_items.append(frappe._dict(new_item))
+        invoice["doctype"] = doctype
+        invoice["items"] = items
+        data.append(invoice)
 
-            if filtered_items:
-                filtered_invoice = frappe.get_doc(doctype, invoice.name)
-                filtered_invoice.items = filtered_items
-                data.append(filtered_invoice)
-        else:
-            data.append(invoice_doc)
+    return {
+        "invoices": data,
+        "has_more": has_more,
+        "estimated_total": _estimate_invoice_count(doctype, filters),
+    }
+
+
+def _search_return_customers(customer_name=None, customer_id=None, mobile_no=None):
+    """
+    Find customers by name, ID or mobile number prefix.
+
+    Each criterion is a prefix match on its own indexed column (see
+    pos_next.install.setup_customer_search_indexes), so lookups do not scan
+    the Customer table.
+    """
+    queries = []
+    params = {}
+
+    if customer_name:
+        queries.append("SELECT name FROM `tabCustomer` WHERE customer_name LIKE %(customer_name)s")
+        params["customer_name"] = f"{customer_name}%"
+
+    if customer_id:
+        queries.append("SELECT name FROM `tabCustomer` WHERE name LIKE %(customer_id)s")
+        params["customer_id"] = f"{customer_id}%"
+
+    if mobile_no:
+        queries.append("SELECT name FROM `tabCustomer` WHERE mobile_no LIKE %(mobile_no)s")
+        params["mobile_no"] = f"{mobile_no}%"
+
+    customers = frappe.db.sql(
+        f"""
+        SELECT name FROM ({" UNION ".join(queries)}) matches
+        LIMIT 100
+        """,
+        params,
+        as_dict=True,
+    )
+    return [c.name for c in customers]
 
-    # Check if there are more results
-    has_more = (start + page_length) < total_count
 
-    return {"invoices": data, "has_more": has_more}
+def _estimate_invoice_count(doctype, filters):
+    """
+    Estimated number of matching invoices, read from the query plan instead of a
+    COUNT. Returns None when the plan gives no estimate.
+    """
+    try:
+        query = frappe.get_list(doctype, filters=filters, fields=["name"], run=0)
+        plan = frappe.db.sql(f"EXPLAIN {query}", as_dict=True)
+        return cint(plan[0].get("rows")) if plan else None
+    except Exception:
+        return None
 
 
 # ==========================================
@@ -1186,12 +2024,23 @@ def apply_offers(invoice_data, selected_offers=None):
             # Either no POS profile supplied or ERPNext promotional engine unavailable
             return {"items": items}
 
-        profile = frappe.get_doc("POS Profile", invoice.get("pos_profile"))
+        profile = frappe.get_cached_doc("POS Profile", invoice.get("pos_profile"))
 
         pricing_items = []
         index_map = []
         prepared_items = [frappe._dict(row) for row in items]
 
+        # Item master data for all lines in one query
+        item_codes = list({item.get("item_code") for item in prepared_items if item.get("item_code")})
+        item_details = {
+            row.name: row
+            for row in frappe.get_all(
+                "Item",
+                filters={"name": ["in", item_codes]},
+                fields=["name", "item_name", "item_group", "brand", "stock_uom", "variant_of"],
+            )
+        } if item_codes else {}
+
         for idx, item in enumerate(prepared_items):
             item_code = item.get("item_code")
             qty = flt(item.get("qty") or item.get("quantity") or 0)
@@ -1199,15 +2048,7 @@ def apply_offers(invoice_data, selected_offers=None):
             if not item_code or qty <= 0:
                 continue
 
-            try:
-                cached = frappe.get_cached_value(
-                    "Item",
-                    item_code,
-                    ["item_name", "item_group", "brand", "stock_uom"],
-                    as_dict=1,
-                )
-            except frappe.DoesNotExistError:
-                cached = None
+            cached = item_details.get(item_code)
 
             conversion_factor = flt(item.get("conversion_factor") or 1) or 1
             price_list_rate = flt(item.get("price_list_rate") or item.get("rate") or 0)
@@ -1225,6 +2066,7 @@ def apply_offers(invoice_data, selected_offers=None):
                             cached.item_group if cached else item.get("item_group")
                         ),
                         "brand": (cached.brand if cached else item.get("brand")),
+                        "variant_of": cached.variant_of if cached else None,
                         "qty": qty,
                         "stock_qty": qty * conversion_factor,
                         "conversion_factor": conversion_factor,
@@ -1304,43 +2146,41 @@ def apply_offers(invoice_data, selected_offers=None):
             }
         )
 
-        # Call ERPNext pricing engine - it handles all conflicts based on priority
-        pricing_results = erpnext_apply_pricing_rule(pricing_args) or []
+        # Evaluate with the compiled offer engine; ERPNext's pricing engine is the
+        # fallback for rules it does not model and resolves conflicts by priority
+        compiled_rules = None
+        evaluated = offer_engine.apply_pricing_rules(pricing_args)
+        if evaluated:
+            pricing_results, compiled_rules = evaluated
+        else:
+            pricing_results = erpnext_apply_pricing_rule(pricing_args) or []
 
         if not pricing_results:
             return {"items": items}
 
-        raw_rule_names = set()
-        for result in pricing_results:
-            if not result:
-                continue
-            rules = []
-            if erpnext_get_applied_pricing_rules:
-                rules = erpnext_get_applied_pricing_rules(result.get("pricing_rules"))
-            else:
-                raw_rules = result.get("pricing_rules") or []
-                if isinstance(raw_rules, str):
-                    if raw_rules.startswith("["):
-                        rules = json.loads(raw_rules)
-                    else:
-                        rules = [r.strip() for r in raw_rules.split(",") if r.strip()]
-                elif isinstance(raw_rules, (list, tuple, set)):
-                    rules = list(raw_rules)
-            raw_rule_names.update(rules)
+        # Rule names applied to each line, parsed once
+        result_rule_names = [
+            offer_engine.parse_rule_names(result.get("pricing_rules")) if result else []
+            for result in pricing_results
+        ]
+        raw_rule_names = {name for names in result_rule_names for name in names}
 
         rule_map = {}
         if raw_rule_names:
-            rule_records = frappe.get_all(
-                "Pricing Rule",
-                filters={"name": ["in", list(raw_rule_names)]},
-                fields=[
-                    "name",
-                    "promotional_scheme",
-                    "coupon_code_based",
-                    "promotional_scheme_id",
-                    "price_or_product_discount",
-                ],
-            )
+            if compiled_rules is not None:
+                rule_records = [compiled_rules[name] for name in raw_rule_names if name in compiled_rules]
+            else:
+                rule_records = frappe.get_all(
+                    "Pricing Rule",
+                    filters={"name": ["in", list(raw_rule_names)]},
+                    fields=[
+                        "name",
+                        "promotional_scheme",
+                        "coupon_code_based",
+                        "promotional_scheme_id",
+                        "price_or_product_discount",
+                    ],
+                )
             for record in rule_records:
                 if record.promotional_scheme and not record.coupon_code_based:
                     rule_map[record.name] = record
@@ -1359,28 +2199,12 @@ def apply_offers(invoice_data, selected_offers=None):
         applied_rules = set()
         free_items = []
 
-        for result, item_index in zip(pricing_results, index_map):
+        for result, rule_names, item_index in zip(
+            pricing_results, result_rule_names, index_map
+        ):
             if not result:
                 continue
 
-            if erpnext_get_applied_pricing_rules:
-                rule_names = erpnext_get_applied_pricing_rules(
-                    result.get("pricing_rules")
-                )
-            else:
-                raw_rules = result.get("pricing_rules") or []
-                if isinstance(raw_rules, str):
-                    if raw_rules.startswith("["):
-                        rule_names = json.loads(raw_rules)
-                    else:
-                        rule_names = [
-                            r.strip() for r in raw_rules.split(",") if r.strip()
-                        ]
-                elif isinstance(raw_rules, (list, tuple, set)):
-                    rule_names = list(raw_rules)
-                else:
-                    rule_names = []
-
             applicable_rule_names = [
                 name for name in rule_names or [] if name in rule_map
             ]
@@ -1415,8 +2239,10 @@ def apply_offers(invoice_data, selected_offers=None):
                     if not rule_doc:
                         continue
 
-                    # Fetch full pricing rule to get discount values
-                    full_rule = frappe.get_cached_doc("Pricing Rule", rule_name)
+                    # Full pricing rule for its discount values
+                    full_rule = (compiled_rules or {}).get(
+                        rule_name
+                    ) or frappe.get_cached_doc("Pricing Rule", rule_name)
 
                     if (
                         full_rule.rate_or_discount == "Discount Percentage"
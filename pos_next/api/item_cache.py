@@ -0,0 +1,475 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2025, POS Next and contributors
+# For license information, please see license.txt
+
+"""
+Redis read-through cache for the item data POS terminals ask for on every call.
+
+Entries are stored in one Redis hash per scope, keyed by item code:
+
+- prices per selling price list and day: ``{uom: price_list_rate}``
+- stock per warehouse: ``{"actual_qty": ..., "reserved_qty": ...}``
+- stock rollups per group warehouse, in the same shape as leaf warehouses
+- item meta (barcodes and UOM conversions, both child tables of Item)
+- the warehouse tree (leaf warehouses per group, group ancestors per warehouse)
+
+Misses are filled from the database in one batched query and items without rows
+are cached as empty so they do not miss again. Entries are dropped by the
+doc_events registered in hooks.py; stock hashes also expire as a safety net
+because ERPNext updates Bin rows without running document hooks.
+
+Any Redis failure falls back to the database, so the cache never changes results.
+"""
+
+import json
+
+import frappe
+from frappe.utils import flt, nowdate
+from frappe.utils.nestedset import get_ancestors_of
+
+PRICE_CACHE_PREFIX = "pos_next:item_prices"
+STOCK_CACHE_PREFIX = "pos_next:item_stock"
+META_CACHE_KEY = "pos_next:item_meta"
+STATS_CACHE_KEY = "pos_next:item_cache_stats"
+
+BARCODE_INDEX_KEY = "pos_next:barcode_index"
+BARCODE_INDEX_READY = "__ready__"
+
+WAREHOUSE_LEAVES_KEY = "pos_next:warehouse_leaves"
+WAREHOUSE_ANCESTORS_KEY = "pos_next:warehouse_ancestors"
+
+PRICE_CACHE_TTL = 24 * 60 * 60
+STOCK_CACHE_TTL = 10 * 60
+META_CACHE_TTL = 24 * 60 * 60
+WAREHOUSE_CACHE_TTL = 24 * 60 * 60
+
+
+# ============================================================================
+# Redis helpers
+# ============================================================================
+
+def _key(name):
+	return frappe.cache().make_key(name)
+
+
+def _read(name, fields):
+	"""Return {field: value} for fields present in the hash."""
+	if not fields:
+		return {}
+
+	try:
+		pipe = frappe.cache().pipeline()
+		pipe.hmget(_key(name), fields)
+		values = pipe.execute()[0]
+	except Exception:
+		frappe.log_error(frappe.get_traceback(), "POS Item Cache Read Error")
+		return {}
+
+	return {field: json.loads(value) for field, value in zip(fields, values) if value is not None}
+
+
+def _write(name, mapping, ttl):
+	if not mapping:
+		return
+
+	try:
+		pipe = frappe.cache().pipeline()
+		pipe.hset(_key(name), mapping={field: json.dumps(value) for field, value in mapping.items()})
+		pipe.expire(_key(name), ttl)
+		pipe.execute()
+	except Exception:
+		frappe.log_error(frappe.get_traceback(), "POS Item Cache Write Error")
+
+
+def _delete(name, fields=None):
+	try:
+		pipe = frappe.cache().pipeline()
+		if fields:
+			pipe.hdel(_key(name), *fields)
+		else:
+			pipe.delete(_key(name))
+		pipe.execute()
+	except Exception:
+		frappe.log_error(frappe.get_traceback(), "POS Item Cache Delete Error")
+
+
+def _invalidate(name, fields=None):
+	"""
+	Delete entries now and again once the transaction ends, so a reader that
+	refilled the cache from pre-commit (or rolled back) data in between does not
+	leave it stale.
+	"""
+	_delete(name, fields)
+	frappe.db.after_commit.add(lambda: _delete(name, fields))
+	frappe.db.after_rollback.add(lambda: _delete(name, fields))
+
+
+def _count(scope, hits, misses):
+	try:
+		pipe = frappe.cache().pipeline()
+		if hits:
+			pipe.hincrby(_key(STATS_CACHE_KEY), f"{scope}_hits", hits)
+		if misses:
+			pipe.hincrby(_key(STATS_CACHE_KEY), f"{scope}_misses", misses)
+		pipe.execute()
+	except Exception:
+		pass
+
+
+def _read_through(scope, name, item_codes, loader, ttl):
+	"""Serve item_codes from the hash, loading and storing the misses."""
+	item_codes = list(dict.fromkeys(code for code in item_codes if code))
+	if not item_codes:
+		return {}
+
+	cached = _read(name, item_codes)
+	missing = [code for code in item_codes if code not in cached]
+
+	if missing:
+		loaded = loader(missing)
+		_write(name, loaded, ttl)
+		cached.update(loaded)
+
+	_count(scope, len(item_codes) - len(missing), len(missing))
+
+	return cached
+
+
+# ============================================================================
+# Read-through accessors
+# ============================================================================
+
+def _price_cache_name(price_list, date=None):
+	# Validity is resolved for one day, so each day has its own hash
+	return f"{PRICE_CACHE_PREFIX}:{price_list}:{date or nowdate()}"
+
+
+def get_item_prices(price_list, item_codes):
+	"""
+	Return {item_code: {uom: price_list_rate}} for the given selling price list.
+
+	Only prices valid today and not restricted to a customer are included; the
+	latest ``valid_from`` wins when several apply.
+	"""
+	if not price_list:
+		return {}
+
+	today = nowdate()
+
+	def _load(codes):
+		prices = {code: {} for code in codes}
+		rows = frappe.db.sql(
+			"""
+			SELECT item_code, uom, price_list_rate
+			FROM `tabItem Price`
+			WHERE item_code IN %(codes)s AND price_list = %(price_list)s
+				AND IFNULL(customer, '') = ''
+				AND IFNULL(valid_from, '2000-01-01') <= %(today)s
+				AND IFNULL(valid_upto, '2500-12-31') >= %(today)s
+			ORDER BY item_code, uom, IFNULL(valid_from, '2000-01-01')
+			""",
+			{"codes": codes, "price_list": price_list, "today": today},
+			as_dict=1,
+		)
+		for row in rows:
+			# JSON keys must be strings; a price without UOM applies to the stock UOM
+			prices[row["item_code"]][row["uom"] or ""] = row["price_list_rate"]
+		return prices
+
+	return _read_through("price", _price_cache_name(price_list, today), item_codes, _load, PRICE_CACHE_TTL)
+
+
+def get_leaf_warehouses(warehouse):
+	"""Return the leaf warehouses whose stock rolls up into ``warehouse`` (itself for a leaf)."""
+	if not warehouse:
+		return []
+
+	def _load(names):
+		leaves = {}
+		for name in names:
+			if frappe.db.get_value("Warehouse", name, "is_group"):
+				# Fallback to the warehouse itself if it has no children
+				leaves[name] = frappe.db.get_descendants("Warehouse", name) or [name]
+			else:
+				leaves[name] = [name]
+		return leaves
+
+	return _read_through("warehouse", WAREHOUSE_LEAVES_KEY, [warehouse], _load, WAREHOUSE_CACHE_TTL).get(
+		warehouse, [warehouse]
+	)
+
+
+def get_warehouse_ancestors(warehouse):
+	"""Return the group warehouses above ``warehouse``, used to invalidate their rollups."""
+	if not warehouse:
+		return []
+
+	def _load(names):
+		ancestors = {}
+		for name in names:
+			ancestors[name] = get_ancestors_of("Warehouse", name) or []
+		return ancestors
+
+	return _read_through("warehouse", WAREHOUSE_ANCESTORS_KEY, [warehouse], _load, WAREHOUSE_CACHE_TTL).get(
+		warehouse, []
+	)
+
+
+def get_item_stock(warehouse, item_codes):
+	"""
+	Return {item_code: {"actual_qty", "reserved_qty"}} for a warehouse.
+
+	For a group warehouse the entry is the rollup over all its leaf warehouses,
+	so group stock reads are a single hash lookup once warm.
+	"""
+	if not warehouse:
+		return {}
+
+	def _load(codes):
+		warehouses = get_leaf_warehouses(warehouse)
+		stock = {code: {"actual_qty": 0.0, "reserved_qty": 0.0} for code in codes}
+		rows = frappe.db.sql(
+			"""
+			SELECT
+				item_code,
+				COALESCE(SUM(actual_qty), 0) AS actual_qty,
+				COALESCE(SUM(reserved_qty), 0) AS reserved_qty
+			FROM `tabBin`
+			WHERE item_code IN %s AND warehouse IN %s
+			GROUP BY item_code
+			""",
+			[codes, warehouses],
+			as_dict=1,
+		)
+		for row in rows:
+			stock[row["item_code"]] = {
+				"actual_qty": flt(row["actual_qty"]),
+				"reserved_qty": flt(row["reserved_qty"]),
+			}
+		return stock
+
+	return _read_through("stock", f"{STOCK_CACHE_PREFIX}:{warehouse}", item_codes, _load, STOCK_CACHE_TTL)
+
+
+def get_item_meta(item_codes):
+	"""Return {item_code: {"barcodes": [...], "uoms": [...]}} from Item child tables."""
+
+	def _load(codes):
+		meta = {code: {"barcodes": [], "uoms": []} for code in codes}
+		barcodes = frappe.db.sql(
+			"""
+			SELECT parent, barcode, uom
+			FROM `tabItem Barcode`
+			WHERE parent IN %s AND parenttype = 'Item'
+			ORDER BY parent, idx
+			""",
+			[codes],
+			as_dict=1,
+		)
+		for row in barcodes:
+			meta[row["parent"]]["barcodes"].append({"barcode": row["barcode"], "uom": row["uom"]})
+
+		uoms = frappe.db.sql(
+			"""
+			SELECT parent, uom, conversion_factor
+			FROM `tabUOM Conversion Detail`
+			WHERE parent IN %s AND parenttype = 'Item'
+			ORDER BY parent, idx
+			""",
+			[codes],
+			as_dict=1,
+		)
+		for row in uoms:
+			meta[row["parent"]]["uoms"].append(
+				{"uom": row["uom"], "conversion_factor": flt(row["conversion_factor"])}
+			)
+		return meta
+
+	return _read_through("meta", META_CACHE_KEY, item_codes, _load, META_CACHE_TTL)
+
+
+# ============================================================================
+# Barcode index
+# ============================================================================
+
+def _build_barcode_index():
+	"""Load every Item Barcode into the site-wide barcode index."""
+	rows = frappe.db.sql(
+		"""
+		SELECT barcode, parent, uom
+		FROM `tabItem Barcode`
+		WHERE parenttype = 'Item' AND IFNULL(barcode, '') != ''
+		""",
+		as_dict=1,
+	)
+
+	index = {row["barcode"]: {"item_code": row["parent"], "uom": row["uom"]} for row in rows}
+	index[BARCODE_INDEX_READY] = 1
+
+	try:
+		pipe = frappe.cache().pipeline()
+		key = _key(BARCODE_INDEX_KEY)
+		pipe.delete(key)
+		entries = list(index.items())
+		for start in range(0, len(entries), 5000):
+			pipe.hset(key, mapping={k: json.dumps(v) for k, v in entries[start : start + 5000]})
+		pipe.expire(key, META_CACHE_TTL)
+		pipe.execute()
+	except Exception:
+		frappe.log_error(frappe.get_traceback(), "POS Barcode Index Build Error")
+
+	return index
+
+
+def resolve_barcodes(barcodes):
+	"""
+	Resolve scanned barcodes to {"item_code", "uom"} through the warm barcode index.
+
+	The index is built in full on first use and kept current by Item hooks. Codes
+	missing from it are looked up in one query, so edits that bypassed the hooks
+	(e.g. direct imports) are still found and then added to the index.
+
+	Returns:
+		dict: barcode -> {"item_code", "uom"} for the barcodes that exist
+	"""
+	barcodes = list(dict.fromkeys(code for code in barcodes if code))
+	if not barcodes:
+		return {}
+
+	found = _read(BARCODE_INDEX_KEY, [BARCODE_INDEX_READY, *barcodes])
+	if not found.pop(BARCODE_INDEX_READY, None):
+		index = _build_barcode_index()
+		found = {code: index[code] for code in barcodes if code in index}
+
+	missing = [code for code in barcodes if code not in found]
+	if missing:
+		rows = frappe.db.sql(
+			"""
+			SELECT barcode, parent, uom
+			FROM `tabItem Barcode`
+			WHERE barcode IN %s AND parenttype = 'Item'
+			""",
+			[missing],
+			as_dict=1,
+		)
+		loaded = {row["barcode"]: {"item_code": row["parent"], "uom": row["uom"]} for row in rows}
+		if loaded:
+			_write(BARCODE_INDEX_KEY, loaded, META_CACHE_TTL)
+			found.update(loaded)
+
+	_count("barcode", len(barcodes) - len(missing), len(missing))
+
+	return found
+
+
+def sync_item_barcodes(doc, method=None):
+	"""Apply an Item's barcode changes to the barcode index."""
+	current = {}
+	if method != "on_trash":
+		current = {
+			row.barcode: {"item_code": doc.name, "uom": row.uom}
+			for row in doc.get("barcodes") or []
+			if row.barcode
+		}
+
+	previous = set()
+	before = doc.get_doc_before_save() if method != "on_trash" else doc
+	if before:
+		previous = {row.barcode for row in before.get("barcodes") or [] if row.barcode}
+
+	removed = [barcode for barcode in previous if barcode not in current]
+	if removed:
+		_invalidate(BARCODE_INDEX_KEY, removed)
+	if current:
+		_write(BARCODE_INDEX_KEY, current, META_CACHE_TTL)
+		frappe.db.after_commit.add(lambda: _write(BARCODE_INDEX_KEY, current, META_CACHE_TTL))
+
+
+# ============================================================================
+# Invalidation (doc_events)
+# ============================================================================
+
+def invalidate_item_price(doc, method=None):
+	"""Drop cached prices for the Item Price's item, including its previous price list."""
+	keys = {(doc.price_list, doc.item_code)}
+
+	before = doc.get_doc_before_save() if hasattr(doc, "get_doc_before_save") else None
+	if before:
+		keys.add((before.price_list, before.item_code))
+
+	for price_list, item_code in keys:
+		if price_list and item_code:
+			_invalidate(_price_cache_name(price_list), [item_code])
+
+
+def invalidate_item(doc, method=None):
+	"""Drop cached barcodes and UOM conversions when an Item is saved, renamed or deleted."""
+	_invalidate(META_CACHE_KEY, [doc.name])
+
+
+def invalidate_item_after_rename(doc, method=None, old=None, new=None, merge=False):
+	"""Drop cached entries for both the old and new item code after a rename."""
+	_invalidate(META_CACHE_KEY, [code for code in (old, new) if code])
+	# Barcode rows were re-parented; rebuild the index on next use
+	_invalidate(BARCODE_INDEX_KEY)
+
+
+def invalidate_stock(doc, method=None):
+	"""
+	Drop cached stock for the (warehouse, item) touched by a Bin or Stock Ledger
+	Entry, and the rollups of every group warehouse above it.
+	"""
+	if doc.get("warehouse") and doc.get("item_code"):
+		for warehouse in [doc.warehouse, *get_warehouse_ancestors(doc.warehouse)]:
+			_invalidate(f"{STOCK_CACHE_PREFIX}:{warehouse}", [doc.item_code])
+
+
+def invalidate_warehouse_tree(doc, method=None, *args):
+	"""
+	Drop the cached warehouse tree when a Warehouse is added, moved, renamed or
+	deleted. Rollups are tied to the tree shape, so those are dropped too.
+	"""
+	_invalidate(WAREHOUSE_LEAVES_KEY)
+	_invalidate(WAREHOUSE_ANCESTORS_KEY)
+
+	frappe.cache().delete_keys(f"{STOCK_CACHE_PREFIX}:")
+
+
+# ============================================================================
+# Monitoring
+# ============================================================================
+
+@frappe.whitelist()
+def get_item_cache_stats():
+	"""Return hit/miss counters per cache scope, to size the cache."""
+	frappe.only_for("System Manager")
+
+	try:
+		raw = frappe.cache().pipeline().hgetall(_key(STATS_CACHE_KEY)).execute()[0]
+	except Exception:
+		raw = {}
+
+	counters = {
+		(k.decode() if isinstance(k, bytes) else k): int(v) for k, v in (raw or {}).items()
+	}
+
+	stats = {}
+	for scope in ("price", "stock", "meta", "barcode", "warehouse"):
+		hits = counters.get(f"{scope}_hits", 0)
+		misses = counters.get(f"{scope}_misses", 0)
+		total = hits + misses
+		stats[scope] = {
+			"hits": hits,
+			"misses": misses,
+			"hit_ratio": round(hits / total, 4) if total else None,
+		}
+
+	return stats
+
+
+@frappe.whitelist()
+def reset_item_cache_stats():
+	"""Reset the hit/miss counters."""
+	frappe.only_for("System Manager")
+	_delete(STATS_CACHE_KEY)
+	return {"success": True}
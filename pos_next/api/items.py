@@ -1,6 +1,7 @@
 # Copyright (c) 2024, POS Next and contributors
 # For license information, please see license.txt
 
+import base64
 import json
 import re
 from collections import defaultdict
@@ -9,7 +10,10 @@ import frappe
 from erpnext.stock.doctype.batch.batch import get_batch_qty
 from erpnext.stock.get_item_details import get_item_details as erpnext_get_item_details
 from frappe import _, as_json
-from frappe.utils import flt, nowdate
+from frappe.utils import cint, cstr, flt, nowdate
+
+from pos_next.api import item_cache
+from pos_next.api.scale_barcodes import apply_scale_value, decode_scale_barcode, get_scale_barcode_rules
 
 ITEM_RESULT_FIELDS = [
 	"name as item_code",
@@ -28,24 +32,22 @@ ITEM_RESULT_FIELDS = [
 
 ITEM_RESULT_COLUMNS = ",\n\t".join(ITEM_RESULT_FIELDS)
 
+# FULLTEXT index created on install/migrate (see pos_next.install.setup_item_search_index)
+ITEM_SEARCH_INDEX = "pos_next_item_search"
+ITEM_SEARCH_INDEX_COLUMNS = "name, item_name, description"
+ITEM_SEARCH_INDEX_CACHE_KEY = "pos_next:item_search_index"
+
+# InnoDB ignores tokens shorter than innodb_ft_min_token_size (3 by default)
+FULLTEXT_MIN_TOKEN_LENGTH = 3
+
 
 def get_stock_availability(item_code, warehouse):
 	"""Return total available quantity for an item in the given warehouse."""
 	if not warehouse:
 		return 0.0
 
-	warehouses = [warehouse]
-	if frappe.db.get_value("Warehouse", warehouse, "is_group"):
-		# Include all child warehouses when a group warehouse is set
-		warehouses = frappe.db.get_descendants("Warehouse", warehouse) or []
-
-	rows = frappe.get_all(
-		"Bin",
-		fields=["sum(actual_qty) as actual_qty"],
-		filters={"item_code": item_code, "warehouse": ["in", warehouses]},
-	)
-
-	return flt(rows[0].actual_qty) if rows else 0.0
+	# Group warehouses are served from the cached rollup over their child warehouses
+	return flt(item_cache.get_item_stock(warehouse, [item_code]).get(item_code, {}).get("actual_qty"))
 
 
 def get_item_detail(item, doc=None, warehouse=None, price_list=None, company=None):
@@ -89,24 +91,7 @@ def get_item_detail(item, doc=None, warehouse=None, price_list=None, company=Non
 
 	# Handle multi-currency
 	if company:
-		company_currency = frappe.db.get_value("Company", company, "default_currency")
-		price_list_currency = company_currency
-		if price_list:
-			price_list_currency = (
-				frappe.db.get_value("Price List", price_list, "currency") or company_currency
-			)
-
-		exchange_rate = 1
-		if price_list_currency != company_currency:
-			from erpnext.setup.utils import get_exchange_rate
-
-			try:
-				exchange_rate = get_exchange_rate(price_list_currency, company_currency, today)
-			except Exception:
-				frappe.log_error(
-					f"Missing exchange rate from {price_list_currency} to {company_currency}",
-					"POS Next",
-				)
+		price_list_currency, exchange_rate = _get_price_list_currency(price_list, company)
 
 		item["price_list_currency"] = price_list_currency
 		item["plc_conversion_rate"] = exchange_rate
@@ -157,11 +142,7 @@ def get_item_detail(item, doc=None, warehouse=None, price_list=None, company=Non
 	res["brand"] = brand
 
 	# Add UOMs data
-	uoms = frappe.get_all(
-		"UOM Conversion Detail",
-		filters={"parent": item_code},
-		fields=["uom", "conversion_factor"],
-	)
+	uoms = [dict(row) for row in item_cache.get_item_meta([item_code]).get(item_code, {}).get("uoms", [])]
 
 	# Add stock UOM if not already in uoms list
 	stock_uom = frappe.db.get_value("Item", item_code, "stock_uom")
@@ -180,78 +161,129 @@ def get_item_detail(item, doc=None, warehouse=None, price_list=None, company=Non
 	return res
 
 
-@frappe.whitelist()
-def search_by_barcode(barcode, pos_profile):
-	"""Search item by barcode"""
-	try:
-		# Parse pos_profile if it's a JSON string
-		if isinstance(pos_profile, str):
-			try:
-				pos_profile = json.loads(pos_profile)
-			except (json.JSONDecodeError, ValueError):
-				pass  # It's already a plain string
+def _parse_pos_profile_name(pos_profile):
+	"""Accept a POS Profile name, a JSON string or a dict and return the profile name."""
+	# Parse pos_profile if it's a JSON string
+	if isinstance(pos_profile, str):
+		try:
+			pos_profile = json.loads(pos_profile)
+		except (json.JSONDecodeError, ValueError):
+			pass  # It's already a plain string
 
-		# Ensure pos_profile is a string (handle dict or string input)
-		if isinstance(pos_profile, dict):
-			pos_profile = pos_profile.get("name") or pos_profile.get("pos_profile")
+	# Ensure pos_profile is a string (handle dict or string input)
+	if isinstance(pos_profile, dict):
+		pos_profile = pos_profile.get("name") or pos_profile.get("pos_profile")
 
-		if not pos_profile:
-			frappe.throw(_("POS Profile is required"))
+	if not pos_profile:
+		frappe.throw(_("POS Profile is required"))
 
-		# Search for item by barcode - also get UOM if barcode has specific UOM
-		barcode_data = frappe.db.get_value(
-			"Item Barcode", {"barcode": barcode}, ["parent", "uom"], as_dict=True
-		)
+	return pos_profile
 
-		if barcode_data:
-			item_code = barcode_data.parent
-			barcode_uom = barcode_data.uom
-		else:
-			# Try searching in item code field directly
-			item_code = frappe.db.get_value("Item", {"name": barcode})
-			barcode_uom = None
 
-		if not item_code:
-			frappe.throw(_("Item with barcode {0} not found").format(barcode))
+def _get_scan_profile(pos_profile):
+	"""Load the POS Profile for barcode scans and validate the fields pricing needs."""
+	pos_profile_doc = frappe.get_cached_doc("POS Profile", pos_profile)
 
-		# Get POS Profile details
-		pos_profile_doc = frappe.get_cached_doc("POS Profile", pos_profile)
+	# Validate POS Profile has required fields
+	if not pos_profile_doc.warehouse:
+		frappe.throw(_("Warehouse not set in POS Profile {0}").format(pos_profile))
+	if not pos_profile_doc.selling_price_list:
+		frappe.throw(_("Selling Price List not set in POS Profile {0}").format(pos_profile))
+	if not pos_profile_doc.company:
+		frappe.throw(_("Company not set in POS Profile {0}").format(pos_profile))
 
-		# Validate POS Profile has required fields
-		if not pos_profile_doc.warehouse:
-			frappe.throw(_("Warehouse not set in POS Profile {0}").format(pos_profile))
-		if not pos_profile_doc.selling_price_list:
-			frappe.throw(_("Selling Price List not set in POS Profile {0}").format(pos_profile))
-		if not pos_profile_doc.company:
-			frappe.throw(_("Company not set in POS Profile {0}").format(pos_profile))
+	return pos_profile_doc
 
-		# Get item doc
-		item_doc = frappe.get_cached_doc("Item", item_code)
 
-		# Check if item is allowed for sales
-		if not item_doc.is_sales_item:
-			frappe.throw(_("Item {0} is not allowed for sales").format(item_code))
+def _resolve_scanned_codes(barcodes, scale_rules=None):
+	"""
+	Map scanned codes to {"item_code", "uom"} through the barcode index,
+	falling back to a direct item code match for codes that are not barcodes.
 
-		# Prepare item dict for get_item_detail
-		item = {
-			"item_code": item_code,
-			"has_batch_no": item_doc.has_batch_no or 0,
-			"has_serial_no": item_doc.has_serial_no or 0,
-			"is_stock_item": item_doc.is_stock_item or 0,
-			"pos_profile": pos_profile,
-		}
+	Codes matching a scale barcode rule are decoded first; when their item
+	segment resolves, the entry also carries the decoded value under ``scale``.
+	"""
+	decoded = {}
+	for code in barcodes:
+		scale = decode_scale_barcode(code, scale_rules) if scale_rules else None
+		if scale:
+			decoded[code] = scale
+
+	lookup_codes = list(
+		dict.fromkeys([*barcodes, *(c for scale in decoded.values() for c in scale.lookup_codes)])
+	)
+	resolved = item_cache.resolve_barcodes(lookup_codes)
+
+	unresolved = [code for code in lookup_codes if code and code not in resolved]
+	if unresolved:
+		# Try searching in item code field directly
+		item_codes = frappe.get_all("Item", filters={"name": ["in", unresolved]}, pluck="name")
+		for item_code in item_codes:
+			resolved[item_code] = {"item_code": item_code, "uom": None}
+
+	matches = {}
+	for code in barcodes:
+		scale = decoded.get(code)
+		if scale:
+			match = next((resolved[c] for c in scale.lookup_codes if c in resolved), None)
+			if match:
+				matches[code] = {**match, "scale": scale}
+				continue
 
-		# Include UOM from barcode if available
-		if barcode_uom:
-			item["uom"] = barcode_uom
+		if code in resolved:
+			matches[code] = resolved[code]
+
+	return matches
+
+
+def _get_scanned_item_detail(item_code, uom, pos_profile, pos_profile_doc):
+	"""Return get_item_detail for a scanned item, honouring the barcode's UOM."""
+	# Get item doc
+	item_doc = frappe.get_cached_doc("Item", item_code)
+
+	# Check if item is allowed for sales
+	if not item_doc.is_sales_item:
+		frappe.throw(_("Item {0} is not allowed for sales").format(item_code))
+
+	# Prepare item dict for get_item_detail
+	item = {
+		"item_code": item_code,
+		"has_batch_no": item_doc.has_batch_no or 0,
+		"has_serial_no": item_doc.has_serial_no or 0,
+		"is_stock_item": item_doc.is_stock_item or 0,
+		"pos_profile": pos_profile,
+	}
+
+	# Include UOM from barcode if available
+	if uom:
+		item["uom"] = uom
+
+	return get_item_detail(
+		item=json.dumps(item),
+		warehouse=pos_profile_doc.warehouse,
+		price_list=pos_profile_doc.selling_price_list,
+		company=pos_profile_doc.company,
+	)
 
-		# Get item details
-		item_details = get_item_detail(
-			item=json.dumps(item),
-			warehouse=pos_profile_doc.warehouse,
-			price_list=pos_profile_doc.selling_price_list,
-			company=pos_profile_doc.company,
-		)
+
+@frappe.whitelist()
+def search_by_barcode(barcode, pos_profile):
+	"""Search item by barcode"""
+	try:
+		pos_profile = _parse_pos_profile_name(pos_profile)
+		pos_profile_doc = _get_scan_profile(pos_profile)
+
+		# Search for item by barcode - also get UOM if barcode has specific UOM
+		scale_rules = get_scale_barcode_rules(pos_profile)
+		match = _resolve_scanned_codes([barcode], scale_rules).get(barcode)
+		if not match:
+			frappe.throw(_("Item with barcode {0} not found").format(barcode))
+
+		item_details = _get_scanned_item_detail(match["item_code"], match["uom"], pos_profile, pos_profile_doc)
+
+		# Weighed / priced scale barcodes carry the quantity or amount
+		if match.get("scale"):
+			item_details = apply_scale_value(item_details, match["scale"])
 
 		return item_details
 	except Exception as e:
@@ -259,6 +291,63 @@ def search_by_barcode(barcode, pos_profile):
 		frappe.throw(_("Error searching by barcode: {0}").format(str(e)))
 
 
+@frappe.whitelist()
+def search_by_barcodes(barcodes, pos_profile):
+	"""
+	Resolve a list of scanned barcodes in one round trip.
+
+	Used for scanner buffers and for replaying scans captured while offline.
+	A code that cannot be resolved does not fail the others.
+
+	Args:
+		barcodes: JSON string or list of scanned codes
+		pos_profile: POS Profile name
+
+	Returns:
+		list: One entry per input code, in input order, with either ``item``
+		(same shape as search_by_barcode) or ``error``
+	"""
+	try:
+		if isinstance(barcodes, str):
+			barcodes = json.loads(barcodes)
+		barcodes = [cstr(code).strip() for code in barcodes or []]
+
+		pos_profile = _parse_pos_profile_name(pos_profile)
+		pos_profile_doc = _get_scan_profile(pos_profile)
+
+		resolved = _resolve_scanned_codes(barcodes, get_scale_barcode_rules(pos_profile))
+
+		details = {}
+		results = []
+		for barcode in barcodes:
+			match = resolved.get(barcode)
+			if not match:
+				results.append(
+					{"barcode": barcode, "error": _("Item with barcode {0} not found").format(barcode)}
+				)
+				continue
+
+			# The same code scanned several times is only priced once
+			key = (match["item_code"], match["uom"])
+			try:
+				if key not in details:
+					details[key] = _get_scanned_item_detail(
+						match["item_code"], match["uom"], pos_profile, pos_profile_doc
+					)
+				item_details = details[key]
+				if match.get("scale"):
+					item_details = apply_scale_value(frappe._dict(item_details), match["scale"])
+				results.append({"barcode": barcode, "item": item_details})
+			except Exception as e:
+				frappe.clear_messages()
+				results.append({"barcode": barcode, "error": str(e)})
+
+		return results
+	except Exception as e:
+		frappe.log_error(frappe.get_traceback(), "Search by Barcodes Error")
+		frappe.throw(_("Error searching by barcodes: {0}").format(str(e)))
+
+
 @frappe.whitelist()
 def get_item_stock(item_code, warehouse):
 	"""Get real-time stock for item"""
@@ -475,6 +564,36 @@ def get_item_variants(template_item, pos_profile):
 		frappe.throw(_("Error fetching item variants: {0}").format(str(e)))
 
 
+def has_item_search_index():
+	"""Return True if the Item FULLTEXT search index exists on this site."""
+
+	def _check():
+		return bool(
+			frappe.db.sql("SHOW INDEX FROM `tabItem` WHERE Key_name = %s", ITEM_SEARCH_INDEX)
+		)
+
+	return bool(frappe.cache().get_value(ITEM_SEARCH_INDEX_CACHE_KEY, generator=_check))
+
+
+def clear_item_search_index_cache():
+	"""Forget the cached index check, e.g. after the index was created or dropped."""
+	frappe.cache().delete_value(ITEM_SEARCH_INDEX_CACHE_KEY)
+
+
+def _build_fulltext_query(search_words):
+	"""
+	Build a boolean-mode FULLTEXT expression requiring a prefix match for every
+	indexable token. Returns None when no token is long enough to be indexed.
+	"""
+	terms = []
+	for word in search_words:
+		for token in re.findall(r"\w+", word):
+			if len(token) >= FULLTEXT_MIN_TOKEN_LENGTH:
+				terms.append(f"+{token}*")
+
+	return " ".join(dict.fromkeys(terms)) or None
+
+
 def _build_item_base_conditions(pos_profile_doc, item_group=None):
 	"""Build reusable SQL conditions for POS item search."""
 	conditions = [
@@ -495,11 +614,211 @@ def _build_item_base_conditions(pos_profile_doc, item_group=None):
 	return conditions, params
 
 
+def _encode_page_token(values):
+	"""Encode a keyset page boundary as an opaque URL-safe token."""
+	return base64.urlsafe_b64encode(json.dumps(values, default=str).encode()).decode()
+
+
+def _decode_page_token(token):
+	"""Decode a token produced by _encode_page_token; an empty token means the first page."""
+	if not token:
+		return None
+	try:
+		return json.loads(base64.urlsafe_b64decode(token.encode()).decode())
+	except (ValueError, TypeError):
+		frappe.throw(_("Invalid page token"))
+
+
+def _enrich_items(items, pos_profile_doc):
+	"""Attach price, stock, barcode and UOM data to item rows for the POS catalog."""
+	# Prepare maps for enrichment
+	item_codes = [item["item_code"] for item in items]
+	conversion_map = defaultdict(dict)  # parent -> {uom: factor}
+
+	# Barcodes and UOM conversions (Item child tables) - served from the item cache
+	item_meta = item_cache.get_item_meta(item_codes)
+	barcode_map = {
+		code: meta["barcodes"][0]["barcode"] for code, meta in item_meta.items() if meta["barcodes"]
+	}
+	uom_map = {code: meta["uoms"] for code, meta in item_meta.items()}  # parent -> [ {uom, conversion_factor}, ... ]
+	for code, uoms in uom_map.items():
+		for row in uoms:
+			if row["uom"]:
+				conversion_map[code][row["uom"]] = row["conversion_factor"]
+
+	# UOM-specific prices for all items - served from the item cache
+	uom_prices_map = item_cache.get_item_prices(pos_profile_doc.selling_price_list, item_codes)  # item_code -> {uom: rate}
+
+	# Minimum variant price for templates without a direct price - one grouped query per page
+	template_price_map = {}
+	template_codes = [
+		item["item_code"]
+		for item in items
+		if item.get("has_variants") and not uom_prices_map.get(item["item_code"])
+	]
+	if template_codes:
+		variant_prices = frappe.db.sql(
+			"""
+			SELECT i.variant_of, MIN(ip.price_list_rate) as min_price
+			FROM `tabItem Price` ip
+			INNER JOIN `tabItem` i ON i.name = ip.item_code
+			WHERE i.variant_of IN %s
+			AND ip.price_list = %s
+			AND i.disabled = 0
+			GROUP BY i.variant_of
+			""",
+			[template_codes, pos_profile_doc.selling_price_list],
+			as_dict=1,
+		)
+		template_price_map = {
+			row["variant_of"]: row["min_price"] for row in variant_prices if row.get("min_price")
+		}
+
+	# Stock for all stock items at once - served from the item cache
+	stock_map = {}
+	if item_codes and pos_profile_doc.warehouse:
+		stock_items = [item["item_code"] for item in items if item.get("is_stock_item")]
+		stock_map = {
+			code: row["actual_qty"]
+			for code, row in item_cache.get_item_stock(pos_profile_doc.warehouse, stock_items).items()
+		}
+
+	# Enrich items with price, stock, barcode, and UOM data
+	for item in items:
+		stock_uom = item.get("stock_uom")
+
+		# Use pre-loaded price map instead of per-item queries
+		price_row = None
+		item_prices = uom_prices_map.get(item["item_code"], {})
+
+		# 1) Try price explicitly for stock UOM (preferred)
+		if stock_uom and stock_uom in item_prices:
+			price_row = {"price_list_rate": item_prices[stock_uom], "uom": stock_uom}
+
+		# 2) If not found, try any price for the item (and capture its UOM)
+		elif item_prices:
+			# Get first available price
+			first_uom = next(iter(item_prices.keys()))
+			price_row = {"price_list_rate": item_prices[first_uom], "uom": first_uom}
+
+		# 3) If still not found and it's a template, derive min variant price
+		derived_price = None
+		if not price_row and item.get("has_variants"):
+			derived_price = template_price_map.get(item["item_code"])
+
+		# Finalize display price & display UOM
+		display_rate = 0.0
+		display_uom = stock_uom
+
+		if price_row:
+			raw_rate = flt(price_row.get("price_list_rate") or 0)
+			price_uom = price_row.get("uom") or stock_uom
+			if price_uom and stock_uom and price_uom != stock_uom:
+				# convert to per-stock-UOM if possible
+				cf = flt(conversion_map[item["item_code"]].get(price_uom) or 0)
+				if cf:
+					display_rate = raw_rate / cf
+					display_uom = stock_uom
+				else:
+					# no conversion available: show as is (price UOM)
+					display_rate = raw_rate
+					display_uom = price_uom
+			else:
+				display_rate = raw_rate
+				display_uom = stock_uom
+		elif derived_price is not None:
+			display_rate = flt(derived_price)
+			display_uom = stock_uom
+
+		item["rate"] = display_rate
+		item["price_list_rate"] = display_rate
+		item["uom"] = display_uom
+		item["price_uom"] = display_uom
+		item["conversion_factor"] = 1
+		item["price_list_rate_price_uom"] = display_rate
+
+		# Stock - use pre-loaded stock map (performance optimization)
+		item["actual_qty"] = stock_map.get(item["item_code"], 0) if item.get("is_stock_item") else 0
+
+		# Add warehouse to item (needed for stock validation)
+		item["warehouse"] = pos_profile_doc.warehouse
+
+		# Barcode
+		item["barcode"] = barcode_map.get(item["item_code"], "")
+
+		# Item UOMs (exclude stock UOM to avoid duplicates)
+		all_uoms = uom_map.get(item["item_code"], []) or []
+		item["item_uoms"] = [u for u in all_uoms if u.get("uom") != stock_uom]
+
+		# UOM-specific prices map for frontend selector
+		item["uom_prices"] = uom_prices_map.get(item["item_code"], {})
+
+	return items
+
+
+def _search_items(where_clause, params, relevance, score_params, boundary, page_size, start=None):
+	"""
+	Run one page of the item search, ordered by relevance and item name.
+
+	With ``start`` the page is addressed by OFFSET; otherwise by the keyset
+	``boundary`` (relevance, item name, item code), and the rows carry their
+	``relevance`` for the next page token.
+	"""
+	if start is not None:
+		return frappe.db.sql(
+			f"""
+			SELECT {ITEM_RESULT_COLUMNS}
+			FROM `tabItem`
+			WHERE {where_clause}
+			ORDER BY {relevance} DESC, item_name ASC
+			LIMIT %s OFFSET %s
+			""",
+			tuple([*params, *score_params, page_size, start]),
+			as_dict=1,
+		)
+
+	# Rank in a derived table so the page boundary can compare on the score
+	after_clause = ""
+	after_params = []
+	if boundary:
+		after_clause = """
+			WHERE relevance < %s
+			OR (relevance = %s AND (item_name > %s OR (item_name = %s AND item_code > %s)))
+		"""
+		after_params = [boundary[0], boundary[0], boundary[1], boundary[1], boundary[2]]
+
+	return frappe.db.sql(
+		f"""
+		SELECT * FROM (
+			SELECT {ITEM_RESULT_COLUMNS}, {relevance} AS relevance
+			FROM `tabItem`
+			WHERE {where_clause}
+		) ranked
+		{after_clause}
+		ORDER BY relevance DESC, item_name ASC, item_code ASC
+		LIMIT %s
+		""",
+		tuple([*score_params, *params, *after_params, page_size]),
+		as_dict=1,
+	)
+
+
 @frappe.whitelist()
-def get_items(pos_profile, search_term=None, item_group=None, start=0, limit=20):
-	"""Get items for POS with stock, price, and tax details"""
+def get_items(pos_profile, search_term=None, item_group=None, start=0, limit=20, after=None):
+	"""
+	Get items for POS with stock, price, and tax details
+
+	By default pages are addressed with ``start``/``limit`` and a plain list is
+	returned. Passing ``after`` (an empty string for the first page) switches to
+	keyset pagination: the page boundary is taken from the opaque token instead of
+	an OFFSET, so deep pages cost the same as the first one, and the response is
+	``{"items": [...], "after": <next token or None>, "has_more": bool}``.
+	"""
 	try:
 		pos_profile_doc = frappe.get_cached_doc("POS Profile", pos_profile)
+		limit = cint(limit) or 20
+		keyset = after is not None
+		boundary = _decode_page_token(after) if keyset else None
 
 		filters = {
 			"disabled": 0,
@@ -540,10 +859,8 @@ def get_items(pos_profile, search_term=None, item_group=None, start=0, limit=20)
 			# Use parameterized queries - no need to escape, SQL handles it
 			prefix_pattern = f"{search_term}%"
 
-			where_clause = " AND ".join(conditions)
-
 			# Simple relevance scoring with case-insensitive comparison
-			relevance = f"""
+			relevance = """
 				CASE
 					WHEN LOWER(item_name) = LOWER(%s) THEN 1000
 					WHEN LOWER(name) = LOWER(%s) THEN 900
@@ -554,17 +871,57 @@ def get_items(pos_profile, search_term=None, item_group=None, start=0, limit=20)
 			"""
 			score_params = [search_term, search_term, prefix_pattern, prefix_pattern]
 
-			query = f"""
+			# The FULLTEXT index narrows the candidates, so the LIKE predicates and
+			# relevance tiers only run on indexed rows and latency stays flat. The
+			# LIKE scan alone serves terms with no token long enough to be indexed,
+			# sites without the index, and any FULLTEXT error.
+			fulltext_query = _build_fulltext_query(search_words) if has_item_search_index() else None
+			match_expr = f"MATCH({ITEM_SEARCH_INDEX_COLUMNS}) AGAINST (%s IN BOOLEAN MODE)"
+			page_size = limit + 1 if keyset else limit
+
+			items = None
+			if fulltext_query:
+				try:
+					items = _search_items(
+						" AND ".join([*conditions, match_expr]),
+						[*params, fulltext_query],
+						relevance,
+						score_params,
+						boundary if keyset else None,
+						page_size,
+						None if keyset else cint(start),
+					)
+				except Exception:
+					frappe.log_error(frappe.get_traceback(), "Item FULLTEXT Search Error")
+					clear_item_search_index_cache()
+
+			if items is None:
+				items = _search_items(
+					" AND ".join(conditions),
+					params,
+					relevance,
+					score_params,
+					boundary if keyset else None,
+					page_size,
+					None if keyset else cint(start),
+				)
+		elif keyset:
+			conditions, params = _build_item_base_conditions(pos_profile_doc, item_group)
+			if boundary:
+				conditions.append("(item_name > %s OR (item_name = %s AND name > %s))")
+				params.extend([boundary[-2], boundary[-2], boundary[-1]])
+
+			items = frappe.db.sql(
+				f"""
 				SELECT {ITEM_RESULT_COLUMNS}
 				FROM `tabItem`
-				WHERE {where_clause}
-				ORDER BY {relevance} DESC, item_name ASC
-				LIMIT %s OFFSET %s
-			"""
-
-			params.extend(score_params)
-			params.extend([limit, start])
-			items = frappe.db.sql(query, tuple(params), as_dict=1)
+				WHERE {" AND ".join(conditions)}
+				ORDER BY item_name ASC, name ASC
+				LIMIT %s
+				""",
+				tuple([*params, limit + 1]),
+				as_dict=1,
+			)
 		else:
 			# No search term - return all items with base filters
 			items = frappe.get_list(
@@ -589,164 +946,141 @@ def get_items(pos_profile, search_term=None, item_group=None, start=0, limit=20)
 				order_by="item_name asc",
 			)
 
-		# Prepare maps for enrichment
-		item_codes = [item["item_code"] for item in items]
-		barcode_map = {}
-		conversion_map = defaultdict(dict)  # parent -> {uom: factor}
-		uom_map = {}  # parent -> [ {uom, conversion_factor}, ... ]
-		uom_prices_map = {}  # item_code -> {uom: price_list_rate}
-
-		# Barcodes
-		if item_codes:
-			barcodes = frappe.db.sql(
-				"""
-				SELECT parent, barcode
-				FROM `tabItem Barcode`
-				WHERE parent IN %s
-				GROUP BY parent
-				""",
-				[item_codes],
-				as_dict=1,
-			)
-			barcode_map = {b["parent"]: b["barcode"] for b in barcodes}
-
-		# UOM conversions (both list & map for quick lookup)
-		if item_codes:
-			conversions = frappe.get_all(
-				"UOM Conversion Detail",
-				filters={"parent": ["in", item_codes]},
-				fields=["parent", "uom", "conversion_factor"],
-			)
-			for row in conversions:
-				# build list
-				uom_map.setdefault(row.parent, []).append(
-					{"uom": row.uom, "conversion_factor": row.conversion_factor}
-				)
-				# build fast lookup
-				if row.uom:
-					conversion_map[row.parent][row.uom] = row.conversion_factor
-
-		# UOM-specific prices - batch query ALL prices for all items
-		if item_codes:
-			prices = frappe.db.sql(
-				"""
-				SELECT item_code, uom, price_list_rate
-				FROM `tabItem Price`
-				WHERE item_code IN %s AND price_list = %s
-				ORDER BY item_code, uom
-				""",
-				[item_codes, pos_profile_doc.selling_price_list],
-				as_dict=1,
-			)
-			for price in prices:
-				uom_prices_map.setdefault(price["item_code"], {})[price["uom"]] = price["price_list_rate"]
+		if keyset:
+			has_more = len(items) > limit
+			items = items[:limit]
+			next_after = None
+			if has_more:
+				last = items[-1]
+				token = [last["item_name"], last["item_code"]]
+				if "relevance" in last:
+					token.insert(0, last["relevance"])
+				next_after = _encode_page_token(token)
+			for item in items:
+				item.pop("relevance", None)
+
+			return {
+				"items": _enrich_items(items, pos_profile_doc),
+				"after": next_after,
+				"has_more": has_more,
+			}
+
+		return _enrich_items(items, pos_profile_doc)
+	except Exception as e:
+		frappe.log_error(frappe.get_traceback(), "Get Items Error")
+		frappe.throw(_("Error fetching items: {0}").format(str(e)))
 
-		# Batch query stock for all items at once (performance optimization)
-		stock_map = {}
-		if item_codes and pos_profile_doc.warehouse:
-			stock_items = [item["item_code"] for item in items if item.get("is_stock_item")]
-			if stock_items:
-				stocks = frappe.db.sql(
-					"""
-					SELECT item_code, actual_qty
-					FROM `tabBin`
-					WHERE item_code IN %s AND warehouse = %s
-					""",
-					[stock_items, pos_profile_doc.warehouse],
-					as_dict=1,
-				)
-				stock_map = {s["item_code"]: s["actual_qty"] for s in stocks}
-
-		# Enrich items with price, stock, barcode, and UOM data
-		for item in items:
-			stock_uom = item.get("stock_uom")
-
-			# Use pre-loaded price map instead of per-item queries
-			price_row = None
-			item_prices = uom_prices_map.get(item["item_code"], {})
-
-			# 1) Try price explicitly for stock UOM (preferred)
-			if stock_uom and stock_uom in item_prices:
-				price_row = {"price_list_rate": item_prices[stock_uom], "uom": stock_uom}
-
-			# 2) If not found, try any price for the item (and capture its UOM)
-			elif item_prices:
-				# Get first available price
-				first_uom = next(iter(item_prices.keys()))
-				price_row = {"price_list_rate": item_prices[first_uom], "uom": first_uom}
-
-			# 3) If still not found and it's a template, derive min variant price
-			derived_price = None
-			if not price_row and item.get("has_variants"):
-				variant_prices = frappe.db.sql(
-					"""
-					SELECT MIN(ip.price_list_rate) as min_price
-					FROM `tabItem Price` ip
-					INNER JOIN `tabItem` i ON i.name = ip.item_code
-					WHERE i.variant_of = %s
-					AND ip.price_list = %s
-					AND i.disabled = 0
-					""",
-					[item["item_code"], pos_profile_doc.selling_price_list],
-					as_dict=1,
-				)
-				derived_price = (
-					variant_prices[0]["min_price"]
-					if variant_prices and variant_prices[0].get("min_price")
-					else None
-				)
 
-			# Finalize display price & display UOM
-			display_rate = 0.0
-			display_uom = stock_uom
+@frappe.whitelist()
+def get_items_delta(pos_profile, cursor=None, limit=500):
+	"""
+	Return catalog rows that changed since the given cursor.
 
-			if price_row:
-				raw_rate = flt(price_row.get("price_list_rate") or 0)
-				price_uom = price_row.get("uom") or stock_uom
-				if price_uom and stock_uom and price_uom != stock_uom:
-					# convert to per-stock-UOM if possible
-					cf = flt(conversion_map[item["item_code"]].get(price_uom) or 0)
-					if cf:
-						display_rate = raw_rate / cf
-						display_uom = stock_uom
-					else:
-						# no conversion available: show as is (price UOM)
-						display_rate = raw_rate
-						display_uom = price_uom
-				else:
-					display_rate = raw_rate
-					display_uom = stock_uom
-			elif derived_price is not None:
-				display_rate = flt(derived_price)
-				display_uom = stock_uom
+	Changes to the Item (including its barcodes and UOM conversions), its prices
+	in the profile's selling price list and its Bins in the profile's warehouse
+	(the leaf warehouses below it for a group warehouse) are all folded into a
+	single change stream keyed by item code. Price and stock changes on a
+	variant are reported against its template, which is what the catalog lists.
 
-			item["rate"] = display_rate
-			item["price_list_rate"] = display_rate
-			item["uom"] = display_uom
-			item["price_uom"] = display_uom
-			item["conversion_factor"] = 1
-			item["price_list_rate_price_uom"] = display_rate
+	Args:
+		pos_profile: POS Profile name
+		cursor: JSON string or dict with ``modified`` and ``name`` of the last row
+			seen by the client. Omit for a full initial sync.
+		limit: Maximum number of changed item codes to return
 
-			# Stock - use pre-loaded stock map (performance optimization)
-			item["actual_qty"] = stock_map.get(item["item_code"], 0) if item.get("is_stock_item") else 0
+	Returns:
+		dict: ``items`` (enriched like get_items), ``deleted`` (item codes to drop
+		from the local cache), ``cursor`` to pass on the next call, and ``has_more``
+	"""
+	try:
+		pos_profile_doc = frappe.get_cached_doc("POS Profile", pos_profile)
 
-			# Add warehouse to item (needed for stock validation)
-			item["warehouse"] = pos_profile_doc.warehouse
+		if isinstance(cursor, str):
+			cursor = json.loads(cursor) if cursor else None
+		cursor = cursor or {}
+		since = cursor.get("modified") or "1900-01-01 00:00:00"
+		since_name = cursor.get("name") or ""
+		limit = cint(limit) or 500
 
-			# Barcode
-			item["barcode"] = barcode_map.get(item["item_code"], "")
+		changes = frappe.db.sql(
+			"""
+			SELECT item_code, MAX(changed_at) AS changed_at
+			FROM (
+				SELECT COALESCE(NULLIF(variant_of, ''), name) AS item_code, modified AS changed_at
+				FROM `tabItem`
+				WHERE modified >= %(since)s
+				UNION ALL
+				SELECT COALESCE(NULLIF(i.variant_of, ''), ip.item_code), ip.modified
+				FROM `tabItem Price` ip
+				LEFT JOIN `tabItem` i ON i.name = ip.item_code
+				WHERE ip.price_list = %(price_list)s AND ip.modified >= %(since)s
+				UNION ALL
+				SELECT COALESCE(NULLIF(i.variant_of, ''), b.item_code), b.modified
+				FROM `tabBin` b
+				LEFT JOIN `tabItem` i ON i.name = b.item_code
+				WHERE b.warehouse IN %(warehouses)s AND b.modified >= %(since)s
+				UNION ALL
+				SELECT deleted_name, creation
+				FROM `tabDeleted Document`
+				WHERE deleted_doctype = 'Item' AND creation >= %(since)s
+				UNION ALL
+				SELECT JSON_UNQUOTE(JSON_EXTRACT(data, '$.item_code')), creation
+				FROM `tabDeleted Document`
+				WHERE deleted_doctype = 'Item Price' AND creation >= %(since)s
+			) changes
+			WHERE item_code IS NOT NULL
+			GROUP BY item_code
+			HAVING changed_at > %(since)s OR (changed_at = %(since)s AND item_code > %(since_name)s)
+			ORDER BY changed_at ASC, item_code ASC
+			LIMIT %(limit)s
+			""",
+			{
+				"since": since,
+				"since_name": since_name,
+				"price_list": pos_profile_doc.selling_price_list or "",
+				# A group warehouse's stock lives in the Bins of its leaf warehouses
+				"warehouses": item_cache.get_leaf_warehouses(pos_profile_doc.warehouse) or [""],
+				"limit": limit + 1,
+			},
+			as_dict=1,
+		)
 
-			# Item UOMs (exclude stock UOM to avoid duplicates)
-			all_uoms = uom_map.get(item["item_code"], []) or []
-			item["item_uoms"] = [u for u in all_uoms if u.get("uom") != stock_uom]
+		has_more = len(changes) > limit
+		changes = changes[:limit]
+
+		if not changes:
+			return {"items": [], "deleted": [], "cursor": cursor or None, "has_more": False}
+
+		changed_codes = [row["item_code"] for row in changes]
+
+		# Items that still qualify for the POS catalog are re-sent in full,
+		# everything else (disabled, deleted, moved to another company) is a tombstone
+		conditions, params = _build_item_base_conditions(pos_profile_doc)
+		conditions.append("name IN %s")
+		params.append(changed_codes)
+		items = frappe.db.sql(
+			f"""
+			SELECT {ITEM_RESULT_COLUMNS}
+			FROM `tabItem`
+			WHERE {" AND ".join(conditions)}
+			ORDER BY item_name ASC
+			""",
+			tuple(params),
+			as_dict=1,
+		)
 
-			# UOM-specific prices map for frontend selector
-			item["uom_prices"] = uom_prices_map.get(item["item_code"], {})
+		live_codes = {item["item_code"] for item in items}
+		last = changes[-1]
 
-		return items
+		return {
+			"items": _enrich_items(items, pos_profile_doc),
+			"deleted": [code for code in changed_codes if code not in live_codes],
+			"cursor": {"modified": str(last["changed_at"]), "name": last["item_code"]},
+			"has_more": has_more,
+		}
 	except Exception as e:
-		frappe.log_error(frappe.get_traceback(), "Get Items Error")
-		frappe.throw(_("Error fetching items: {0}").format(str(e)))
+		frappe.log_error(frappe.get_traceback(), "Get Items Delta Error")
+		frappe.throw(_("Error fetching item changes: {0}").format(str(e)))
 
 
 @frappe.whitelist()
@@ -799,6 +1133,416 @@ def get_item_details(item_code, pos_profile, customer=None, qty=1, uom=None):
 		frappe.throw(_("Error fetching item details: {0}").format(str(e)))
 
 
+def _get_price_list_currency(price_list, company):
+	"""Return (price_list_currency, exchange_rate to the company currency)."""
+	company_currency = frappe.get_cached_value("Company", company, "default_currency")
+	price_list_currency = company_currency
+	if price_list:
+		price_list_currency = frappe.get_cached_value("Price List", price_list, "currency") or company_currency
+
+	exchange_rate = 1
+	if price_list_currency != company_currency:
+		from erpnext.setup.utils import get_exchange_rate
+
+		try:
+			exchange_rate = get_exchange_rate(price_list_currency, company_currency, nowdate())
+		except Exception:
+			frappe.log_error(
+				f"Missing exchange rate from {price_list_currency} to {company_currency}",
+				"POS Next",
+			)
+
+	return price_list_currency, exchange_rate
+
+
+def _get_batch_availability(item_codes, warehouses):
+	"""
+	Return {item_code: [batch rows]} of unexpired, enabled batches with stock in
+	the given warehouses.
+
+	Balances come from the same helper invoice stock validation uses, so bulk
+	item details never offer a batch that submission would reject.
+	"""
+	from pos_next.api.invoices import _get_batch_qty_map
+
+	if not item_codes or not warehouses:
+		return {}
+
+	batch_qty = defaultdict(float)
+	for (batch_no, _warehouse), qty in _get_batch_qty_map(
+		(item_code, warehouse) for item_code in item_codes for warehouse in warehouses
+	).items():
+		if batch_no:
+			batch_qty[batch_no] += qty
+
+	batch_qty = {batch_no: qty for batch_no, qty in batch_qty.items() if qty > 0}
+	if not batch_qty:
+		return {}
+
+	batches = defaultdict(list)
+	for row in frappe.get_all(
+		"Batch",
+		filters={"name": ["in", list(batch_qty)], "disabled": 0},
+		fields=["name", "item", "expiry_date", "manufacturing_date"],
+	):
+		if row.expiry_date and str(row.expiry_date) <= nowdate():
+			continue
+		batches[row.item].append(
+			frappe._dict(
+				batch_no=row.name,
+				batch_qty=batch_qty[row.name],
+				expiry_date=row.expiry_date,
+				manufacturing_date=row.manufacturing_date,
+			)
+		)
+
+	for rows in batches.values():
+		rows.sort(key=lambda row: (row.expiry_date is not None, str(row.expiry_date or ""), row.batch_no))
+
+	return batches
+
+
+def _get_item_tax_templates(items, tax_category=None):
+	"""
+	Return {item_code: (item_tax_template, {tax_type: tax_rate})}.
+
+	Templates set on the item win over its variant template and then its item
+	group, as in ERPNext; rows for the profile's tax category win over rows
+	without one.
+	"""
+	parents = {"Item": set(), "Item Group": set()}
+	for item in items:
+		parents["Item"].update(code for code in (item.item_code, item.variant_of) if code)
+		if item.item_group:
+			parents["Item Group"].add(item.item_group)
+
+	rows = frappe.db.sql(
+		"""
+		SELECT parent, parenttype, item_tax_template, tax_category, valid_from
+		FROM `tabItem Tax`
+		WHERE ((parenttype = 'Item' AND parent IN %(items)s)
+			OR (parenttype = 'Item Group' AND parent IN %(item_groups)s))
+			AND (valid_from IS NULL OR valid_from <= %(today)s)
+		ORDER BY valid_from DESC, idx
+		""",
+		{
+			"items": list(parents["Item"]) or [""],
+			"item_groups": list(parents["Item Group"]) or [""],
+			"today": nowdate(),
+		},
+		as_dict=1,
+	)
+
+	templates_by_parent = {}
+	for row in rows:
+		if row.tax_category and row.tax_category != tax_category:
+			continue
+		key = (row.parenttype, row.parent)
+		current = templates_by_parent.get(key)
+		if not current or (row.tax_category and not current.tax_category):
+			templates_by_parent[key] = row
+
+	template_names = list({row.item_tax_template for row in templates_by_parent.values()})
+	tax_rates = defaultdict(dict)
+	if template_names:
+		for row in frappe.db.sql(
+			"""
+			SELECT parent, tax_type, tax_rate
+			FROM `tabItem Tax Template Detail`
+			WHERE parent IN %s
+			""",
+			[template_names],
+			as_dict=1,
+		):
+			tax_rates[row.parent][row.tax_type] = flt(row.tax_rate)
+
+	result = {}
+	for item in items:
+		for key in (("Item", item.item_code), ("Item", item.variant_of), ("Item Group", item.item_group)):
+			row = templates_by_parent.get(key)
+			if row:
+				result[item.item_code] = (row.item_tax_template, tax_rates.get(row.item_tax_template, {}))
+				break
+
+	return result
+
+
+@frappe.whitelist()
+def get_items_details_bulk(items, pos_profile, customer=None):
+	"""
+	Get item details for many cart lines at once, e.g. when a held draft or an
+	offline invoice is reopened.
+
+	Price, UOM conversions, stock, batch/serial availability and item taxes are
+	resolved for all lines with a fixed number of batched queries instead of one
+	get_item_details call per line. Item Prices are limited to the ones valid
+	today, and Pricing Rules are applied to all lines in one evaluation, so
+	``rate``, ``discount_percentage``, ``discount_amount`` and ``pricing_rules``
+	match what get_item_details returns.
+
+	Args:
+		items: JSON string or list of {"item_code", "qty", "uom"} (or plain item codes)
+		pos_profile: POS Profile name
+		customer: Customer name, used for customer-specific Item Prices
+
+	Returns:
+		list: One entry per input line, in input order, with either ``item`` or ``error``
+	"""
+	try:
+		if isinstance(items, str):
+			items = json.loads(items)
+
+		lines = []
+		for line in items or []:
+			if not isinstance(line, dict):
+				line = {"item_code": line}
+			lines.append(
+				frappe._dict(
+					item_code=cstr(line.get("item_code")).strip(),
+					qty=flt(line.get("qty")) or 1,
+					uom=line.get("uom"),
+				)
+			)
+
+		pos_profile = _parse_pos_profile_name(pos_profile)
+		pos_profile_doc = _get_scan_profile(pos_profile)
+		warehouse = pos_profile_doc.warehouse
+		price_list = pos_profile_doc.selling_price_list
+
+		item_codes = list(dict.fromkeys(line.item_code for line in lines if line.item_code))
+		if not item_codes:
+			return [{"item_code": line.item_code, "error": _("Item Code is required")} for line in lines]
+
+		item_rows = frappe.db.sql(
+			f"""
+			SELECT
+				{ITEM_RESULT_COLUMNS},
+				variant_of,
+				max_discount,
+				is_sales_item,
+				disabled
+			FROM `tabItem`
+			WHERE name IN %s
+			""",
+			[item_codes],
+			as_dict=1,
+		)
+		item_map = {row.item_code: row for row in item_rows}
+		valid_items = [row for row in item_rows if row.is_sales_item and not row.disabled]
+		valid_codes = [row.item_code for row in valid_items]
+
+		# Variants without their own price fall back to the template price, as in ERPNext
+		price_codes = valid_codes + [row.variant_of for row in valid_items if row.variant_of]
+		price_map = item_cache.get_item_prices(price_list, price_codes)
+		if customer and valid_codes:
+			for row in frappe.db.sql(
+				"""
+				SELECT item_code, uom, price_list_rate
+				FROM `tabItem Price`
+				WHERE item_code IN %(codes)s AND price_list = %(price_list)s AND customer = %(customer)s
+					AND IFNULL(valid_from, '2000-01-01') <= %(today)s
+					AND IFNULL(valid_upto, '2500-12-31') >= %(today)s
+				ORDER BY IFNULL(valid_from, '2000-01-01')
+				""",
+				{"codes": price_codes, "price_list": price_list, "customer": customer, "today": nowdate()},
+				as_dict=1,
+			):
+				price_map.setdefault(row.item_code, {})[row.uom or ""] = row.price_list_rate
+
+		meta_map = item_cache.get_item_meta(valid_codes)
+		stock_map = item_cache.get_item_stock(
+			warehouse, [row.item_code for row in valid_items if row.is_stock_item]
+		)
+
+		leaf_warehouses = item_cache.get_leaf_warehouses(warehouse)
+		batch_map = _get_batch_availability(
+			[row.item_code for row in valid_items if row.has_batch_no], leaf_warehouses
+		)
+		serial_map = defaultdict(list)
+		serial_codes = [row.item_code for row in valid_items if row.has_serial_no]
+		if serial_codes:
+			for row in frappe.get_all(
+				"Serial No",
+				filters={"item_code": ["in", serial_codes], "status": "Active", "warehouse": ["in", leaf_warehouses]},
+				fields=["name as serial_no", "item_code"],
+				order_by="creation asc",
+			):
+				serial_map[row.pop("item_code")].append(row)
+
+		tax_map = _get_item_tax_templates(valid_items, pos_profile_doc.get("tax_category"))
+		price_list_currency, exchange_rate = _get_price_list_currency(price_list, pos_profile_doc.company)
+
+		results = []
+		for line in lines:
+			item = item_map.get(line.item_code)
+			if not item:
+				results.append(
+					{"item_code": line.item_code, "error": _("Item {0} not found").format(line.item_code)}
+				)
+				continue
+			if item.disabled:
+				results.append(
+					{"item_code": line.item_code, "error": _("Item {0} is disabled").format(line.item_code)}
+				)
+				continue
+			if not item.is_sales_item:
+				results.append(
+					{
+						"item_code": line.item_code,
+						"error": _("Item {0} is not allowed for sales").format(line.item_code),
+					}
+				)
+				continue
+
+			stock_uom = item.stock_uom
+			uom = line.uom or stock_uom
+			uoms = [dict(row) for row in meta_map.get(item.item_code, {}).get("uoms", [])]
+			if stock_uom and not any(row.get("uom") == stock_uom for row in uoms):
+				uoms.append({"uom": stock_uom, "conversion_factor": 1.0})
+			conversion_factor = next(
+				(flt(row["conversion_factor"]) for row in uoms if row.get("uom") == uom), 0
+			)
+			if not conversion_factor:
+				uom, conversion_factor = stock_uom, 1.0
+
+			# Price for the line UOM, else the stock UOM price scaled by the conversion factor
+			prices = price_map.get(item.item_code) or price_map.get(item.variant_of) or {}
+			if uom in prices:
+				price_list_rate = flt(prices[uom])
+			else:
+				stock_rate = prices.get(stock_uom, prices.get(""))
+				price_list_rate = flt(stock_rate) * conversion_factor if stock_rate is not None else 0.0
+
+			item_tax_template, item_tax_rate = tax_map.get(item.item_code, (None, {}))
+			stock = stock_map.get(item.item_code, {})
+
+			details = frappe._dict(item)
+			for field in ("variant_of", "is_sales_item", "disabled"):
+				details.pop(field, None)
+			details.update(
+				{
+					"qty": line.qty,
+					"uom": uom,
+					"conversion_factor": conversion_factor,
+					"stock_qty": line.qty * conversion_factor,
+					"price_list_rate": price_list_rate,
+					"rate": price_list_rate,
+					"discount_percentage": 0.0,
+					"discount_amount": 0.0,
+					"pricing_rules": [],
+					"selling_price_list": price_list,
+					"price_list_currency": price_list_currency,
+					"plc_conversion_rate": exchange_rate,
+					"conversion_rate": exchange_rate,
+					"warehouse": warehouse,
+					"actual_qty": flt(stock.get("actual_qty")) if item.is_stock_item else 0,
+					"max_discount": flt(item.max_discount),
+					"item_tax_template": item_tax_template,
+					"item_tax_rate": json.dumps(item_tax_rate),
+					"batch_no_data": batch_map.get(item.item_code, []),
+					"serial_no_data": serial_map.get(item.item_code, []),
+					"item_uoms": uoms,
+				}
+			)
+			results.append({"item_code": line.item_code, "item": details})
+
+		_apply_bulk_pricing_rules(
+			[result["item"] for result in results if result.get("item")],
+			pos_profile_doc,
+			customer,
+			price_list_currency,
+			exchange_rate,
+		)
+
+		return results
+	except Exception as e:
+		frappe.log_error(frappe.get_traceback(), "Get Items Details Bulk Error")
+		frappe.throw(_("Error fetching item details: {0}").format(str(e)))
+
+
+def _apply_bulk_pricing_rules(details, pos_profile_doc, customer, currency, conversion_rate):
+	"""
+	Apply item Pricing Rules to many item detail rows in one evaluation.
+
+	Uses the compiled offer engine, with ERPNext's apply_pricing_rule as the
+	fallback for rules it does not model. Free items are left to the offers flow.
+	"""
+	from pos_next.api import offer_engine
+
+	if not details:
+		return
+
+	customer_group = territory = None
+	if customer:
+		customer_group, territory = frappe.get_cached_value(
+			"Customer", customer, ["customer_group", "territory"]
+		) or (None, None)
+
+	pricing_args = frappe._dict(
+		{
+			"doctype": "Sales Invoice",
+			"name": "POS-INVOICE",
+			"company": pos_profile_doc.company,
+			"transaction_date": nowdate(),
+			"posting_date": nowdate(),
+			"currency": pos_profile_doc.get("currency") or currency,
+			"conversion_rate": conversion_rate or 1,
+			"plc_conversion_rate": conversion_rate or 1,
+			"price_list": pos_profile_doc.selling_price_list,
+			"customer": customer,
+			"customer_group": customer_group or "All Customer Groups",
+			"territory": territory,
+			"items": [
+				{
+					"doctype": "Sales Invoice Item",
+					"name": f"row-{idx}",
+					"item_code": row.item_code,
+					"item_group": row.item_group,
+					"brand": row.brand,
+					"qty": row.qty,
+					"stock_qty": row.stock_qty,
+					"uom": row.uom,
+					"stock_uom": row.stock_uom,
+					"conversion_factor": row.conversion_factor,
+					"price_list_rate": row.price_list_rate,
+					"base_price_list_rate": row.price_list_rate,
+					"rate": row.price_list_rate,
+					"warehouse": row.warehouse,
+					"parenttype": "Sales Invoice",
+				}
+				for idx, row in enumerate(details)
+			],
+		}
+	)
+
+	evaluated = offer_engine.apply_pricing_rules(pricing_args)
+	if evaluated:
+		pricing_results = evaluated[0]
+	else:
+		from erpnext.accounts.doctype.pricing_rule.pricing_rule import apply_pricing_rule
+
+		pricing_results = apply_pricing_rule(pricing_args) or []
+
+	for row, result in zip(details, pricing_results):
+		row.pricing_rules = offer_engine.parse_rule_names(result.get("pricing_rules")) if result else []
+		if not row.pricing_rules:
+			continue
+
+		price_list_rate = flt(result.get("price_list_rate") or row.price_list_rate)
+		discount_percentage = flt(result.get("discount_percentage"))
+		discount_amount = flt(result.get("discount_amount"))
+		rate = price_list_rate * (1 - discount_percentage / 100) - discount_amount
+
+		row.update(
+			{
+				"price_list_rate": price_list_rate,
+				"discount_percentage": discount_percentage,
+				"discount_amount": price_list_rate - rate,
+				"rate": max(rate, 0),
+			}
+		)
+
+
 @frappe.whitelist()
 def get_item_groups(pos_profile):
 	"""Get item groups for filtering"""
@@ -871,37 +1615,8 @@ def get_stock_quantities(item_codes, warehouse):
 		if not normalized_codes:
 			return []
 
-		# Support group warehouses by expanding to leaf warehouses
-		warehouses = [warehouse]
-		if frappe.db.get_value("Warehouse", warehouse, "is_group"):
-			child_warehouses = frappe.db.get_descendants("Warehouse", warehouse) or []
-			# Fallback to original warehouse if no children are returned
-			warehouses = child_warehouses or [warehouse]
-
-		if not warehouses:
-			return []
-
-		# Batch query for stock quantities across all relevant warehouses
-		stock_rows = frappe.db.sql(
-			"""
-			SELECT
-				item_code,
-				COALESCE(SUM(actual_qty), 0) AS actual_qty,
-				COALESCE(SUM(reserved_qty), 0) AS reserved_qty
-			FROM `tabBin`
-			WHERE item_code IN %(item_codes)s
-			AND warehouse IN %(warehouses)s
-			GROUP BY item_code
-			""",
-			{
-				"item_codes": tuple(normalized_codes),
-				"warehouses": tuple(warehouses),
-			},
-			as_dict=1,
-		)
-
-		# Create a lookup for items that have stock entries
-		stock_lookup = {row["item_code"]: row for row in stock_rows}
+		# Group warehouses are rolled up over their leaf warehouses by the item cache
+		stock_lookup = item_cache.get_item_stock(warehouse, normalized_codes)
 
 		# Return stock for all requested items (0 if not in Bin table)
 		result = []
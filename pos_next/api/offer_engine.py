@@ -0,0 +1,514 @@
+# Copyright (c) 2026, POS Next and contributors
+# For license information, please see license.txt
+
+"""
+Offer Engine - In-process evaluation of item-level Pricing Rules for POS
+
+Active selling Pricing Rules of a company (including the ones generated from
+Promotional Scheme slabs) are compiled once into indexes keyed by item code,
+item group and brand, together with the Item Group, Customer Group and
+Territory trees. Cart lines are then priced in memory following ERPNext's
+selection rules (qty/amount filters, priority, apply_multiple_pricing_rules,
+internal priority) and results are returned in the shape of ERPNext's
+``apply_pricing_rule``.
+
+Rules relying on features not modelled here (conditions, mixed or cumulative
+conditions, rules on other items, warehouses, margins) and conflicts ERPNext
+would reject make ``apply_pricing_rules`` return None, so callers fall back to
+ERPNext's engine.
+
+Compiled engines live in process memory per (site, company, date) and are
+rebuilt when the offers version stamp changes (see ``bump_offers_version``).
+Engines of earlier dates are dropped once a later date is built, and at most
+``MAX_CACHED_ENGINES`` are kept per process.
+"""
+
+import json
+from collections import OrderedDict
+
+import frappe
+from frappe.utils import cint, flt
+
+OFFERS_VERSION_KEY = "pos_next:offers_version"
+
+# Child tables holding the "apply on" values of a Pricing Rule
+APPLY_ON_TABLES = (
+	("item_code", "Pricing Rule Item Code"),
+	("item_group", "Pricing Rule Item Group"),
+	("brand", "Pricing Rule Brand"),
+)
+
+# Same order ERPNext uses for its internal priority between equal rules
+INTERNAL_PRIORITY_FIELDS = (
+	("item_code", "variant_of", "item_group", "brand"),
+	("customer", "customer_group", "territory"),
+	("supplier", "supplier_group"),
+)
+ALL_PRIORITY_FIELDS = (
+	"item_code", "item_group", "brand", "customer", "customer_group", "territory",
+	"supplier", "supplier_group", "campaign", "sales_partner", "variant_of",
+)
+
+# Rule fields shipped in the client rule bundle
+BUNDLE_RULE_FIELDS = (
+	"name", "title", "apply_on", "price_or_product_discount", "priority",
+	"apply_multiple_pricing_rules", "mixed_conditions", "is_cumulative",
+	"validate_applied_rule", "for_price_list", "currency",
+	"customer", "customer_group", "territory",
+	"min_qty", "max_qty", "min_amt", "max_amt",
+	"rate_or_discount", "rate", "discount_percentage", "discount_amount",
+	"same_item", "free_item", "free_qty", "free_item_rate", "free_item_uom",
+	"is_recursive", "recurse_for", "apply_recursion_over", "round_free_qty",
+	"promotional_scheme", "promotional_scheme_id", "valid_from", "valid_upto",
+)
+BUNDLE_FORMAT = 1
+
+# Compiled engines per (site, company, date), least recently used first
+_engines = OrderedDict()
+MAX_CACHED_ENGINES = 16
+
+
+class UnsupportedRule(Exception):
+	"""A candidate rule needs ERPNext's pricing engine."""
+
+
+# ============================================================================
+# Version Stamp
+# ============================================================================
+
+def get_offers_version() -> str:
+	"""Current offers version; a new one is issued whenever offer data changes."""
+	version = frappe.cache().get_value(OFFERS_VERSION_KEY)
+	if not version:
+		version = frappe.generate_hash(length=12)
+		frappe.cache().set_value(OFFERS_VERSION_KEY, version)
+	return version
+
+
+def bump_offers_version(doc=None, method=None):
+	"""Issue a new offers version once the current transaction commits (doc_events)."""
+	frappe.db.after_commit.add(
+		lambda: frappe.cache().set_value(OFFERS_VERSION_KEY, frappe.generate_hash(length=12))
+	)
+
+
+# ============================================================================
+# Compiled Engine
+# ============================================================================
+
+class OfferEngine:
+	"""Pricing Rules of one company, valid on one date, indexed for lookup by cart line"""
+
+	def __init__(self, company: str, date: str, version: str):
+		self.company = company
+		self.date = date
+		self.version = version
+
+		self.rules = self._load_rules()
+		self.index = {field: {} for field, _table in APPLY_ON_TABLES}
+		self.eligibility = {}
+		self._load_apply_on()
+
+		self.parents = {
+			"item_group": self._load_tree("Item Group", "parent_item_group"),
+			"customer_group": self._load_tree("Customer Group", "parent_customer_group"),
+			"territory": self._load_tree("Territory", "parent_territory"),
+		}
+		self._ancestors = {}
+
+		self.free_items = self._load_free_items()
+
+	def _load_rules(self) -> dict[str, dict]:
+		rules = frappe.db.sql("""
+			SELECT *
+			FROM `tabPricing Rule`
+			WHERE
+				disable = 0
+				AND selling = 1
+				AND IFNULL(coupon_code_based, 0) = 0
+				AND apply_on != 'Transaction'
+				AND IFNULL(company, '') IN (%(company)s, '')
+				AND IFNULL(valid_from, '2000-01-01') <= %(date)s
+				AND IFNULL(valid_upto, '2500-12-31') >= %(date)s
+			ORDER BY priority DESC, name DESC
+		""", {"company": self.company, "date": self.date}, as_dict=1)
+
+		compiled = {}
+		for rule in rules:
+			# POS invoices carry no campaign, sales partner or supplier, so these never match
+			if rule.get("campaign") or rule.get("sales_partner") or rule.get("supplier") or rule.get("supplier_group"):
+				continue
+			rule.unsupported = bool(
+				rule.get("condition")
+				or rule.get("mixed_conditions")
+				or rule.get("is_cumulative")
+				or rule.get("apply_rule_on_other")
+				or rule.get("warehouse")
+				or (rule.get("margin_type") and flt(rule.get("margin_rate_or_amount")))
+			)
+			rule.priority = cint(rule.priority)
+			compiled[rule.name] = rule
+
+		return compiled
+
+	def _load_apply_on(self):
+		if not self.rules:
+			return
+
+		union = " UNION ALL ".join(
+			f"SELECT parent, '{field}' AS field, {field} AS value, uom FROM `tab{table}` WHERE parent IN %(rules)s"
+			for field, table in APPLY_ON_TABLES
+		)
+		for row in frappe.db.sql(union, {"rules": list(self.rules)}, as_dict=1):
+			rule = self.rules[row.parent]
+			if row.field != frappe.scrub(rule.apply_on):
+				continue
+			self.index[row.field].setdefault(row.value, []).append((rule, row.uom))
+			self.eligibility.setdefault(rule.name, []).append({"value": row.value, "uom": row.uom or None})
+
+	@staticmethod
+	def _load_tree(doctype: str, parent_field: str) -> dict[str, str]:
+		return {
+			row.name: row.parent
+			for row in frappe.get_all(doctype, fields=["name", f"{parent_field} as parent"])
+		}
+
+	def _load_free_items(self) -> dict[str, dict]:
+		codes = list({rule.free_item for rule in self.rules.values() if rule.get("free_item")})
+		if not codes:
+			return {}
+		return {
+			row.name: row
+			for row in frappe.get_all(
+				"Item",
+				filters={"name": ["in", codes]},
+				fields=["name", "item_name", "description", "stock_uom"],
+			)
+		}
+
+	def ancestors(self, tree: str, name: str | None) -> list[str]:
+		"""``name`` and its ancestors in the given tree"""
+		if not name:
+			return []
+		key = (tree, name)
+		if key not in self._ancestors:
+			parents = self.parents[tree]
+			chain = [name]
+			while parents.get(chain[-1]) and parents[chain[-1]] not in chain:
+				chain.append(parents[chain[-1]])
+			self._ancestors[key] = chain
+		return self._ancestors[key]
+
+	# ------------------------------------------------------------------------
+	# Evaluation
+	# ------------------------------------------------------------------------
+
+	def evaluate(self, args: dict) -> list[dict]:
+		"""Price every line of ``args.items``; raises UnsupportedRule for ERPNext-only cases"""
+		return [self._evaluate_line(args, frappe._dict(line)) for line in args.get("items") or []]
+
+	def _evaluate_line(self, args: dict, line: dict) -> dict:
+		line_args = frappe._dict(args)
+		line_args.update(line)
+		line_args.pop("items", None)
+
+		result = frappe._dict({"name": line.get("name"), "pricing_rules": [], "free_item_data": []})
+
+		candidates = self._candidates(line_args)
+		if not candidates:
+			return result
+
+		if any(rule.get("apply_multiple_pricing_rules") for rule in candidates):
+			# Each rule filtered on its own; only stackable ones apply, lowest priority first
+			rules = []
+			for rule in candidates:
+				rule = self._select([rule], line_args)
+				if rule and rule.get("apply_multiple_pricing_rules"):
+					rules.append(rule)
+			rules.sort(key=lambda rule: rule.priority or 1)
+		else:
+			rule = self._select(candidates, line_args)
+			rules = [rule] if rule else []
+
+		for rule in rules:
+			result.pricing_rules.append(rule.name)
+			if rule.get("validate_applied_rule"):
+				continue
+			if rule.price_or_product_discount == "Price":
+				self._apply_price_discount(rule, line_args, result)
+			else:
+				self._apply_product_discount(rule, line_args, result)
+
+		return result
+
+	def _candidates(self, args: dict) -> list[dict]:
+		"""Rules matching the line's item, customer and price list, one entry per matched key"""
+		keys = [("item_code", args.item_code)]
+		if args.get("variant_of"):
+			keys.append(("item_code", args.variant_of))
+		keys.extend(("item_group", group) for group in self.ancestors("item_group", args.get("item_group")))
+		if args.get("brand"):
+			keys.append(("brand", args.brand))
+
+		customer_groups = self.ancestors("customer_group", args.get("customer_group"))
+		territories = self.ancestors("territory", args.get("territory"))
+
+		candidates = []
+		seen = set()
+		for field, value in keys:
+			for rule, uom in self.index[field].get(value, []):
+				if rule.name in seen:
+					continue
+				if uom and uom != args.get("uom"):
+					if field == "item_code":
+						continue
+					raise UnsupportedRule(rule.name)
+				if rule.get("for_price_list") and rule.for_price_list != args.get("price_list"):
+					continue
+				if rule.get("customer") and rule.customer != args.get("customer"):
+					continue
+				if customer_groups and rule.get("customer_group") and rule.customer_group not in customer_groups:
+					continue
+				if territories and rule.get("territory") and rule.territory not in territories:
+					continue
+				if rule.unsupported:
+					raise UnsupportedRule(rule.name)
+
+				seen.add(rule.name)
+				candidate = frappe._dict(rule)
+				candidate.update({"item_code": None, "item_group": None, "brand": None, field: value})
+				candidate.uom = uom
+				candidates.append(candidate)
+
+		# Same order as ERPNext's query: priority desc, name desc
+		candidates.sort(key=lambda rule: rule.name, reverse=True)
+		candidates.sort(key=lambda rule: rule.priority, reverse=True)
+		return candidates
+
+	def _select(self, rules: list[dict], args: dict) -> dict | None:
+		"""ERPNext's filter_pricing_rules: qty/amount, priority, internal priority, price list"""
+		stock_qty = flt(args.get("stock_qty"))
+		amount = flt(args.get("price_list_rate")) * flt(args.get("qty"))
+
+		rules = [rule for rule in rules if self._within_limits(rule, args, stock_qty, amount)]
+		if not rules:
+			return None
+
+		max_priority = max(cint(rule.priority) for rule in rules)
+		if max_priority:
+			rules = [rule for rule in rules if cint(rule.priority) == max_priority]
+
+		if len(rules) > 1:
+			for field_set in INTERNAL_PRIORITY_FIELDS:
+				remaining = [field for field in ALL_PRIORITY_FIELDS if field not in field_set]
+				if all(
+					all(rule.get(field) == rules[0].get(field) for field in remaining)
+					for rule in rules
+				):
+					rules = _apply_internal_priority(rules, field_set, args)
+					break
+
+		if len(rules) > 1 and {rule.rate_or_discount for rule in rules} == {"Discount Percentage"}:
+			rules = [rule for rule in rules if rule.for_price_list == args.get("price_list")] or rules
+
+		if len(rules) > 1:
+			# ERPNext rejects this as a Multiple Price Rules conflict
+			raise UnsupportedRule(", ".join(rule.name for rule in rules))
+
+		return rules[0]
+
+	@staticmethod
+	def _within_limits(rule: dict, args: dict, stock_qty: float, amount: float) -> bool:
+		conversion_factor = (flt(args.get("conversion_factor")) or 1) if rule.get("uom") else 1
+		if stock_qty < flt(rule.min_qty) * conversion_factor:
+			return False
+		if rule.max_qty and stock_qty > flt(rule.max_qty) * conversion_factor:
+			return False
+		if amount < flt(rule.min_amt):
+			return False
+		if rule.max_amt and amount > flt(rule.max_amt):
+			return False
+		return True
+
+	@staticmethod
+	def _apply_price_discount(rule: dict, args: dict, result: dict):
+		"""ERPNext's apply_price_discount_rule"""
+		if rule.rate_or_discount == "Rate":
+			if rule.get("currency") == args.get("currency") and flt(rule.rate):
+				# A rule without a UOM (or for another one) is per stock UOM
+				conversion_factor = (
+					flt(args.get("conversion_factor") or 1) if rule.get("uom") != args.get("uom") else 1
+				)
+				result.price_list_rate = flt(rule.rate) * conversion_factor
+			result.discount_percentage = 0.0
+			return
+
+		field = frappe.scrub(rule.rate_or_discount or "")
+		if field not in ("discount_amount", "discount_percentage"):
+			return
+
+		if rule.get("apply_discount_on_rate") and flt(result.get("discount_percentage")):
+			# Discount on the already discounted rate
+			result[field] = flt(result.get(field)) + (100 - flt(result.get(field))) * flt(rule.get(field)) / 100
+		elif flt(args.get("price_list_rate")):
+			result[field] = flt(result.get(field)) + flt(rule.get(field))
+
+	def _apply_product_discount(self, rule: dict, args: dict, result: dict):
+		free_item = args.item_code if rule.get("same_item") else rule.get("free_item")
+		if not free_item:
+			raise UnsupportedRule(rule.name)
+
+		qty = flt(rule.free_qty) or 1
+		if rule.get("is_recursive") and flt(rule.get("recurse_for")):
+			transaction_qty = (flt(args.get("qty")) or 1) - flt(rule.get("apply_recursion_over"))
+			if transaction_qty > 0:
+				qty = transaction_qty * qty / flt(rule.recurse_for)
+				if rule.get("round_free_qty"):
+					qty = int(qty)
+
+		item = self.free_items.get(free_item) or frappe.get_cached_value(
+			"Item", free_item, ["item_name", "description", "stock_uom"], as_dict=1
+		) or {}
+
+		uom = rule.get("free_item_uom") or item.get("stock_uom")
+		conversion_factor = 1
+		if uom and uom != item.get("stock_uom"):
+			from erpnext.stock.get_item_details import get_conversion_factor
+
+			conversion_factor = get_conversion_factor(free_item, uom).get("conversion_factor") or 1
+
+		result.free_item_data.append(
+			frappe._dict({
+				"item_code": free_item,
+				"qty": qty,
+				"pricing_rules": rule.name,
+				"rate": flt(rule.get("free_item_rate")),
+				"price_list_rate": flt(rule.get("free_item_rate")),
+				"is_free_item": 1,
+				"item_name": item.get("item_name"),
+				"description": item.get("description"),
+				"stock_uom": item.get("stock_uom"),
+				"uom": uom,
+				"conversion_factor": conversion_factor,
+			})
+		)
+
+
+	# ------------------------------------------------------------------------
+	# Client Bundle
+	# ------------------------------------------------------------------------
+
+	def to_bundle(self) -> dict:
+		"""
+		Self-describing, JSON-safe copy of the compiled rules for local evaluation.
+
+		Rules are listed in evaluation order (priority desc, name desc) with their
+		eligibility; ``client_evaluable`` is 0 for rules only ERPNext can evaluate,
+		so terminals leave those to the server. ``offer`` marks the rules
+		apply_offers reports (promotional scheme rules).
+		"""
+		rules = sorted(self.rules.values(), key=lambda rule: rule.name, reverse=True)
+		rules.sort(key=lambda rule: rule.priority, reverse=True)
+
+		bundle_rules = []
+		for rule in rules:
+			entry = {field: _json_value(rule.get(field)) for field in BUNDLE_RULE_FIELDS}
+			entry["apply_on_field"] = frappe.scrub(rule.apply_on)
+			entry["eligibility"] = sorted(
+				self.eligibility.get(rule.name, []), key=lambda row: (row["value"] or "", row["uom"] or "")
+			)
+			entry["client_evaluable"] = 0 if rule.unsupported else 1
+			entry["offer"] = 1 if rule.get("promotional_scheme") else 0
+			bundle_rules.append(entry)
+
+		return {
+			"format": BUNDLE_FORMAT,
+			"company": self.company,
+			"date": self.date,
+			"rules": bundle_rules,
+			"trees": {tree: dict(sorted(parents.items())) for tree, parents in self.parents.items()},
+			"free_items": {
+				code: {
+					"item_name": item.item_name,
+					"description": item.description,
+					"stock_uom": item.stock_uom,
+				}
+				for code, item in sorted(self.free_items.items())
+			},
+		}
+
+
+def _json_value(value):
+	"""Dates as ISO strings and decimals as floats, other values unchanged"""
+	if hasattr(value, "isoformat"):
+		return value.isoformat()
+	if value is not None and not isinstance(value, (str, int, float)):
+		return flt(value)
+	return value
+
+
+def _apply_internal_priority(rules: list[dict], field_set, args: dict) -> list[dict]:
+	for field in field_set:
+		if args.get(field):
+			filtered = [rule for rule in rules if rule.get(field) == args.get(field)]
+			if filtered:
+				return filtered
+	return rules
+
+
+
+# ============================================================================
+# Public API
+# ============================================================================
+
+def get_engine(company: str, date: str) -> OfferEngine:
+	"""Compiled engine for company and date, rebuilt when the offers version changes"""
+	version = get_offers_version()
+	key = (frappe.local.site, company, str(date))
+
+	engine = _engines.get(key)
+	if engine and engine.version == version:
+		_engines.move_to_end(key)
+		return engine
+
+	# Drop this company's engines of earlier dates or older versions
+	for stale in [
+		k for k, cached in _engines.items()
+		if k[:2] == key[:2] and (k[2] < key[2] or cached.version != version)
+	]:
+		_engines.pop(stale, None)
+
+	engine = OfferEngine(company, str(date), version)
+	_engines[key] = engine
+	while len(_engines) > MAX_CACHED_ENGINES:
+		_engines.popitem(last=False)
+
+	return engine
+
+
+def apply_pricing_rules(pricing_args: dict):
+	"""
+	Evaluate ``pricing_args`` (as passed to ERPNext's apply_pricing_rule) in memory.
+
+	Returns (results, rules) - per-line results and compiled rules by name - or
+	None when ERPNext's engine must be used instead.
+	"""
+	try:
+		engine = get_engine(pricing_args.company, pricing_args.transaction_date)
+		return engine.evaluate(pricing_args), engine.rules
+	except UnsupportedRule:
+		return None
+	except Exception:
+		frappe.log_error(frappe.get_traceback(), "Offer Engine Error")
+		return None
+
+
+def parse_rule_names(pricing_rules) -> list[str]:
+	"""Pricing rule names from a result's ``pricing_rules`` (list, JSON list or comma separated)"""
+	if not pricing_rules:
+		return []
+	if isinstance(pricing_rules, (list, tuple, set)):
+		return list(pricing_rules)
+	if pricing_rules.startswith("["):
+		return json.loads(pricing_rules)
+	return [name.strip() for name in pricing_rules.split(",") if name.strip()]
@@ -9,11 +9,14 @@ This module provides a clean API for retrieving promotional offers from both
 Promotional Schemes and standalone Pricing Rules.
 """
 
-from typing import Dict, List, Optional
-from dataclasses import dataclass, asdict
+from bisect import bisect_right
+from typing import Dict, List, Optional, Union
+from dataclasses import dataclass, asdict, field
 import frappe
 from frappe import _
-from frappe.utils import flt, nowdate
+from frappe.utils import cint, flt, nowdate
+
+from pos_next.api.offer_engine import get_engine, get_offers_version
 
 
 # ============================================================================
@@ -40,6 +43,11 @@ class OfferSource:
 	PRICING_RULE = "Pricing Rule"
 
 
+# Built offer lists are cached per company, date and offers version
+OFFERS_CACHE_PREFIX = "pos_next:offers"
+OFFERS_CACHE_TTL = 24 * 60 * 60
+
+
 # ============================================================================
 # Data Classes
 # ============================================================================
@@ -78,6 +86,10 @@ class Offer:
 	eligible_items: List[str]
 	eligible_item_groups: List[str]
 	eligible_brands: List[str]
+	slabs: List[Dict] = field(default_factory=list)
+	# Ranges are checked on the summed eligible lines instead of each line
+	is_cumulative: int = 0
+	mixed_conditions: int = 0
 
 	def to_dict(self) -> Dict:
 		"""Convert to dictionary for API response"""
@@ -105,113 +117,167 @@ class EligibilityFetcher:
 		if not parent_names:
 			return {}
 
-		items_map = EligibilityFetcher._fetch_items(parent_names)
-		item_groups_map = EligibilityFetcher._fetch_item_groups(parent_names)
-		brands_map = EligibilityFetcher._fetch_brands(parent_names)
-
-		# Combine all maps into OfferEligibility objects
-		eligibility = {}
-		for parent in parent_names:
-			eligibility[parent] = OfferEligibility(
-				items=items_map.get(parent, []),
-				item_groups=item_groups_map.get(parent, []),
-				brands=brands_map.get(parent, [])
-			)
-
-		return eligibility
-
-	@staticmethod
-	def _fetch_items(parent_names: List[str]) -> Dict[str, List[str]]:
-		"""Fetch item codes for given parents"""
+		# Item codes, item groups and brands in one round trip
 		results = frappe.db.sql("""
-			SELECT parent, item_code
+			SELECT parent, 'items' AS field, item_code AS value
 			FROM `tabPricing Rule Item Code`
-			WHERE parent IN %s
-		""", [parent_names], as_dict=1)
+			WHERE parent IN %(parents)s
+			UNION ALL
+			SELECT parent, 'item_groups' AS field, item_group AS value
+			FROM `tabPricing Rule Item Group`
+			WHERE parent IN %(parents)s
+			UNION ALL
+			SELECT parent, 'brands' AS field, brand AS value
+			FROM `tabPricing Rule Brand`
+			WHERE parent IN %(parents)s
+		""", {"parents": parent_names}, as_dict=1)
 
-		items_map = {}
+		eligibility = {
+			parent: OfferEligibility(items=[], item_groups=[], brands=[])
+			for parent in parent_names
+		}
 		for row in results:
-			items_map.setdefault(row["parent"], []).append(row["item_code"])
-		return items_map
+			getattr(eligibility[row["parent"]], row["field"]).append(row["value"])
 
-	@staticmethod
-	def _fetch_item_groups(parent_names: List[str]) -> Dict[str, List[str]]:
-		"""Fetch item groups for given parents"""
-		results = frappe.db.sql("""
-			SELECT parent, item_group
-			FROM `tabPricing Rule Item Group`
-			WHERE parent IN %s
-		""", [parent_names], as_dict=1)
+		return eligibility
 
-		groups_map = {}
-		for row in results:
-			groups_map.setdefault(row["parent"], []).append(row["item_group"])
-		return groups_map
 
-	@staticmethod
-	def _fetch_brands(parent_names: List[str]) -> Dict[str, List[str]]:
-		"""Fetch brands for given parents"""
-		results = frappe.db.sql("""
-			SELECT parent, brand
-			FROM `tabPricing Rule Brand`
-			WHERE parent IN %s
-		""", [parent_names], as_dict=1)
+def build_offer_index(offers: List[Dict]) -> Dict[str, Dict[str, List[str]]]:
+	"""
+	Inverted eligibility index: item code, item group and brand to offer names
 
-		brands_map = {}
-		for row in results:
-			brands_map.setdefault(row["parent"], []).append(row["brand"])
-		return brands_map
+	Offers without any eligibility entries (e.g. apply on Transaction) are
+	listed under "unrestricted", as they match every cart.
+	"""
+	index = {"item_code": {}, "item_group": {}, "brand": {}, "unrestricted": []}
+
+	for offer in offers:
+		entries = (
+			[("item_code", value) for value in offer["eligible_items"]]
+			+ [("item_group", value) for value in offer["eligible_item_groups"]]
+			+ [("brand", value) for value in offer["eligible_brands"]]
+		)
+		if not entries:
+			index["unrestricted"].append(offer["name"])
+			continue
+
+		for key, value in entries:
+			names = index[key].setdefault(value, [])
+			if offer["name"] not in names:
+				names.append(offer["name"])
+
+	return index
+
+
+class SlabTable:
+	"""All slabs of one promotional scheme, sorted for range lookup"""
+
+	def __init__(self, slabs: List[Dict]):
+		# Tiers are keyed on quantity, or on amount when no slab sets a quantity
+		self.key = "min_qty" if any(flt(slab.get("min_qty")) for slab in slabs) else "min_amount"
+		other = "min_amount" if self.key == "min_qty" else "min_qty"
+
+		self.slabs = sorted(slabs, key=lambda slab: (flt(slab.get(self.key)), flt(slab.get(other))))
+		self._bounds = [flt(slab.get(self.key)) for slab in self.slabs]
+		self._by_name = {slab.get("name"): slab for slab in self.slabs}
+
+	def first(self) -> Optional[Dict]:
+		"""Lowest tier"""
+		return self.slabs[0] if self.slabs else None
+
+	def get(self, slab_name: Optional[str]) -> Optional[Dict]:
+		"""Slab by row name (a scheme Pricing Rule's promotional_scheme_id)"""
+		return self._by_name.get(slab_name)
+
+	def find(self, qty: float = 0, amount: float = 0) -> Optional[Dict]:
+		"""Highest tier covering qty and amount, located by binary search on the tier key"""
+		value = flt(qty) if self.key == "min_qty" else flt(amount)
+		index = bisect_right(self._bounds, value)
+
+		for slab in reversed(self.slabs[:index]):
+			if _slab_covers(slab, qty, amount):
+				return slab
+		return None
+
+	def to_list(self) -> List[Dict]:
+		"""Slabs in tier order for API responses"""
+		return [
+			{
+				"name": slab.get("name"),
+				"min_qty": flt(slab.get("min_qty")),
+				"max_qty": flt(slab.get("max_qty")),
+				"min_amt": flt(slab.get("min_amount")),
+				"max_amt": flt(slab.get("max_amount")),
+				"discount_type": slab.get("rate_or_discount"),
+				"rate": flt(slab.get("rate")),
+				"discount_amount": flt(slab.get("discount_amount")),
+				"discount_percentage": flt(slab.get("discount_percentage")),
+				"free_item": slab.get("free_item"),
+				"same_item": slab.get("same_item"),
+				"free_qty": flt(slab.get("free_qty")),
+				"free_item_rate": flt(slab.get("free_item_rate")),
+				"apply_multiple_pricing_rules": slab.get("apply_multiple_pricing_rules"),
+			}
+			for slab in self.slabs
+		]
+
+
+def _slab_covers(slab: Dict, qty: float, amount: float) -> bool:
+	"""Whether qty and amount fall within the slab's ranges (0 maximum = open)"""
+	if flt(qty) < flt(slab.get("min_qty")) or flt(amount) < flt(slab.get("min_amount")):
+		return False
+	if flt(slab.get("max_qty")) and flt(qty) > flt(slab.get("max_qty")):
+		return False
+	if flt(slab.get("max_amount")) and flt(amount) > flt(slab.get("max_amount")):
+		return False
+	return True
 
 
 class SlabFetcher:
 	"""Fetches discount slabs for promotional schemes"""
 
 	@staticmethod
-	def fetch_price_slabs(scheme_names: List[str]) -> Dict[str, Dict]:
-		"""Fetch first price discount slab for each scheme"""
+	def fetch_price_slabs(scheme_names: List[str]) -> Dict[str, SlabTable]:
+		"""Fetch all price discount slabs for each scheme"""
 		if not scheme_names:
 			return {}
 
 		results = frappe.db.sql("""
 			SELECT
-				parent, min_qty, max_qty, min_amount, max_amount,
+				name, parent, min_qty, max_qty, min_amount, max_amount,
 				rate_or_discount, rate, discount_amount, discount_percentage,
 				apply_multiple_pricing_rules
 			FROM `tabPromotional Scheme Price Discount`
 			WHERE parent IN %s AND disable = 0
-			ORDER BY parent, min_amount ASC, min_qty ASC
 		""", [scheme_names], as_dict=1)
 
-		# Take first slab for each parent
-		slabs_map = {}
-		for slab in results:
-			if slab["parent"] not in slabs_map:
-				slabs_map[slab["parent"]] = slab
-
-		return slabs_map
+		return SlabFetcher._group(results)
 
 	@staticmethod
-	def fetch_product_slabs(scheme_names: List[str]) -> Dict[str, Dict]:
-		"""Fetch first product discount slab for each scheme"""
+	def fetch_product_slabs(scheme_names: List[str]) -> Dict[str, SlabTable]:
+		"""Fetch all product discount slabs for each scheme"""
 		if not scheme_names:
 			return {}
 
 		results = frappe.db.sql("""
 			SELECT
-				parent, min_qty, max_qty, min_amount, max_amount,
+				name, parent, min_qty, max_qty, min_amount, max_amount,
+				same_item, free_item, free_qty, free_item_rate,
 				apply_multiple_pricing_rules
 			FROM `tabPromotional Scheme Product Discount`
 			WHERE parent IN %s AND disable = 0
-			ORDER BY parent, min_amount ASC, min_qty ASC
 		""", [scheme_names], as_dict=1)
 
-		# Take first slab for each parent
-		slabs_map = {}
+		return SlabFetcher._group(results)
+
+	@staticmethod
+	def _group(results: List[Dict]) -> Dict[str, SlabTable]:
+		"""Group slab rows by scheme into SlabTables"""
+		grouped = {}
 		for slab in results:
-			if slab["parent"] not in slabs_map:
-				slabs_map[slab["parent"]] = slab
+			grouped.setdefault(slab["parent"], []).append(slab)
 
-		return slabs_map
+		return {parent: SlabTable(slabs) for parent, slabs in grouped.items()}
 
 
 # ============================================================================
@@ -273,7 +339,9 @@ class OfferBuilder:
 			promotional_scheme_id=rule.get("promotional_scheme_id"),
 			eligible_items=eligible_items,
 			eligible_item_groups=eligible_item_groups,
-			eligible_brands=eligible_brands
+			eligible_brands=eligible_brands,
+			is_cumulative=cint(rule.get("is_cumulative")),
+			mixed_conditions=cint(rule.get("mixed_conditions"))
 		)
 
 	@staticmethod
@@ -321,7 +389,9 @@ class OfferBuilder:
 			promotional_scheme_id=None,
 			eligible_items=eligible_items,
 			eligible_item_groups=eligible_item_groups,
-			eligible_brands=eligible_brands
+			eligible_brands=eligible_brands,
+			is_cumulative=cint(rule.get("is_cumulative")),
+			mixed_conditions=cint(rule.get("mixed_conditions"))
 		)
 
 
@@ -330,37 +400,108 @@ class OfferBuilder:
 # ============================================================================
 
 @frappe.whitelist()
-def get_offers(pos_profile: str) -> List[Dict]:
+def get_offers(pos_profile: str, version: Optional[str] = None) -> Union[List[Dict], Dict]:
 	"""
 	Fetch all auto-applicable offers for the POS profile
 
+	Offers are built once per company, date and offers version, and served from
+	the cache until a Pricing Rule, Promotional Scheme or POS Coupon changes.
+
 	Args:
 		pos_profile: POS Profile name
+		version: Offers ETag the terminal already holds. When passed, the response
+			is {"version", "offers", "index"} with the inverted eligibility index
+			(see build_offer_index), or {"version", "not_modified": 1} if the
+			terminal is up to date.
 
 	Returns:
-		List of offer dictionaries
+		List of offer dictionaries, or the versioned response above
 	"""
 	try:
-		profile = frappe.get_doc("POS Profile", pos_profile)
+		company = frappe.get_cached_value("POS Profile", pos_profile, "company")
 		date = nowdate()
+		etag = _get_offers_etag(company, date)
 
-		offers = []
+		if version is not None and version == etag:
+			return {"version": etag, "not_modified": 1}
 
-		# Get offers from promotional schemes
-		scheme_offers = _get_promotional_scheme_offers(profile.company, date)
-		offers.extend(scheme_offers)
+		payload = _get_cached_offers(company, date, etag)
+		if version is None:
+			return payload["offers"]
 
-		# Get standalone pricing rule offers
-		standalone_offers = _get_standalone_pricing_rule_offers(profile.company, date)
-		offers.extend(standalone_offers)
-
-		return [offer.to_dict() for offer in offers]
+		return {"version": etag, **payload}
 
 	except Exception as e:
 		frappe.log_error(f"Error fetching offers: {str(e)}", "Offers API")
 		return []
 
 
+@frappe.whitelist()
+def get_offer_rules(pos_profile: str, version: Optional[str] = None) -> Dict:
+	"""
+	Fetch the rule bundle terminals use to apply offers while offline
+
+	The bundle holds every active selling Pricing Rule (one per Promotional
+	Scheme slab) with priorities, stacking and condition flags, eligibility,
+	free item definitions and the Item Group, Customer Group and Territory
+	trees, in the order the server's offer engine evaluates them. It is built
+	from the same compiled rules as apply_offers and versioned with the same
+	ETag as get_offers.
+
+	Args:
+		pos_profile: POS Profile name
+		version: Offers ETag the terminal already holds
+
+	Returns:
+		Bundle dictionary with its "version", or {"version", "not_modified": 1}
+	"""
+	try:
+		company = frappe.get_cached_value("POS Profile", pos_profile, "company")
+		date = nowdate()
+		etag = _get_offers_etag(company, date)
+
+		if version and version == etag:
+			return {"version": etag, "not_modified": 1}
+
+		cache_key = f"{OFFERS_CACHE_PREFIX}:bundle:{etag}"
+		bundle = frappe.cache().get_value(cache_key)
+		if bundle is None:
+			bundle = get_engine(company, date).to_bundle()
+			frappe.cache().set_value(cache_key, bundle, expires_in_sec=OFFERS_CACHE_TTL)
+
+		return {**bundle, "version": etag}
+
+	except Exception as e:
+		frappe.log_error(f"Error fetching offer rules: {str(e)}", "Offers API")
+		return {}
+
+
+def _get_offers_etag(company: str, date: str) -> str:
+	"""ETag of the offers for company and date under the current offers version"""
+	return f"{get_offers_version()}:{date}:{company}"
+
+
+def _get_cached_offers(company: str, date: str, etag: str) -> Dict:
+	"""Offers for company and date with their eligibility index, built once per offers version"""
+	cache_key = f"{OFFERS_CACHE_PREFIX}:{etag}"
+	payload = frappe.cache().get_value(cache_key)
+	if isinstance(payload, dict):
+		return payload
+
+	offers = []
+
+	# Get offers from promotional schemes
+	offers.extend(_get_promotional_scheme_offers(company, date))
+
+	# Get standalone pricing rule offers
+	offers.extend(_get_standalone_pricing_rule_offers(company, date))
+
+	offers = [offer.to_dict() for offer in offers]
+	payload = {"offers": offers, "index": build_offer_index(offers)}
+	frappe.cache().set_value(cache_key, payload, expires_in_sec=OFFERS_CACHE_TTL)
+	return payload
+
+
 def _get_promotional_scheme_offers(company: str, date: str) -> List[Offer]:
 	"""Fetch offers from promotional schemes"""
 
@@ -369,7 +510,8 @@ def _get_promotional_scheme_offers(company: str, date: str) -> List[Offer]:
 		SELECT
 			name, title, apply_on, selling, promotional_scheme,
 			promotional_scheme_id, coupon_code_based,
-			price_or_product_discount, priority, valid_from, valid_upto
+			price_or_product_discount, priority, valid_from, valid_upto,
+			is_cumulative, mixed_conditions
 		FROM `tabPricing Rule`
 		WHERE
 			disable = 0
@@ -397,17 +539,20 @@ def _get_promotional_scheme_offers(company: str, date: str) -> List[Offer]:
 	for rule in pricing_rules:
 		scheme_name = rule["promotional_scheme"]
 
-		# Get appropriate slab
+		# Slabs of the scheme; each scheme rule is generated from one of them
 		if rule.get("price_or_product_discount") == DiscountType.PRICE:
-			slab = price_slabs.get(scheme_name)
+			slab_table = price_slabs.get(scheme_name)
 		else:
-			slab = product_slabs.get(scheme_name)
+			slab_table = product_slabs.get(scheme_name)
 
-		if not slab:
+		if not slab_table:
 			continue
 
+		slab = slab_table.get(rule.get("promotional_scheme_id")) or slab_table.first()
+
 		eligibility = eligibility_map.get(scheme_name, OfferEligibility([], [], []))
 		offer = OfferBuilder.build_from_scheme_rule(rule, slab, eligibility)
+		offer.slabs = slab_table.to_list()
 		offers.append(offer)
 
 	return offers
@@ -423,7 +568,8 @@ def _get_standalone_pricing_rule_offers(company: str, date: str) -> List[Offer]:
 			coupon_code_based, price_or_product_discount,
 			rate_or_discount, rate, discount_amount, discount_percentage,
 			min_qty, max_qty, min_amt, max_amt,
-			priority, valid_from, valid_upto
+			priority, valid_from, valid_upto,
+			is_cumulative, mixed_conditions
 		FROM `tabPricing Rule`
 		WHERE
 			disable = 0
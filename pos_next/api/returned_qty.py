@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2026, POS Next and contributors
+# For license information, please see license.txt
+
+"""
+Returned-qty ledger for Sales Invoice returns.
+
+POS Returned Qty holds one row per original Sales Invoice Item (named after the
+row), with the quantity returned against it so far. Return invoices update it
+on submit and cancel, so return screens and validation read remaining
+quantities by row name instead of re-aggregating every earlier return.
+"""
+
+import frappe
+from frappe.utils import flt, now
+
+LEDGER_DOCTYPE = "POS Returned Qty"
+
+
+def get_returned_qty(invoice_names):
+	"""Return {invoice: {original row name: returned qty}} for the given invoices."""
+	invoice_names = list(dict.fromkeys(name for name in invoice_names or [] if name))
+	if not invoice_names:
+		return {}
+
+	rows = frappe.db.sql(
+		"""
+		SELECT sales_invoice, sales_invoice_item, returned_qty
+		FROM `tabPOS Returned Qty`
+		WHERE sales_invoice IN %s
+		""",
+		[invoice_names],
+		as_dict=1,
+	)
+
+	returned = {}
+	for row in rows:
+		returned.setdefault(row.sales_invoice, {})[row.sales_invoice_item] = flt(row.returned_qty)
+
+	return returned
+
+
+def assign_return_rows(doc, method=None):
+	"""
+	Link POS return rows without ``sales_invoice_item`` to a row of the original
+	invoice (before_submit), so the ledger and a later cancel use the same row.
+
+	Rows are matched by item code to the first original row with quantity left.
+	Other Sales Invoices are left untouched.
+	"""
+	if not doc.get("is_return") or not doc.get("is_pos") or not doc.get("return_against"):
+		return
+
+	for d, row_name in _match_unlinked_rows(doc):
+		d.sales_invoice_item = row_name
+
+
+def _match_unlinked_rows(doc, cancel=False):
+	"""
+	Match return rows without ``sales_invoice_item`` to original rows by item code.
+
+	On submit a row goes to the first original row with quantity left; on cancel
+	to the last original row with a returned quantity in the ledger. Nothing is
+	written. Returns a list of (return row, original row name).
+	"""
+	unassigned = [d for d in doc.items if d.item_code and not d.get("sales_invoice_item")]
+	if not unassigned:
+		return []
+
+	original_rows = frappe.get_all(
+		"Sales Invoice Item",
+		filters={"parent": doc.return_against, "parenttype": "Sales Invoice"},
+		fields=["name", "item_code", "qty"],
+		order_by="idx",
+	)
+	returned = get_returned_qty([doc.return_against]).get(doc.return_against, {})
+
+	if cancel:
+		available = {row.name: returned.get(row.name, 0) for row in original_rows}
+		original_rows.reverse()
+	else:
+		available = {row.name: flt(row.qty) - returned.get(row.name, 0) for row in original_rows}
+
+	for d in doc.items:
+		if d.get("sales_invoice_item") in available:
+			available[d.sales_invoice_item] -= abs(flt(d.qty))
+
+	matches = []
+	for d in unassigned:
+		candidates = [row for row in original_rows if row.item_code == d.item_code]
+		row = next((row for row in candidates if available[row.name] > 0), None)
+		if not row and candidates and not cancel:
+			# Over-returns are rejected by validation; keep the link deterministic
+			row = candidates[0]
+		if row:
+			matches.append((d, row.name))
+			available[row.name] -= abs(flt(d.qty))
+
+	return matches
+
+
+def update_returned_qty(doc, method=None):
+	"""
+	Add (on_submit) or remove (on_cancel) a return invoice's quantities in the ledger.
+
+	Rows that do not reference an original row (returns made before rows were
+	linked) are matched by item code.
+	"""
+	if not doc.get("is_return") or not doc.get("return_against"):
+		return
+
+	sign = -1 if method == "on_cancel" else 1
+
+	rows = [(d, d.sales_invoice_item) for d in doc.items if d.get("sales_invoice_item")]
+	rows.extend(_match_unlinked_rows(doc, cancel=sign < 0))
+
+	totals = {}
+	for d, row_name in rows:
+		qty, stock_qty, _item_code = totals.get(row_name, (0, 0, d.item_code))
+		totals[row_name] = (
+			qty + abs(flt(d.qty)),
+			stock_qty + abs(flt(d.stock_qty)),
+			d.item_code,
+		)
+
+	if totals:
+		_apply(doc.return_against, totals, sign)
+
+
+def _apply(invoice_name, totals, sign):
+	"""Upsert {row name: (qty, stock_qty, item_code)} into the ledger in one statement."""
+	timestamp = now()
+	user = frappe.session.user
+
+	values = []
+	params = []
+	for row_name, (qty, stock_qty, item_code) in totals.items():
+		values.append("(%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, 0, 0)")
+		params.extend(
+			[
+				row_name,
+				invoice_name,
+				row_name,
+				item_code,
+				sign * qty,
+				sign * stock_qty,
+				timestamp,
+				timestamp,
+				user,
+				user,
+			]
+		)
+
+	frappe.db.sql(
+		f"""
+		INSERT INTO `tabPOS Returned Qty`
+			(name, sales_invoice, sales_invoice_item, item_code, returned_qty, returned_stock_qty,
+			creation, modified, owner, modified_by, docstatus, idx)
+		VALUES {", ".join(values)}
+		ON DUPLICATE KEY UPDATE
+			returned_qty = returned_qty + VALUES(returned_qty),
+			returned_stock_qty = returned_stock_qty + VALUES(returned_stock_qty),
+			modified = VALUES(modified),
+			modified_by = VALUES(modified_by)
+		""",
+		params,
+	)
+
+
+def rebuild_returned_qty(invoice_names=None):
+	"""
+	Recompute ledger rows from submitted return invoices (all, or those against
+	``invoice_names``), using ``sales_invoice_item`` where set and item code
+	matching otherwise. Used by the backfill patch and for repairs.
+	"""
+	conditions = "ret_si.docstatus = 1 AND ret_si.is_return = 1 AND IFNULL(ret_si.return_against, '') != ''"
+	params = {}
+	if invoice_names:
+		conditions += " AND ret_si.return_against IN %(invoices)s"
+		params["invoices"] = list(invoice_names)
+		frappe.db.sql(
+			"DELETE FROM `tabPOS Returned Qty` WHERE sales_invoice IN %(invoices)s", params
+		)
+	else:
+		frappe.db.sql("DELETE FROM `tabPOS Returned Qty`")
+
+	# Older returns may not reference the original row; link them first
+	unlinked = frappe.db.sql_list(
+		f"""
+		SELECT DISTINCT ret_si.name
+		FROM `tabSales Invoice` ret_si
+		INNER JOIN `tabSales Invoice Item` ret_item ON ret_item.parent = ret_si.name
+		WHERE {conditions} AND IFNULL(ret_item.sales_invoice_item, '') = ''
+		ORDER BY ret_si.posting_date, ret_si.name
+		""",
+		params,
+	)
+	linked = frappe.db.sql(
+		f"""
+		SELECT
+			ret_si.return_against,
+			ret_item.sales_invoice_item,
+			ret_item.item_code,
+			SUM(ABS(ret_item.qty)) AS qty,
+			SUM(ABS(ret_item.stock_qty)) AS stock_qty
+		FROM `tabSales Invoice` ret_si
+		INNER JOIN `tabSales Invoice Item` ret_item ON ret_item.parent = ret_si.name
+		WHERE {conditions}
+			AND IFNULL(ret_item.sales_invoice_item, '') != ''
+			AND ret_si.name NOT IN %(unlinked)s
+		GROUP BY ret_si.return_against, ret_item.sales_invoice_item, ret_item.item_code
+		""",
+		{**params, "unlinked": unlinked or [""]},
+		as_dict=1,
+	)
+
+	by_invoice = {}
+	for row in linked:
+		by_invoice.setdefault(row.return_against, {})[row.sales_invoice_item] = (
+			flt(row.qty),
+			flt(row.stock_qty),
+			row.item_code,
+		)
+	for invoice_name, totals in by_invoice.items():
+		_apply(invoice_name, totals, 1)
+
+	# Match by item code in posting order, after linked returns are counted.
+	# Only the ledger is written: submitted returns are never modified.
+	for name in unlinked:
+		update_returned_qty(frappe.get_doc("Sales Invoice", name), "on_submit")
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2025, POS Next and contributors
+# For license information, please see license.txt
+
+"""
+Decoding of variable-measure (scale) barcodes.
+
+Fresh counter scales print EAN-13 codes laid out as::
+
+	prefix | item code (PLU) | [unused] | weight or price | check digit
+
+The layout is configured per POS Profile through the Scale Barcode Rules table
+in POS Settings. Decoding runs in front of the exact barcode lookup; the item
+segment is then resolved through the regular barcode index.
+"""
+
+import frappe
+from frappe.utils import cint, flt
+
+EAN13_LENGTH = 13
+
+
+def get_scale_barcode_rules(pos_profile):
+	"""Return the enabled scale barcode rules for a POS Profile, longest prefix first."""
+	settings_name = frappe.db.get_value(
+		"POS Settings", {"pos_profile": pos_profile, "enabled": 1}, "name"
+	)
+	if not settings_name:
+		return []
+
+	settings = frappe.get_cached_doc("POS Settings", settings_name)
+	if not cint(settings.get("enable_scale_barcodes")):
+		return []
+
+	rules = [
+		frappe._dict(
+			prefix=rule.prefix,
+			value_type=rule.value_type,
+			item_code_length=cint(rule.item_code_length),
+			value_length=cint(rule.value_length),
+			value_divisor=flt(rule.value_divisor) or 1,
+		)
+		for rule in settings.get("scale_barcode_rules") or []
+		if rule.prefix
+	]
+
+	return sorted(rules, key=lambda rule: len(rule.prefix), reverse=True)
+
+
+def is_valid_ean13(barcode):
+	"""Check the EAN-13 check digit."""
+	if len(barcode) != EAN13_LENGTH or not barcode.isdigit():
+		return False
+
+	digits = [int(d) for d in barcode]
+	total = sum(d * (3 if i % 2 else 1) for i, d in enumerate(digits[:-1]))
+	return (10 - total % 10) % 10 == digits[-1]
+
+
+def decode_scale_barcode(barcode, rules):
+	"""
+	Split a scale barcode according to the first matching rule.
+
+	Returns:
+		frappe._dict | None: ``item_segment``, ``lookup_codes`` (candidates for the
+		barcode index), ``value_type`` and the decoded ``value``; None when the
+		code does not match any rule or fails the check digit
+	"""
+	if not rules or not is_valid_ean13(barcode):
+		return None
+
+	for rule in rules:
+		if not barcode.startswith(rule.prefix):
+			continue
+
+		item_start = len(rule.prefix)
+		item_end = item_start + rule.item_code_length
+		value_end = EAN13_LENGTH - 1
+		value_start = value_end - rule.value_length
+
+		if rule.item_code_length <= 0 or rule.value_length <= 0 or item_end > value_start:
+			continue
+
+		item_segment = barcode[item_start:item_end]
+
+		return frappe._dict(
+			barcode=barcode,
+			prefix=rule.prefix,
+			item_segment=item_segment,
+			# PLUs are registered either as the bare segment, with the prefix, or
+			# without leading zeros
+			lookup_codes=[
+				code
+				for code in dict.fromkeys([item_segment, rule.prefix + item_segment, item_segment.lstrip("0")])
+				if code
+			],
+			value_type=rule.value_type,
+			value=flt(int(barcode[value_start:value_end]) / rule.value_divisor),
+		)
+
+	return None
+
+
+def apply_scale_value(item_details, decoded):
+	"""
+	Set qty (weight barcodes) or the line amount (price barcodes) on the item
+	details returned for a decoded scale barcode.
+	"""
+	if decoded.value_type == "Price":
+		rate = flt(item_details.get("price_list_rate") or item_details.get("rate"))
+		if rate:
+			item_details["qty"] = flt(decoded.value / rate, 3)
+		else:
+			item_details["qty"] = 1
+			item_details["rate"] = decoded.value
+			item_details["price_list_rate"] = decoded.value
+		item_details["amount"] = decoded.value
+	else:
+		item_details["qty"] = decoded.value
+
+	item_details["scale_barcode"] = {
+		"barcode": decoded.barcode,
+		"prefix": decoded.prefix,
+		"value_type": decoded.value_type,
+		"value": decoded.value,
+	}
+
+	return item_details
@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2025, POS Next and contributors
+# For license information, please see license.txt
+
+"""
+Catalog snapshot bundles for terminal provisioning and offline recovery.
+
+A snapshot packs everything a terminal needs to start selling for one POS
+Profile (items, item groups, customers, payment methods, taxes and offers) into a
+single gzip-compressed, column-oriented JSON document. Bundles are content
+hashed, written once to the site's private folder and served with ETag
+semantics, so a terminal that already holds the current bundle downloads nothing.
+"""
+
+import gzip
+import hashlib
+import os
+
+import frappe
+from frappe import _
+from frappe.utils import get_datetime, now, now_datetime, scrub
+from werkzeug.wrappers import Response
+
+SNAPSHOT_FOLDER = "pos_next_snapshots"
+SNAPSHOT_FORMAT_VERSION = 1
+SNAPSHOT_MAX_AGE_SECONDS = 60 * 60
+SNAPSHOT_ITEMS_PAGE_SIZE = 1000
+SNAPSHOT_RETRY_AFTER_SECONDS = 30
+
+
+def _snapshot_cache_key(pos_profile):
+	return f"pos_next:catalog_snapshot:{pos_profile}"
+
+
+def _snapshot_dir():
+	path = frappe.get_site_path("private", SNAPSHOT_FOLDER)
+	os.makedirs(path, exist_ok=True)
+	return path
+
+
+def _check_profile_access(pos_profile):
+	"""Allow POS Profile users and anyone who can read POS Profiles."""
+	if not pos_profile:
+		frappe.throw(_("POS Profile is required"))
+
+	has_access = frappe.db.exists(
+		"POS Profile User",
+		{"parent": pos_profile, "user": frappe.session.user}
+	)
+
+	if not has_access and not frappe.has_permission("POS Profile", "read"):
+		frappe.throw(_("You don't have access to this POS Profile"))
+
+
+def _to_columns(rows):
+	"""Convert a list of dicts into a column-oriented table."""
+	columns = []
+	for row in rows:
+		for key in row:
+			if key not in columns:
+				columns.append(key)
+
+	return {
+		"columns": columns,
+		"rows": [[row.get(column) for column in columns] for row in rows],
+	}
+
+
+def _collect_items(pos_profile):
+	"""Walk the whole POS catalog with keyset pagination."""
+	from pos_next.api.items import get_items
+
+	items = []
+	after = ""
+	while after is not None:
+		page = get_items(pos_profile, after=after, limit=SNAPSHOT_ITEMS_PAGE_SIZE)
+		items.extend(page["items"])
+		after = page["after"]
+
+	return items
+
+
+def build_catalog_snapshot(pos_profile):
+	"""
+	Build the snapshot bundle for a POS Profile, store it on disk and cache its metadata.
+
+	The ETag hashes the catalog content only, so rebuilding an unchanged catalog
+	keeps the same ETag and file. The delta cursor is stored next to the content
+	and outside the hash; an unchanged bundle keeps its earlier cursor, which
+	only makes the terminal's first delta sync a little longer.
+
+	Returns:
+		dict: Snapshot metadata (etag, file path, size, build time)
+	"""
+	from pos_next.api.customers import get_customers
+	from pos_next.api.items import get_item_groups
+	from pos_next.api.offers import get_offers
+	from pos_next.api.pos_profile import get_payment_methods, get_taxes
+
+	# Anything modified after this point is picked up by get_items_delta
+	cursor = {"modified": now(), "name": ""}
+
+	content = {
+		"format_version": SNAPSHOT_FORMAT_VERSION,
+		"pos_profile": pos_profile,
+		"items": _to_columns(_collect_items(pos_profile)),
+		"item_groups": _to_columns(get_item_groups(pos_profile)),
+		"customers": _to_columns(get_customers(pos_profile=pos_profile, limit=0)),
+		"payment_methods": _to_columns(get_payment_methods(pos_profile)),
+		"taxes": _to_columns(get_taxes(pos_profile)),
+		"offers": _to_columns(get_offers(pos_profile)),
+	}
+
+	etag = hashlib.sha256(_dump(content)).hexdigest()
+
+	folder = _snapshot_dir()
+	prefix = f"{scrub(pos_profile)}-"
+	filename = f"{prefix}{etag}.json.gz"
+	path = os.path.join(folder, filename)
+
+	if not os.path.exists(path):
+		payload = _dump(dict(content, cursor=cursor))
+		# Write under a temporary name so a download never sees a partial file
+		with open(f"{path}.tmp", "wb") as f:
+			f.write(gzip.compress(payload, mtime=0))
+		os.replace(f"{path}.tmp", path)
+
+	# Drop bundles superseded by this one
+	for existing in os.listdir(folder):
+		if existing.startswith(prefix) and existing != filename:
+			try:
+				os.remove(os.path.join(folder, existing))
+			except OSError:
+				pass
+
+	meta = {
+		"pos_profile": pos_profile,
+		"etag": etag,
+		"filename": filename,
+		"size": os.path.getsize(path),
+		"built_at": str(now_datetime()),
+	}
+	frappe.cache().set_value(_snapshot_cache_key(pos_profile), meta)
+
+	return meta
+
+
+def _dump(data):
+	return frappe.as_json(data, indent=None, separators=(",", ":")).encode("utf-8")
+
+
+def _enqueue_snapshot_build(pos_profile):
+	frappe.enqueue(
+		"pos_next.api.snapshot.build_catalog_snapshot",
+		queue="long",
+		job_id=f"pos_next_catalog_snapshot::{pos_profile}",
+		deduplicate=True,
+		pos_profile=pos_profile,
+	)
+
+
+def _get_snapshot_meta(pos_profile):
+	"""
+	Return metadata for a usable snapshot, or None while the first one is built.
+
+	Bundles are always built in the background: a missing snapshot is queued
+	and a stale one is still served while a fresh one is built.
+	"""
+	meta = frappe.cache().get_value(_snapshot_cache_key(pos_profile))
+
+	if not meta or not os.path.exists(os.path.join(_snapshot_dir(), meta["filename"])):
+		_enqueue_snapshot_build(pos_profile)
+		return None
+
+	age = (now_datetime() - get_datetime(meta["built_at"])).total_seconds()
+	if age > SNAPSHOT_MAX_AGE_SECONDS:
+		_enqueue_snapshot_build(pos_profile)
+
+	return meta
+
+
+def _request_etag(etag=None):
+	"""ETag sent by the client, either as a parameter or as If-None-Match."""
+	if etag:
+		return etag.strip('"')
+
+	request = getattr(frappe.local, "request", None)
+	if request and request.headers.get("If-None-Match"):
+		return request.headers.get("If-None-Match").strip('"')
+
+	return None
+
+
+@frappe.whitelist()
+def get_catalog_snapshot_info(pos_profile, etag=None):
+	"""
+	Describe the current catalog snapshot for a POS Profile.
+
+	Args:
+		pos_profile: POS Profile name
+		etag: ETag of the bundle already held by the terminal, if any
+
+	Returns:
+		dict: etag, size and build time, plus ``not_modified`` when the terminal
+		already holds the current bundle. ``ready`` is false while the first
+		bundle is still being built.
+	"""
+	_check_profile_access(pos_profile)
+	meta = _get_snapshot_meta(pos_profile)
+
+	if not meta:
+		return {"ready": False, "retry_after": SNAPSHOT_RETRY_AFTER_SECONDS}
+
+	return {
+		"ready": True,
+		"etag": meta["etag"],
+		"size": meta["size"],
+		"built_at": meta["built_at"],
+		"not_modified": _request_etag(etag) == meta["etag"],
+	}
+
+
+@frappe.whitelist()
+def download_catalog_snapshot(pos_profile, etag=None):
+	"""
+	Download the gzip-compressed catalog snapshot for a POS Profile.
+
+	Every response carries the bundle's ``ETag`` header. Responds with HTTP 304
+	and no body when ``etag`` (or the If-None-Match header) matches the current
+	bundle, and with HTTP 202 and a ``Retry-After`` header while the first
+	bundle is still being built.
+	"""
+	_check_profile_access(pos_profile)
+	meta = _get_snapshot_meta(pos_profile)
+
+	if not meta:
+		return Response(
+			frappe.as_json({"ready": False, "retry_after": SNAPSHOT_RETRY_AFTER_SECONDS}),
+			status=202,
+			mimetype="application/json",
+			headers={"Retry-After": str(SNAPSHOT_RETRY_AFTER_SECONDS)},
+		)
+
+	headers = {"ETag": f'"{meta["etag"]}"', "Cache-Control": "private, no-cache"}
+
+	if _request_etag(etag) == meta["etag"]:
+		return Response(status=304, headers=headers)
+
+	with open(os.path.join(_snapshot_dir(), meta["filename"]), "rb") as f:
+		content = f.read()
+
+	headers["Content-Disposition"] = f'attachment; filename="{meta["filename"]}"'
+	return Response(content, status=200, mimetype="application/gzip", headers=headers)
+
+
+@frappe.whitelist()
+def rebuild_catalog_snapshot(pos_profile):
+	"""Queue a snapshot rebuild, e.g. after a large price list import."""
+	frappe.only_for(["System Manager", "Stock Manager"])
+
+	_enqueue_snapshot_build(pos_profile)
+
+	return {"queued": True}
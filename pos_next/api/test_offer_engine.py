@@ -0,0 +1,240 @@
+# Copyright (c) 2026, Youssef Restom and Contributors
+# See license.txt
+
+import frappe
+from erpnext.accounts.doctype.pricing_rule.pricing_rule import apply_pricing_rule
+from frappe.tests.utils import FrappeTestCase
+from frappe.utils import add_days, flt, nowdate
+
+from pos_next.api import offer_engine
+
+COMPANY = "_Test Company"
+PRICE_LIST = "_Test Price List"
+CUSTOMER = "_Test Customer"
+ITEM = "_Test Item"
+OTHER_ITEM = "_Test Item 2"
+BOX = "_Test Offer Box"
+BOX_FACTOR = 6
+
+
+class TestOfferEngine(FrappeTestCase):
+	"""The compiled engine must price cart lines exactly like ERPNext's apply_pricing_rule."""
+
+	def setUp(self):
+		frappe.db.set_value("Pricing Rule", {"selling": 1, "disable": 0}, "disable", 1)
+		offer_engine._engines.clear()
+
+	def tearDown(self):
+		frappe.db.rollback()
+		offer_engine._engines.clear()
+
+	def make_rule(self, title, apply_on="Item Code", value=ITEM, uom=None, **kwargs):
+		field = frappe.scrub(apply_on)
+		rule = frappe.get_doc(
+			{
+				"doctype": "Pricing Rule",
+				"title": title,
+				"apply_on": apply_on,
+				"items" if field == "item_code" else f"{field}s": [{field: value, "uom": uom}],
+				"selling": 1,
+				"company": COMPANY,
+				"currency": "INR",
+				"price_or_product_discount": "Price",
+				"rate_or_discount": "Discount Percentage",
+				**kwargs,
+			}
+		).insert()
+		offer_engine._engines.clear()
+		return rule
+
+	def add_box_uom(self):
+		if not frappe.db.exists("UOM", BOX):
+			frappe.get_doc({"doctype": "UOM", "uom_name": BOX}).insert()
+		item = frappe.get_doc("Item", ITEM)
+		if not any(row.uom == BOX for row in item.uoms):
+			item.append("uoms", {"uom": BOX, "conversion_factor": BOX_FACTOR})
+			item.save()
+
+	def pricing_args(self, lines, customer=CUSTOMER, uom=None, conversion_factor=1, price_list_rate=100):
+		customer_group, territory = frappe.get_cached_value(
+			"Customer", customer, ["customer_group", "territory"]
+		)
+		items = []
+		for idx, (item_code, qty) in enumerate(lines):
+			item_group, brand, stock_uom = frappe.get_cached_value(
+				"Item", item_code, ["item_group", "brand", "stock_uom"]
+			)
+			items.append(
+				{
+					"doctype": "Sales Invoice Item",
+					"name": f"row-{idx}",
+					"item_code": item_code,
+					"item_group": item_group,
+					"brand": brand,
+					"qty": qty,
+					"stock_qty": qty * conversion_factor,
+					"uom": uom or stock_uom,
+					"stock_uom": stock_uom,
+					"conversion_factor": conversion_factor,
+					"price_list_rate": price_list_rate,
+					"rate": price_list_rate,
+					"discount_percentage": 0,
+					"discount_amount": 0,
+					"parenttype": "Sales Invoice",
+				}
+			)
+
+		return frappe._dict(
+			{
+				"doctype": "Sales Invoice",
+				"name": "POS-INVOICE",
+				"company": COMPANY,
+				"transaction_date": nowdate(),
+				"posting_date": nowdate(),
+				"currency": "INR",
+				"conversion_rate": 1,
+				"plc_conversion_rate": 1,
+				"price_list": PRICE_LIST,
+				"customer": customer,
+				"customer_group": customer_group,
+				"territory": territory,
+				"items": items,
+			}
+		)
+
+	@staticmethod
+	def summarize(result):
+		free_items = sorted(
+			(row.get("item_code"), flt(row.get("qty"))) for row in result.get("free_item_data") or []
+		)
+		summary = {
+			"pricing_rules": sorted(offer_engine.parse_rule_names(result.get("pricing_rules"))),
+			"discount_percentage": flt(result.get("discount_percentage")),
+			"discount_amount": flt(result.get("discount_amount")),
+			"free_items": free_items,
+		}
+		if result.get("price_list_rate") is not None:
+			summary["price_list_rate"] = flt(result.get("price_list_rate"))
+		return summary
+
+	def assertParity(self, args):
+		evaluated = offer_engine.apply_pricing_rules(frappe._dict(args))
+		self.assertIsNotNone(evaluated, "the engine should handle these rules")
+
+		expected = apply_pricing_rule(frappe.parse_json(frappe.as_json(args))) or []
+		self.assertEqual(len(evaluated[0]), len(expected))
+
+		for engine_result, erpnext_result in zip(evaluated[0], expected):
+			engine_summary = self.summarize(engine_result)
+			erpnext_summary = self.summarize(erpnext_result)
+			if "price_list_rate" not in engine_summary:
+				erpnext_summary.pop("price_list_rate", None)
+			self.assertEqual(engine_summary, erpnext_summary)
+
+		return evaluated[0]
+
+	def test_discount_percentage_on_item(self):
+		rule = self.make_rule("Ten Off", discount_percentage=10)
+		results = self.assertParity(self.pricing_args([(ITEM, 1), (OTHER_ITEM, 1)]))
+		self.assertEqual(results[0].pricing_rules, [rule.name])
+		self.assertFalse(results[1].pricing_rules)
+
+	def test_higher_priority_wins(self):
+		self.make_rule("Low", discount_percentage=5, priority="1")
+		high = self.make_rule("High", discount_percentage=20, priority="5")
+		results = self.assertParity(self.pricing_args([(ITEM, 1)]))
+		self.assertEqual(results[0].pricing_rules, [high.name])
+
+	def test_apply_multiple_pricing_rules(self):
+		self.make_rule("First", discount_percentage=5, priority="1", apply_multiple_pricing_rules=1)
+		self.make_rule("Second", discount_percentage=10, priority="2", apply_multiple_pricing_rules=1)
+		results = self.assertParity(self.pricing_args([(ITEM, 1)]))
+		self.assertEqual(len(results[0].pricing_rules), 2)
+
+	def test_min_qty(self):
+		self.make_rule("Bulk", discount_percentage=15, min_qty=5)
+		self.assertParity(self.pricing_args([(ITEM, 2)]))
+		self.assertParity(self.pricing_args([(ITEM, 5)]))
+
+	def test_item_group_rule(self):
+		item_group = frappe.get_cached_value("Item", ITEM, "item_group")
+		self.make_rule("Group", apply_on="Item Group", value=item_group, discount_amount=7, rate_or_discount="Discount Amount")
+		self.assertParity(self.pricing_args([(ITEM, 1)]))
+
+	def test_customer_filter(self):
+		self.make_rule("Customer Only", discount_percentage=12, applicable_for="Customer", customer=CUSTOMER)
+		self.assertParity(self.pricing_args([(ITEM, 1)]))
+		self.assertParity(self.pricing_args([(ITEM, 1)], customer="_Test Customer 2"))
+
+	def test_rate_rule(self):
+		self.make_rule("Fixed Rate", rate_or_discount="Rate", rate=80)
+		self.assertParity(self.pricing_args([(ITEM, 1)]))
+
+	def test_rate_rule_for_rule_uom(self):
+		self.add_box_uom()
+		self.make_rule("Box Rate", uom=BOX, rate_or_discount="Rate", rate=500)
+		results = self.assertParity(
+			self.pricing_args([(ITEM, 1)], uom=BOX, conversion_factor=BOX_FACTOR, price_list_rate=600)
+		)
+		# Priced per box, not per stock unit
+		self.assertEqual(flt(results[0].price_list_rate), 500)
+
+	def test_rate_rule_without_uom_on_other_uom(self):
+		self.add_box_uom()
+		self.make_rule("Unit Rate", rate_or_discount="Rate", rate=80)
+		results = self.assertParity(
+			self.pricing_args([(ITEM, 1)], uom=BOX, conversion_factor=BOX_FACTOR, price_list_rate=600)
+		)
+		self.assertEqual(flt(results[0].price_list_rate), 80 * BOX_FACTOR)
+
+	def test_min_qty_in_rule_uom(self):
+		self.add_box_uom()
+		self.make_rule("Two Boxes", uom=BOX, discount_percentage=10, min_qty=2)
+		self.assertParity(self.pricing_args([(ITEM, 1)], uom=BOX, conversion_factor=BOX_FACTOR))
+		self.assertParity(self.pricing_args([(ITEM, 2)], uom=BOX, conversion_factor=BOX_FACTOR))
+
+	def test_discount_on_discounted_rate(self):
+		self.make_rule("First", discount_percentage=10, priority="1", apply_multiple_pricing_rules=1)
+		self.make_rule(
+			"Second",
+			discount_percentage=10,
+			priority="2",
+			apply_multiple_pricing_rules=1,
+			apply_discount_on_rate=1,
+		)
+		self.assertParity(self.pricing_args([(ITEM, 1)]))
+
+	def test_no_discount_without_price_list_rate(self):
+		self.make_rule("Ten Off", discount_percentage=10)
+		self.assertParity(self.pricing_args([(ITEM, 1)], price_list_rate=0))
+
+	def test_same_item_product_discount(self):
+		self.make_rule(
+			"Buy Two Get One",
+			price_or_product_discount="Product",
+			same_item=1,
+			free_qty=1,
+			min_qty=2,
+		)
+		self.assertParity(self.pricing_args([(ITEM, 2)]))
+
+	def test_validity(self):
+		self.make_rule("Expired", discount_percentage=30, valid_upto=add_days(nowdate(), -1))
+		self.make_rule("Future", discount_percentage=40, valid_from=add_days(nowdate(), 1))
+		results = self.assertParity(self.pricing_args([(ITEM, 1)]))
+		self.assertFalse(results[0].pricing_rules)
+
+	def test_mixed_conditions_fall_back_to_erpnext(self):
+		self.make_rule("Mixed", discount_percentage=10, mixed_conditions=1)
+		self.assertIsNone(offer_engine.apply_pricing_rules(self.pricing_args([(ITEM, 1)])))
+
+	def test_engine_cache_is_bounded(self):
+		for days in range(offer_engine.MAX_CACHED_ENGINES + 5):
+			offer_engine.get_engine(COMPANY, add_days(nowdate(), days))
+
+		# Engines of earlier dates are replaced by later ones
+		self.assertEqual(len(offer_engine._engines), 1)
+
+		for idx in range(offer_engine.MAX_CACHED_ENGINES + 5):
+			offer_engine.get_engine(f"{COMPANY} {idx}", nowdate())
+		self.assertLessEqual(len(offer_engine._engines), offer_engine.MAX_CACHED_ENGINES)
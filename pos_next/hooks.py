@@ -96,6 +96,7 @@ fixtures = [
 				[
 					"Sales Invoice-posa_pos_opening_shift",
 					"Sales Invoice-posa_is_printed",
+					"Sales Invoice-posa_idempotency_key",
 					"Item-custom_company",
 					"POS Profile-create_pos_invoice_instead_of_sales_invoice",
 					"POS Profile-posa_cash_mode_of_payment",
@@ -187,17 +188,87 @@ standard_queries = {
 
 doc_events = {
 	"Item": {
-		"validate": "pos_next.validations.validate_item"
+		"validate": "pos_next.validations.validate_item",
+		"on_update": [
+			"pos_next.api.item_cache.invalidate_item",
+			"pos_next.api.item_cache.sync_item_barcodes"
+		],
+		"on_trash": [
+			"pos_next.api.item_cache.invalidate_item",
+			"pos_next.api.item_cache.sync_item_barcodes"
+		],
+		"after_rename": "pos_next.api.item_cache.invalidate_item_after_rename"
+	},
+	"Item Price": {
+		"on_update": "pos_next.api.item_cache.invalidate_item_price",
+		"on_trash": "pos_next.api.item_cache.invalidate_item_price"
+	},
+	"Warehouse": {
+		"on_update": "pos_next.api.item_cache.invalidate_warehouse_tree",
+		"on_trash": "pos_next.api.item_cache.invalidate_warehouse_tree",
+		"after_rename": "pos_next.api.item_cache.invalidate_warehouse_tree"
+	},
+	"Bin": {
+		"on_update": "pos_next.api.item_cache.invalidate_stock"
+	},
+	"Stock Ledger Entry": {
+		"on_submit": "pos_next.api.item_cache.invalidate_stock",
+		"on_cancel": "pos_next.api.item_cache.invalidate_stock"
 	},
 	"Sales Invoice": {
 		"validate": "pos_next.api.sales_invoice_hooks.validate",
 		"before_cancel": "pos_next.api.sales_invoice_hooks.before_cancel",
-		"on_submit": "pos_next.realtime_events.emit_stock_update_event",
-		"on_cancel": "pos_next.realtime_events.emit_stock_update_event",
+		"before_submit": "pos_next.api.returned_qty.assign_return_rows",
+		"on_submit": [
+			"pos_next.realtime_events.emit_stock_update_event",
+			"pos_next.api.returned_qty.update_returned_qty"
+		],
+		"on_cancel": [
+			"pos_next.realtime_events.emit_stock_update_event",
+			"pos_next.api.returned_qty.update_returned_qty"
+		],
 		"after_insert": "pos_next.realtime_events.emit_invoice_created_event"
 	},
 	"POS Profile": {
-		"on_update": "pos_next.realtime_events.emit_pos_profile_updated_event"
+		"on_update": [
+			"pos_next.realtime_events.emit_pos_profile_updated_event",
+			"pos_next.api.invoices.clear_payment_account_cache"
+		]
+	},
+	"Mode of Payment": {
+		"on_update": "pos_next.api.invoices.clear_payment_account_cache",
+		"on_trash": "pos_next.api.invoices.clear_payment_account_cache"
+	},
+	"Company": {
+		"on_update": "pos_next.api.invoices.clear_payment_account_cache"
+	},
+	"Pricing Rule": {
+		"on_update": "pos_next.api.offer_engine.bump_offers_version",
+		"on_trash": "pos_next.api.offer_engine.bump_offers_version",
+		"after_rename": "pos_next.api.offer_engine.bump_offers_version"
+	},
+	"Promotional Scheme": {
+		"on_update": "pos_next.api.offer_engine.bump_offers_version",
+		"on_trash": "pos_next.api.offer_engine.bump_offers_version"
+	},
+	"POS Coupon": {
+		"on_update": "pos_next.api.offer_engine.bump_offers_version",
+		"on_trash": "pos_next.api.offer_engine.bump_offers_version"
+	},
+	"Item Group": {
+		"on_update": "pos_next.api.offer_engine.bump_offers_version",
+		"on_trash": "pos_next.api.offer_engine.bump_offers_version",
+		"after_rename": "pos_next.api.offer_engine.bump_offers_version"
+	},
+	"Customer Group": {
+		"on_update": "pos_next.api.offer_engine.bump_offers_version",
+		"on_trash": "pos_next.api.offer_engine.bump_offers_version",
+		"after_rename": "pos_next.api.offer_engine.bump_offers_version"
+	},
+	"Territory": {
+		"on_update": "pos_next.api.offer_engine.bump_offers_version",
+		"on_trash": "pos_next.api.offer_engine.bump_offers_version",
+		"after_rename": "pos_next.api.offer_engine.bump_offers_version"
 	}
 }
 
@@ -207,6 +278,7 @@ doc_events = {
 scheduler_events = {
 	"hourly": [
 		"pos_next.tasks.branding_monitor.monitor_branding_integrity",
+		"pos_next.tasks.draft_cleanup.cleanup_stale_drafts",
 	],
 	"daily": [
 		"pos_next.tasks.cleanup_expired_promotions.cleanup_expired_promotions",
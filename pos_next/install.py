@@ -14,6 +14,9 @@ def after_install():
 		log_message("Installing POS Next fixtures", level="info")
 		install_fixtures()
 		setup_default_print_format()
+		setup_item_search_index()
+		setup_invoice_history_index()
+		setup_customer_search_indexes()
 		frappe.db.commit()
 		log_message("POS Next installation completed successfully", level="success")
 	except Exception as e:
@@ -32,6 +35,9 @@ def after_migrate():
 		# Migrate runs often, so we use quiet mode to reduce noise
 		install_fixtures(quiet=True)
 		setup_default_print_format(quiet=True)
+		setup_item_search_index(quiet=True)
+		setup_invoice_history_index(quiet=True)
+		setup_customer_search_indexes(quiet=True)
 		frappe.db.commit()
 		log_message("POS Next: Fixtures updated successfully", level="success")
 	except Exception as e:
@@ -253,6 +259,87 @@ def setup_default_print_format(quiet=False):
 		)
 
 
+def setup_item_search_index(quiet=False):
+	"""
+	Create the FULLTEXT index used by POS item search if it does not exist yet
+
+	The index is maintained by the database itself, so Item inserts, renames and
+	edits are reflected without any hooks. Sites on a database without FULLTEXT
+	support keep working through the LIKE fallback in get_items.
+
+	Args:
+		quiet (bool): If True, suppress detailed logs
+	"""
+	from pos_next.api.items import ITEM_SEARCH_INDEX, ITEM_SEARCH_INDEX_COLUMNS, clear_item_search_index_cache
+
+	try:
+		exists = frappe.db.sql(
+			"SHOW INDEX FROM `tabItem` WHERE Key_name = %s", ITEM_SEARCH_INDEX
+		)
+		if not exists:
+			frappe.db.sql_ddl(
+				f"ALTER TABLE `tabItem` ADD FULLTEXT INDEX `{ITEM_SEARCH_INDEX}` ({ITEM_SEARCH_INDEX_COLUMNS})"
+			)
+			if not quiet:
+				log_message("Created FULLTEXT search index on Item", level="success")
+	except Exception as e:
+		log_message(f"Error creating item search index: {str(e)}", level="warning")
+		frappe.log_error(
+			title="Item Search Index Setup Error",
+			message=frappe.get_traceback()
+		)
+	finally:
+		clear_item_search_index_cache()
+
+
+def setup_invoice_history_index(quiet=False):
+	"""
+	Create the composite index the POS invoice history is keyset-paginated on
+
+	Args:
+		quiet (bool): If True, suppress detailed logs
+	"""
+	from pos_next.api.invoices import INVOICE_HISTORY_INDEX
+
+	try:
+		# add_index is a no-op when the index already exists
+		frappe.db.add_index(
+			"Sales Invoice",
+			["pos_profile", "posting_date", "posting_time", "name"],
+			index_name=INVOICE_HISTORY_INDEX,
+		)
+		if not quiet:
+			log_message("Ensured invoice history index on Sales Invoice", level="success")
+	except Exception as e:
+		log_message(f"Error creating invoice history index: {str(e)}", level="warning")
+		frappe.log_error(
+			title="Invoice History Index Setup Error",
+			message=frappe.get_traceback()
+		)
+
+
+def setup_customer_search_indexes(quiet=False):
+	"""
+	Index Customer name and mobile number for the prefix lookups of the return search
+
+	Args:
+		quiet (bool): If True, suppress detailed logs
+	"""
+	from pos_next.api.invoices import CUSTOMER_SEARCH_INDEXES
+
+	try:
+		for index_name, column in CUSTOMER_SEARCH_INDEXES.items():
+			frappe.db.add_index("Customer", [column], index_name=index_name)
+		if not quiet:
+			log_message("Ensured customer search indexes", level="success")
+	except Exception as e:
+		log_message(f"Error creating customer search indexes: {str(e)}", level="warning")
+		frappe.log_error(
+			title="Customer Search Index Setup Error",
+			message=frappe.get_traceback()
+		)
+
+
 def log_message(message, level="info", indent=0):
 	"""
 	Standardized logging function with consistent formatting
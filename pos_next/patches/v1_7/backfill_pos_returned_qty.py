@@ -0,0 +1,13 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2026, POS Next and contributors
+# For license information, please see license.txt
+
+import frappe
+
+from pos_next.api.returned_qty import rebuild_returned_qty
+
+
+def execute():
+	"""Populate the POS Returned Qty ledger from returns submitted before it existed."""
+	frappe.reload_doc("pos_next", "doctype", "pos_returned_qty")
+	rebuild_returned_qty()
@@ -12,6 +12,8 @@ from frappe import _
 from frappe.model.document import Document
 from frappe.utils import flt
 
+from pos_next.tasks.draft_cleanup import enqueue_draft_cleanup
+
 
 def get_base_value(doc, fieldname, base_fieldname=None, conversion_rate=None):
     """Return the value for a field in company currency."""
@@ -210,22 +212,13 @@ class POSClosingShift(Document):
                 )
                 else "Sales Invoice"
             )
-            data = frappe.db.sql(
-                f"""
-		select
-		    name
-		from
-		    `tab{doctype}`
-		where
-		    docstatus = 0 and posa_is_printed = 0 and posa_pos_opening_shift = %s
-		""",
-                (self.pos_opening_shift),
-                as_dict=1,
+            # Deleted in batches by a background job once the shift is closed
+            enqueue_draft_cleanup(
+                doctype,
+                pos_opening_shift=self.pos_opening_shift,
+                unprinted_only=True,
             )
 
-            for invoice in data:
-                frappe.delete_doc(doctype, invoice.name, force=1)
-
     @frappe.whitelist()
     def get_payment_reconciliation_details(self):
         company_currency = frappe.get_cached_value(
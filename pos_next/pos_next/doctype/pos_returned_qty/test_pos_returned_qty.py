@@ -0,0 +1,89 @@
+# Copyright (c) 2026, Youssef Restom and Contributors
+# See license.txt
+
+import frappe
+from erpnext.accounts.doctype.sales_invoice.sales_invoice import make_sales_return
+from erpnext.accounts.doctype.sales_invoice.test_sales_invoice import create_sales_invoice
+from frappe.tests.utils import FrappeTestCase
+
+from pos_next.api.invoices import validate_return_items
+from pos_next.api.returned_qty import get_returned_qty, rebuild_returned_qty
+
+
+class TestPOSReturnedQty(FrappeTestCase):
+	def setUp(self):
+		self.invoice = create_sales_invoice(qty=5, rate=100)
+		self.row = self.invoice.items[0]
+
+	def tearDown(self):
+		frappe.db.rollback()
+
+	def make_return(self, qty, submit=True, unlinked=False):
+		return_doc = make_sales_return(self.invoice.name)
+		return_doc.items[0].qty = -qty
+		if unlinked:
+			return_doc.items[0].sales_invoice_item = None
+		return_doc.insert()
+		if submit:
+			return_doc.submit()
+		return return_doc
+
+	def returned(self):
+		return get_returned_qty([self.invoice.name]).get(self.invoice.name, {}).get(self.row.name, 0)
+
+	def validate(self, qty, **row):
+		return validate_return_items(
+			self.invoice.name,
+			[{"item_code": self.row.item_code, "qty": -qty, **row}],
+		)
+
+	def test_partial_returns_accumulate(self):
+		self.make_return(2)
+		self.assertEqual(self.returned(), 2)
+
+		self.make_return(1)
+		self.assertEqual(self.returned(), 3)
+
+		self.assertTrue(self.validate(2, sales_invoice_item=self.row.name)["valid"])
+
+	def test_over_return_is_rejected(self):
+		self.assertFalse(self.validate(6)["valid"])
+
+		self.make_return(4)
+		self.assertTrue(self.validate(1)["valid"])
+		self.assertFalse(self.validate(2)["valid"])
+		self.assertFalse(self.validate(2, sales_invoice_item=self.row.name)["valid"])
+
+	def test_cancel_return_releases_qty(self):
+		return_doc = self.make_return(3)
+		self.assertEqual(self.returned(), 3)
+
+		return_doc.cancel()
+		self.assertEqual(self.returned(), 0)
+		self.assertTrue(self.validate(5)["valid"])
+
+	def test_unlinked_return_rows_match_by_item_code(self):
+		return_doc = self.make_return(2, unlinked=True)
+		self.assertEqual(self.returned(), 2)
+
+		return_doc.cancel()
+		self.assertEqual(self.returned(), 0)
+
+	def test_rebuild_does_not_modify_returns(self):
+		return_doc = self.make_return(2, unlinked=True)
+		modified = frappe.db.get_value("Sales Invoice", return_doc.name, "modified")
+
+		rebuild_returned_qty([self.invoice.name])
+
+		self.assertEqual(self.returned(), 2)
+		self.assertFalse(frappe.db.get_value("Sales Invoice Item", return_doc.items[0].name, "sales_invoice_item"))
+		self.assertEqual(frappe.db.get_value("Sales Invoice", return_doc.name, "modified"), modified)
+
+	def test_pos_invoice_returns_are_rejected(self):
+		self.assertRaises(
+			frappe.ValidationError,
+			validate_return_items,
+			self.invoice.name,
+			[{"item_code": self.row.item_code, "qty": -1}],
+			doctype="POS Invoice",
+		)
@@ -20,6 +20,24 @@ class POSSettings(Document):
 			if search_limit <= 0:
 				frappe.throw("Search Limit must be greater than 0")
 
+		self.validate_scale_barcode_rules()
+
+	def validate_scale_barcode_rules(self):
+		"""Ensure every scale barcode rule fits in an EAN-13 code"""
+		for rule in self.get("scale_barcode_rules") or []:
+			if not (rule.prefix or "").isdigit():
+				frappe.throw(f"Row {rule.idx}: Scale barcode prefix must contain digits only")
+
+			if cint(rule.item_code_length) <= 0 or cint(rule.value_length) <= 0:
+				frappe.throw(f"Row {rule.idx}: Item code and value digits must be greater than 0")
+
+			# prefix + item code + value + check digit must fit in 13 digits
+			if len(rule.prefix) + cint(rule.item_code_length) + cint(rule.value_length) + 1 > 13:
+				frappe.throw(f"Row {rule.idx}: Scale barcode layout does not fit in 13 digits")
+
+			if flt(rule.value_divisor) <= 0:
+				frappe.throw(f"Row {rule.idx}: Value Divisor must be greater than 0")
+
 	def on_update(self):
 		"""Sync allow_negative_stock with Stock Settings"""
 		self.sync_negative_stock_setting()
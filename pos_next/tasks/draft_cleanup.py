@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2026, POS Next and contributors
+# For license information, please see license.txt
+
+"""
+Background cleanup of stale draft invoices.
+
+Only drafts created by the POS (``is_pos`` with a POS Profile and opening
+shift) are considered. Drafts are removed in small batches: each batch locks
+its rows, deletes every invoice through ``frappe.delete_doc`` so that on_trash
+hooks run and a Deleted Document is recorded, and commits. A run stops after
+its time budget and enqueues itself to continue, so no single transaction
+holds locks for long.
+"""
+
+import time
+from datetime import timedelta
+
+import frappe
+from frappe.utils import cint, now_datetime
+
+DRAFT_CLEANUP_BATCH_SIZE = 200
+DRAFT_CLEANUP_TIME_BUDGET = 120  # seconds per run
+DEFAULT_MAX_AGE_HOURS = 24
+
+
+def cleanup_stale_drafts():
+	"""
+	Scheduled task: delete POS Sales Invoice drafts untouched for a day.
+
+	Drafts of shifts that are still open are held carts the cashier may resume,
+	and are kept.
+	"""
+	return cleanup_draft_invoices(max_age_hours=DEFAULT_MAX_AGE_HOURS, skip_open_shifts=True)
+
+
+def enqueue_draft_cleanup(doctype="Sales Invoice", **filters):
+	"""
+	Queue a cleanup run for the given filters (see ``cleanup_draft_invoices``).
+
+	Runs for the same filters are deduplicated, and the job is only queued once
+	the current transaction commits.
+	"""
+	job_id = "pos_next_draft_cleanup::" + "::".join(
+		[doctype] + [f"{key}={value}" for key, value in sorted(filters.items()) if value]
+	)
+	frappe.enqueue(
+		"pos_next.tasks.draft_cleanup.cleanup_draft_invoices",
+		queue="long",
+		job_id=job_id,
+		deduplicate=True,
+		enqueue_after_commit=True,
+		doctype=doctype,
+		**filters,
+	)
+	return job_id
+
+
+def cleanup_draft_invoices(
+	doctype="Sales Invoice",
+	pos_profile=None,
+	pos_opening_shift=None,
+	max_age_hours=None,
+	unprinted_only=False,
+	skip_open_shifts=False,
+	batch_size=DRAFT_CLEANUP_BATCH_SIZE,
+	time_budget=DRAFT_CLEANUP_TIME_BUDGET,
+	run=0,
+):
+	"""
+	Delete draft invoices matching the filters in batches of ``batch_size``.
+
+	Returns counts of deleted and failed invoices, and whether the run finished
+	or was continued in a new job (numbered by ``run``) after ``time_budget``
+	seconds. With ``skip_open_shifts``, drafts of open POS Opening Shifts are
+	left alone.
+	"""
+	# Only drafts the POS created: back-office drafts are never touched
+	conditions = [
+		"docstatus = 0",
+		"is_pos = 1",
+		"IFNULL(pos_profile, '') != ''",
+		"IFNULL(posa_pos_opening_shift, '') != ''",
+	]
+	params = {}
+
+	if max_age_hours is not None:
+		conditions.append("modified < %(cutoff)s")
+		params["cutoff"] = now_datetime() - timedelta(hours=cint(max_age_hours))
+	if pos_profile:
+		conditions.append("pos_profile = %(pos_profile)s")
+		params["pos_profile"] = pos_profile
+	if pos_opening_shift:
+		conditions.append("posa_pos_opening_shift = %(pos_opening_shift)s")
+		params["pos_opening_shift"] = pos_opening_shift
+	if unprinted_only:
+		conditions.append("IFNULL(posa_is_printed, 0) = 0")
+	if skip_open_shifts:
+		conditions.append(
+			"""posa_pos_opening_shift NOT IN (
+				SELECT name FROM `tabPOS Opening Shift` WHERE status = 'Open' AND docstatus = 1
+			)"""
+		)
+
+	started = time.monotonic()
+	batch_size = cint(batch_size) or DRAFT_CLEANUP_BATCH_SIZE
+	result = {"deleted": 0, "failed": 0, "batches": 0, "complete": True}
+	# Drafts that could not be deleted (e.g. still linked) are not selected again
+	failed = []
+
+	while True:
+		selected, deleted = _delete_batch(doctype, conditions, params, batch_size, failed)
+		if not selected:
+			break
+
+		result["deleted"] += deleted
+		result["failed"] = len(failed)
+		result["batches"] += 1
+
+		if selected < batch_size:
+			break
+
+		if time.monotonic() - started >= time_budget:
+			result["complete"] = False
+			enqueue_draft_cleanup(
+				doctype,
+				pos_profile=pos_profile,
+				pos_opening_shift=pos_opening_shift,
+				max_age_hours=max_age_hours,
+				unprinted_only=unprinted_only,
+				skip_open_shifts=skip_open_shifts,
+				batch_size=batch_size,
+				time_budget=time_budget,
+				run=cint(run) + 1,
+			)
+			break
+
+	frappe.logger().info(
+		f"Draft cleanup ({doctype}): deleted {result['deleted']} invoice(s) in "
+		f"{result['batches']} batch(es), {result['failed']} failed"
+		+ ("" if result["complete"] else ", continuing in a new job")
+	)
+	return result
+
+
+def _delete_batch(doctype, conditions, params, batch_size, failed):
+	"""
+	Delete one batch of drafts and commit.
+
+	Names that fail to delete are appended to ``failed`` and excluded from
+	later batches. Returns (rows selected, invoices deleted).
+	"""
+	conditions = list(conditions)
+	params = dict(params)
+	if failed:
+		conditions.append("name NOT IN %(failed)s")
+		params["failed"] = tuple(failed)
+
+	try:
+		# Rows another session is editing are skipped rather than waited on
+		names = frappe.db.sql_list(
+			f"""
+			SELECT name FROM `tab{doctype}`
+			WHERE {" AND ".join(conditions)}
+			ORDER BY modified
+			LIMIT {batch_size}
+			FOR UPDATE SKIP LOCKED
+			""",
+			params,
+		)
+		if not names:
+			frappe.db.rollback()
+			return 0, 0
+
+		deleted = 0
+		for name in names:
+			savepoint = "pos_next_draft_cleanup"
+			frappe.db.savepoint(savepoint)
+			try:
+				frappe.delete_doc(doctype, name, ignore_permissions=True)
+				deleted += 1
+			except Exception:
+				frappe.db.rollback(save_point=savepoint)
+				failed.append(name)
+				frappe.log_error(
+					title="Draft Cleanup Error",
+					message=f"{doctype} {name}\n{frappe.get_traceback()}",
+				)
+
+		frappe.db.commit()
+		return len(names), deleted
+	except Exception:
+		frappe.db.rollback()
+		frappe.log_error(title="Draft Cleanup Error", message=frappe.get_traceback())
+		raise
@@ -25,6 +25,11 @@ def before_uninstall():
 		# Reset POS Profile configurations
 		reset_pos_profiles()
 
+		# Drop the item search index
+		remove_item_search_index()
+		remove_invoice_history_index()
+		remove_customer_search_indexes()
+
 		# Commit all changes
 		frappe.db.commit()
 
@@ -52,6 +57,7 @@ def remove_custom_fields():
 		custom_fields = [
 			"Sales Invoice-posa_pos_opening_shift",
 			"Sales Invoice-posa_is_printed",
+			"Sales Invoice-posa_idempotency_key",
 			# Note: Item-custom_company is shared with Nexus app
 			# Only remove if Nexus is not installed
 		]
@@ -195,6 +201,61 @@ def reset_pos_profiles():
 		)
 
 
+def remove_item_search_index():
+	"""
+	Drop the FULLTEXT index POS Next added to the Item table
+	"""
+	from pos_next.api.items import ITEM_SEARCH_INDEX
+
+	try:
+		if frappe.db.sql("SHOW INDEX FROM `tabItem` WHERE Key_name = %s", ITEM_SEARCH_INDEX):
+			frappe.db.sql_ddl(f"ALTER TABLE `tabItem` DROP INDEX `{ITEM_SEARCH_INDEX}`")
+			log_message("Removed item search index", level="info", indent=1)
+	except Exception as e:
+		log_message(f"Error removing item search index: {str(e)}", level="error")
+		frappe.log_error(
+			title="Item Search Index Removal Error",
+			message=frappe.get_traceback()
+		)
+
+
+def remove_invoice_history_index():
+	"""
+	Drop the invoice history index POS Next added to the Sales Invoice table
+	"""
+	from pos_next.api.invoices import INVOICE_HISTORY_INDEX
+
+	try:
+		if frappe.db.sql("SHOW INDEX FROM `tabSales Invoice` WHERE Key_name = %s", INVOICE_HISTORY_INDEX):
+			frappe.db.sql_ddl(f"ALTER TABLE `tabSales Invoice` DROP INDEX `{INVOICE_HISTORY_INDEX}`")
+			log_message("Removed invoice history index", level="info", indent=1)
+	except Exception as e:
+		log_message(f"Error removing invoice history index: {str(e)}", level="error")
+		frappe.log_error(
+			title="Invoice History Index Removal Error",
+			message=frappe.get_traceback()
+		)
+
+
+def remove_customer_search_indexes():
+	"""
+	Drop the Customer search indexes POS Next added for the return search
+	"""
+	from pos_next.api.invoices import CUSTOMER_SEARCH_INDEXES
+
+	try:
+		for index_name in CUSTOMER_SEARCH_INDEXES:
+			if frappe.db.sql("SHOW INDEX FROM `tabCustomer` WHERE Key_name = %s", index_name):
+				frappe.db.sql_ddl(f"ALTER TABLE `tabCustomer` DROP INDEX `{index_name}`")
+		log_message("Removed customer search indexes", level="info", indent=1)
+	except Exception as e:
+		log_message(f"Error removing customer search indexes: {str(e)}", level="error")
+		frappe.log_error(
+			title="Customer Search Index Removal Error",
+			message=frappe.get_traceback()
+		)
+
+
 def log_message(message, level="info", indent=0):
 	"""
 	Standardized logging function with consistent formatting